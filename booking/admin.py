@@ -1,6 +1,15 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.template.response import TemplateResponse
 from django.utils import timezone
-from .models import Cinema, Movie, Screen, Showtime, Seat, Booking, Payment, CancellationRequest, SeatBooking
+from . import events, metrics
+from .inventory import invalidate_screen, refresh_inventory
+from .forms import ScheduleShowtimesForm, ScreenAdminForm
+from .layouts import apply_layout
+from .models import Cinema, Movie, Screen, Showtime, Seat, Booking, Payment, CancellationRequest, SeatBooking, SeatArchive, Admission, BookingEvent, WaitlistEntry
+from .reservations import approve_cancellation
+from .scheduling import schedule_showtimes
 
 @admin.register(Cinema)
 class CinemaAdmin(admin.ModelAdmin):
@@ -12,11 +21,62 @@ class MovieAdmin(admin.ModelAdmin):
     list_display = ['title', 'genre', 'language', 'rating', 'release_date', 'is_now_showing']
     list_filter = ['is_now_showing', 'rating', 'genre', 'language']
     search_fields = ['title', 'description']
+    actions = ['schedule_recurring_showtimes']
+    
+    def schedule_recurring_showtimes(self, request, queryset):
+        """Generate weeks of showtimes for the selected movies in one go"""
+        if 'apply' in request.POST:
+            form = ScheduleShowtimesForm(request.POST)
+            if form.is_valid():
+                data = form.cleaned_data
+                created = conflicts = 0
+                for movie in queryset:
+                    result = schedule_showtimes(
+                        movie, data['screens'], data['start_date'], data['weeks'],
+                        data['slots'], data['price'], data['weekdays'],
+                    )
+                    created += len(result.showtimes)
+                    conflicts += len(result.conflicts)
+                self.message_user(request, f"{created} showtime(s) scheduled.")
+                if conflicts:
+                    self.message_user(
+                        request,
+                        f"{conflicts} slot(s) skipped because they overlap existing showtimes.",
+                        level=messages.WARNING,
+                    )
+                return None
+        else:
+            form = ScheduleShowtimesForm()
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Schedule recurring showtimes',
+            'form': form,
+            'movies': queryset,
+            'opts': self.model._meta,
+            'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/booking/movie/schedule_showtimes.html', context)
+    
+    schedule_recurring_showtimes.short_description = "Schedule recurring showtimes"
 
 @admin.register(Screen)
 class ScreenAdmin(admin.ModelAdmin):
+    form = ScreenAdminForm
     list_display = ['name', 'cinema', 'total_seats']
     list_filter = ['cinema']
+    readonly_fields = ['total_seats']
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        layout = form.cleaned_data.get('layout_spec')
+        if layout is not None:
+            try:
+                created = apply_layout(obj, layout)
+            except ValidationError as exc:
+                self.message_user(request, ' '.join(exc.messages), level=messages.ERROR)
+            else:
+                self.message_user(request, f"Generated {len(created)} seat(s) from the layout.")
 
 @admin.register(Showtime)
 class ShowtimeAdmin(admin.ModelAdmin):
@@ -28,6 +88,29 @@ class ShowtimeAdmin(admin.ModelAdmin):
 class SeatAdmin(admin.ModelAdmin):
     list_display = ['screen', 'row', 'number', 'seat_type']
     list_filter = ['screen', 'seat_type']
+    
+    # Hand-edited seats no longer match the generated layout, so drop it
+    # and recount instead of letting total_seats drift.
+    def _sync_screens(self, screens):
+        for screen in screens:
+            screen.layout = None
+            screen.save(update_fields=['layout'])
+            screen.refresh_total_seats()
+            invalidate_screen(screen.id)
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._sync_screens({obj.screen})
+    
+    def delete_model(self, request, obj):
+        screen = obj.screen
+        super().delete_model(request, obj)
+        self._sync_screens({screen})
+    
+    def delete_queryset(self, request, queryset):
+        screens = set(Screen.objects.filter(seats__in=queryset))
+        super().delete_queryset(request, queryset)
+        self._sync_screens(screens)
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -47,6 +130,61 @@ class SeatBookingAdmin(admin.ModelAdmin):
     list_display = ['showtime', 'seat', 'booking', 'is_booked']
     list_filter = ['is_booked', 'showtime']
     search_fields = ['booking__booking_reference', 'seat__row']
+    
+    # Keep the seats-together index in step with hand edits
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_inventory([obj.showtime_id])
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_inventory([obj.showtime_id])
+    
+    def delete_queryset(self, request, queryset):
+        showtime_ids = set(queryset.values_list('showtime_id', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_inventory(showtime_ids)
+
+@admin.register(SeatArchive)
+class SeatArchiveAdmin(admin.ModelAdmin):
+    list_display = ['showtime', 'sold_seats', 'archived_at']
+    readonly_fields = ['showtime', 'first_seat_id', 'sold_seats', 'archived_at']
+    exclude = ['bitmap', 'bookings']
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Admission)
+class AdmissionAdmin(admin.ModelAdmin):
+    list_display = ['booking', 'showtime', 'admitted_at', 'gate', 'source']
+    list_filter = ['source', 'admitted_at']
+    search_fields = ['booking__booking_reference']
+    list_select_related = ['booking__user', 'showtime__movie']
+    raw_id_fields = ['booking', 'showtime']
+    readonly_fields = ['recorded_at']
+
+@admin.register(BookingEvent)
+class BookingEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'booking_id', 'showtime_id', 'created_at']
+    list_filter = ['kind']
+    search_fields = ['=booking__id']
+    show_full_result_count = False
+    
+    # The log is append-only
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'showtime', 'seats', 'seat_type', 'status', 'created_at', 'offered_at']
+    list_filter = ['status', 'seat_type']
+    raw_id_fields = ['showtime', 'booking']
 
 @admin.register(CancellationRequest)
 class CancellationRequestAdmin(admin.ModelAdmin):
@@ -54,6 +192,8 @@ class CancellationRequestAdmin(admin.ModelAdmin):
     list_filter = ['status', 'request_date', 'refund_processed']
     search_fields = ['booking__booking_reference', 'booking__user__username', 'reason']
     readonly_fields = ['booking', 'reason', 'request_date']
+    # Skip the unfiltered COUNT(*) over the whole table on every changelist view
+    show_full_result_count = False
     
     fieldsets = (
         ('Request Information', {
@@ -74,64 +214,16 @@ class CancellationRequestAdmin(admin.ModelAdmin):
         count = 0
         total_seats_released = 0
         
-        for cancellation in queryset.filter(status='Pending'):
-            booking = cancellation.booking
-            
-            # Update cancellation request
-            cancellation.status = 'Approved'
-            cancellation.reviewed_by = request.user
-            cancellation.review_date = timezone.now()
-            cancellation.refund_amount = booking.total_amount
-            cancellation.save()
-            
-            # Update booking status
-            booking.status = 'Cancelled'
-            booking.save()
-            
-            # FIXED: Release seats - use booking reference directly
-            # Delete or set is_booked to False for all SeatBooking entries related to this booking
-            seat_bookings = SeatBooking.objects.filter(booking=booking)
-            
-            print(f"[ADMIN ACTION] Found {seat_bookings.count()} seat bookings for {booking.booking_reference}")
-            
-            # Method 1: Set is_booked to False and clear the booking reference
-            released = seat_bookings.update(is_booked=False, booking=None)
-            
-            # Alternative Method 2: Delete the SeatBooking entries entirely (uncomment if preferred)
-            # released = seat_bookings.count()
-            # seat_bookings.delete()
+        for cancellation in queryset.filter(status='Pending').select_related('booking'):
+            # Approves, cancels the booking, releases its seats and refunds it in one
+            # transaction; None if another admin got to this request first
+            released = approve_cancellation(cancellation, request.user)
+            if released is None:
+                continue
             
             total_seats_released += released
-            
-            # Debug output
-            print(f"[ADMIN ACTION] Approved cancellation for booking: {booking.booking_reference}")
-            print(f"[ADMIN ACTION] Released {released} seats for showtime: {booking.showtime}")
-            print(f"[ADMIN ACTION] Seat IDs released: {list(booking.seats.values_list('id', flat=True))}")
-            
-            # Verify seats are released
-            remaining_bookings = SeatBooking.objects.filter(
-                showtime=booking.showtime,
-                seat__in=booking.seats.all(),
-                is_booked=True
-            )
-            if remaining_bookings.exists():
-                print(f"[WARNING] Some seats still marked as booked: {list(remaining_bookings.values_list('seat_id', flat=True))}")
-            else:
-                print(f"[SUCCESS] All seats successfully released!")
-            
-            # Update payment status
-            try:
-                payment = booking.payment
-                payment.status = 'refunded'
-                payment.refund_date = timezone.now()
-                payment.refund_amount = booking.total_amount
-                payment.save()
-                cancellation.refund_processed = True
-                cancellation.save()
-            except Payment.DoesNotExist:
-                print(f"[ADMIN ACTION] No payment found for booking {booking.booking_reference}")
-                pass
-            
+            metrics.SEATS_RELEASED.labels(reason='cancellation').inc(released)
+            metrics.CANCELLATIONS.labels(outcome='approved').inc()
             count += 1
         
         message = f"✅ {count} cancellation(s) approved successfully. {total_seats_released} seat(s) released and available for booking."
@@ -142,14 +234,16 @@ class CancellationRequestAdmin(admin.ModelAdmin):
     def reject_cancellation(self, request, queryset):
         """Reject selected cancellation requests"""
         count = 0
-        for cancellation in queryset.filter(status='Pending'):
-            cancellation.status = 'Rejected'
-            cancellation.reviewed_by = request.user
-            cancellation.review_date = timezone.now()
-            cancellation.save()
+        for cancellation in queryset.filter(status='Pending').select_related('booking'):
+            with transaction.atomic():
+                rejected = CancellationRequest.objects.filter(id=cancellation.id, status='Pending').update(
+                    status='Rejected', reviewed_by=request.user, review_date=timezone.now(),
+                )
+                if not rejected:
+                    continue
+                events.record('cancellation.rejected', cancellation.booking, reviewer=request.user.get_username())
             count += 1
-            
-            print(f"[ADMIN ACTION] Rejected cancellation for booking: {cancellation.booking.booking_reference}")
+            metrics.CANCELLATIONS.labels(outcome='rejected').inc()
         
         self.message_user(request, f"❌ {count} cancellation(s) rejected.")
         
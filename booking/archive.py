@@ -0,0 +1,175 @@
+"""Compaction of SeatBooking rows for showtimes that have ended.
+
+Once a showtime is over its seat rows are only ever read, yet they stay in
+the table every seat-selection query goes through. compact_batch folds
+them into one SeatArchive per showtime (a bitmap of the sold seats plus a
+compressed seat-to-booking map) and deletes the hot rows. Bookings that
+were never paid are cancelled and their seats released on the way, as
+their hold can no longer turn into a sale.
+
+Readers go through booked_seat_ids and release_booking_seats, which look
+at both the hot rows and the archive. Booking.seats is left alone, so
+confirmations, tickets and booking history read archived bookings as before.
+"""
+import json
+import zlib
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.utils import timezone
+
+from . import events, metrics
+from .inventory import lock_showtimes, refresh_inventory
+from .models import Booking, BookingEvent, SeatArchive, SeatBooking, Showtime, WaitlistEntry
+
+
+def pack_bitmap(first_seat_id, seat_ids):
+    bits = bytearray()
+    for seat_id in seat_ids:
+        offset = seat_id - first_seat_id
+        if offset // 8 >= len(bits):
+            bits.extend(bytes(offset // 8 + 1 - len(bits)))
+        bits[offset // 8] |= 1 << (offset % 8)
+    return bytes(bits)
+
+
+def unpack_bitmap(first_seat_id, bitmap):
+    seat_ids = set()
+    for index, byte in enumerate(bytes(bitmap)):
+        while byte:
+            low = byte & -byte
+            seat_ids.add(first_seat_id + index * 8 + low.bit_length() - 1)
+            byte ^= low
+    return seat_ids
+
+
+def pack_bookings(first_seat_id, seat_bookings):
+    by_booking = {}
+    for seat_id, booking_id in seat_bookings.items():
+        by_booking.setdefault(booking_id, []).append(seat_id - first_seat_id)
+    payload = {str(booking_id): sorted(offsets) for booking_id, offsets in by_booking.items()}
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode())
+
+
+def unpack_bookings(first_seat_id, blob):
+    payload = json.loads(zlib.decompress(bytes(blob)))
+    return {
+        first_seat_id + offset: int(booking_id)
+        for booking_id, offsets in payload.items()
+        for offset in offsets
+    }
+
+
+def build_archive(showtime_id, seat_bookings, archive=None):
+    """Write ``seat_bookings`` ({seat id: booking id}) into a new or existing archive"""
+    archive = archive or SeatArchive(showtime_id=showtime_id)
+    first_seat_id = min(seat_bookings, default=0)
+    archive.first_seat_id = first_seat_id
+    archive.bitmap = pack_bitmap(first_seat_id, seat_bookings)
+    archive.bookings = pack_bookings(first_seat_id, seat_bookings)
+    archive.sold_seats = len(seat_bookings)
+    # bulk_update skips auto_now
+    archive.archived_at = timezone.now()
+    return archive
+
+
+def booked_seat_ids(showtime):
+    """IDs of the seats of a showtime that are held or sold, archived or not"""
+    booked = set(
+        SeatBooking.objects.filter(showtime=showtime, is_booked=True).values_list('seat_id', flat=True)
+    )
+    # Only showtimes that have ended can have been archived
+    if showtime.end_time <= timezone.now():
+        archive = SeatArchive.objects.filter(showtime_id=showtime.id).first()
+        if archive is not None:
+            booked |= archive.booked_seat_ids()
+    return booked
+
+
+def archived_sold_seats():
+    return SeatArchive.objects.aggregate(total=Sum('sold_seats'))['total'] or 0
+
+
+@transaction.atomic
+def release_booking_seats(booking, reason='cancellation'):
+    """Return a booking's seats to sale; returns how many were released"""
+    lock_showtimes([booking.showtime_id])
+    released = SeatBooking.objects.filter(booking=booking).update(is_booked=False, booking=None)
+    archive = SeatArchive.objects.select_for_update().filter(showtime_id=booking.showtime_id).first()
+    if archive is not None:
+        seat_bookings = archive.seat_bookings()
+        kept = {seat_id: booking_id for seat_id, booking_id in seat_bookings.items() if booking_id != booking.id}
+        if len(kept) != len(seat_bookings):
+            build_archive(booking.showtime_id, kept, archive).save()
+            released += len(seat_bookings) - len(kept)
+    if released:
+        refresh_inventory([booking.showtime_id])
+        events.record('seats.released', booking, count=released, reason=reason)
+    return released
+
+
+def showtimes_to_compact(cutoff):
+    """Showtimes that ended before ``cutoff`` and still have hot seat rows"""
+    return (
+        Showtime.objects.filter(end_time__lt=cutoff)
+        .filter(Exists(SeatBooking.objects.filter(showtime=OuterRef('pk'))))
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+
+@transaction.atomic
+def compact_batch(showtime_ids):
+    """Archive and delete the seat rows of these showtimes; returns (archives, rows)"""
+    lock_showtimes(showtime_ids)
+    # Cancelled the way expire_hold cancels a hold, before the seat rows are read
+    unpaid = dict(
+        Booking.objects.select_for_update()
+        .filter(showtime_id__in=showtime_ids, status='Pending')
+        .values_list('id', 'showtime_id')
+    )
+    if unpaid:
+        Booking.objects.filter(id__in=unpaid).update(status='Cancelled')
+        WaitlistEntry.objects.filter(booking_id__in=unpaid, status='Offered').update(status='Expired')
+        BookingEvent.objects.bulk_create([
+            events.event('booking.expired', booking_id, showtime_id) for booking_id, showtime_id in unpaid.items()
+        ])
+    rows = (
+        SeatBooking.objects.filter(showtime_id__in=showtime_ids)
+        .values_list('showtime_id', 'seat_id', 'booking_id', 'is_booked', 'booking__status')
+    )
+    sold = {showtime_id: {} for showtime_id in showtime_ids}
+    expired = Counter()
+    count = 0
+    for showtime_id, seat_id, booking_id, is_booked, status in rows:
+        count += 1
+        if not is_booked or booking_id is None:
+            continue
+        if status == 'Confirmed':
+            sold[showtime_id][seat_id] = booking_id
+        else:
+            expired[showtime_id, booking_id] += 1
+
+    existing = SeatArchive.objects.select_for_update().in_bulk(showtime_ids)
+    created, updated = [], []
+    for showtime_id, seat_bookings in sold.items():
+        archive = existing.get(showtime_id)
+        if archive is not None:
+            # Rows written after an earlier compaction are merged in
+            build_archive(showtime_id, {**archive.seat_bookings(), **seat_bookings}, archive)
+            updated.append(archive)
+        elif seat_bookings:
+            created.append(build_archive(showtime_id, seat_bookings))
+    SeatArchive.objects.bulk_create(created)
+    SeatArchive.objects.bulk_update(updated, ['first_seat_id', 'bitmap', 'bookings', 'sold_seats', 'archived_at'])
+    SeatBooking.objects.filter(showtime_id__in=showtime_ids).delete()
+    if expired:
+        metrics.SEATS_RELEASED.labels(reason='expired').inc(sum(expired.values()))
+        refresh_inventory(showtime_ids)
+        BookingEvent.objects.bulk_create([
+            events.event('seats.released', booking_id, showtime_id, count=count, reason='expired')
+            for (showtime_id, booking_id), count in expired.items()
+        ])
+    return len(created) + len(updated), count
+
@@ -0,0 +1,153 @@
+"""Static assets: hashed, precompressed files served with far-future caching.
+
+``collectstatic`` with CompressedManifestStaticFilesStorage writes every
+file under a content-hashed name (``base.3f2a9c1e7b44.css``) plus ``.gz``
+and, when the ``brotli`` package is installed, ``.br`` variants next to it.
+StaticAssetMiddleware serves STATIC_ROOT when SERVE_STATIC is on, picking
+the smallest variant the client accepts. Hashed names never change content,
+so they are cached for a year; unhashed names only briefly.
+"""
+import gzip
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml')
+# Below this the compressed file saves less than a network round trip
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT_LIVED = 'public, max-age=60'
+
+
+def _encodings():
+    encodings = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encodings.insert(0, ('.br', lambda data: brotli.compress(data, quality=11)))
+    return encodings
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes precompressed copies of text assets"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = []
+        for name, hashed_name, result in super().post_process(paths, dry_run, **options):
+            processed.append((name, hashed_name))
+            yield name, hashed_name, result
+        if dry_run:
+            return
+        for name, hashed_name in processed:
+            for path in {name, hashed_name}:
+                if isinstance(path, str) and path.endswith(COMPRESSIBLE):
+                    self.compress(path)
+
+    def compress(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, compress in _encodings():
+            compressed = compress(data)
+            # Not worth a second lookup when it barely shrinks
+            if len(compressed) < len(data) * 0.95:
+                with open(self.path(name + suffix), 'wb') as f:
+                    f.write(compressed)
+
+
+def _accepted(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        if params.replace(' ', '').lower().startswith('q=') and not params.strip()[2:].strip('0.'):
+            continue  # q=0 means "not acceptable"
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticAssetMiddleware:
+    """Serve STATIC_ROOT without a web server in front, as whitenoise does"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self._hashed = None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def hashed_names(self):
+        if self._hashed is None:
+            hashed_files = getattr(staticfiles_storage, 'hashed_files', {})
+            self._hashed = set(hashed_files.values())
+        return self._hashed
+
+    def resolve(self, path):
+        name = path[len(self.prefix):]
+        root = os.path.realpath(settings.STATIC_ROOT)
+        full = os.path.realpath(os.path.join(root, name))
+        if not full.startswith(root + os.sep) or not os.path.isfile(full):
+            return None, None
+        return name, full
+
+    def wants(self, request):
+        return settings.SERVE_STATIC and request.path.startswith(self.prefix) and request.method in ('GET', 'HEAD')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.wants(request):
+            return self.get_response(request)
+        name, full = self.resolve(request.path)
+        if full is None:
+            return self.get_response(request)
+        return self.serve(request, name, full)
+
+    async def __acall__(self, request):
+        if not self.wants(request):
+            return await self.get_response(request)
+        # stat() and open() stay off the event loop
+        name, full = await sync_to_async(self.resolve, thread_sensitive=False)(request.path)
+        if full is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.serve, thread_sensitive=False)(request, name, full)
+
+    def serve(self, request, name, full):
+        content_type, _ = mimetypes.guess_type(full)
+        accepted = _accepted(request)
+        path, encoding = full, None
+        for suffix, coding in (('.br', 'br'), ('.gz', 'gzip')):
+            if coding in accepted and os.path.isfile(full + suffix):
+                path, encoding = full + suffix, coding
+                break
+
+        stat = os.stat(path)
+        etag = f'"{int(stat.st_mtime)}-{stat.st_size}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+            response['Content-Length'] = stat.st_size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Vary'] = 'Accept-Encoding'
+        if name in self.hashed_names():
+            response['Cache-Control'] = IMMUTABLE
+        else:
+            response['Cache-Control'] = SHORT_LIVED
+        return response
@@ -0,0 +1,48 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db.models.functions import Lower
+
+from .throttle import LoginThrottle
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def users_with_email(email):
+    """Case-insensitive email lookup served by the LOWER(email) index"""
+    return User._default_manager.alias(email_lower=Lower('email')).filter(email_lower=normalize_email(email))
+
+
+class EmailBackend(ModelBackend):
+    """Authenticate with email and password in a single lookup-and-verify step.
+
+    Attempts are throttled per client IP and per account before the user is
+    looked up, so bursts of guesses never reach the password hasher. A
+    throttled request is marked with ``request.login_throttled``.
+    """
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        email = normalize_email(email)
+        throttle = LoginThrottle()
+
+        if request is not None and not throttle.allow(request, email):
+            request.login_throttled = True
+            # Stops authenticate() from trying the remaining backends
+            raise PermissionDenied
+
+        try:
+            user = users_with_email(email).get()
+        except User.DoesNotExist:
+            # Run the hasher once anyway so response time doesn't reveal
+            # whether the email is registered (as ModelBackend does).
+            User().set_password(password)
+            return None
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            throttle.succeeded(email)
+            return user
+        return None
@@ -0,0 +1,218 @@
+"""Building blocks for the catalog benchmark (see the benchmark_catalog command).
+
+Drives the read-only catalog pages through the project's WSGI and ASGI
+applications in-process, the way one worker of each kind would serve
+them: a WSGI worker handles as many requests at once as it has threads,
+an ASGI worker interleaves any number of them on one event loop. No HTTP
+server is involved, so the numbers compare the two request paths (handler,
+middleware, views and queries) rather than a particular server.
+
+SimulatedLatency adds a fixed delay to every query, standing in for the
+network round trip to a database server that a local SQLite file lacks;
+that is where concurrent queries and an event loop pay off.
+"""
+import asyncio
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from django.utils import timezone
+
+from .loadtest import percentile
+from .models import Movie, Showtime
+
+HOST = '127.0.0.1'
+
+
+class SimulatedLatency:
+    """execute_wrapper that sleeps before every query, on every connection"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        if self.seconds:
+            for connection in connections.all():
+                self.install(connection=connection)
+            connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, *exc):
+        # Connections opened by worker threads keep the wrapper until they close
+        connection_created.disconnect(self.install)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def catalog_paths():
+    """One URL per catalog endpoint, for the movie with the most showtimes"""
+    movie = Movie.objects.filter(is_now_showing=True).order_by('id').first()
+    showtime = Showtime.objects.filter(movie=movie).order_by('start_time').first()
+    day = timezone.localtime(showtime.start_time).date().isoformat()
+    return {
+        'home': reverse('home'),
+        'movies': reverse('movies'),
+        'movie_detail': f"{reverse('movie_detail', args=[movie.id])}?date={day}",
+        'availability': f"{reverse('availability')}?date={day}",
+    }
+
+
+class Tally:
+    """Latencies per endpoint and the most requests seen in flight at once"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        return time.perf_counter()
+
+    def finished(self, endpoint, started, status):
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.in_flight -= 1
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if status != 200:
+                self.errors += 1
+
+    def summary(self, duration):
+        everything = sorted(value for values in self.latencies.values() for value in values)
+        return {
+            'requests': len(everything),
+            'errors': self.errors,
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(len(everything) / duration, 2),
+            'p50_ms': round(percentile(everything, 50) * 1000, 2),
+            'p95_ms': round(percentile(everything, 95) * 1000, 2),
+            'p99_ms': round(percentile(everything, 99) * 1000, 2),
+            'peak_in_flight': self.peak,
+            'endpoints': {
+                endpoint: round(percentile(sorted(values), 50) * 1000, 2)
+                for endpoint, values in sorted(self.latencies.items())
+            },
+        }
+
+
+def _schedule(paths, requests):
+    endpoints = list(paths.items())
+    return [endpoints[i % len(endpoints)] for i in range(requests)]
+
+
+def run_wsgi(paths, requests, threads):
+    """Serve ``requests`` catalog requests through WSGI with ``threads`` worker threads"""
+    application = get_wsgi_application()
+    tally = Tally()
+
+    def call(endpoint, url):
+        url = urlsplit(url)
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': HOST,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': HOST,
+            'HTTP_HOST': HOST,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        started = tally.started()
+        response = application(environ, lambda line, headers, exc_info=None: status.append(int(line[:3])))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        tally.finished(endpoint, started, status[0])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(call, endpoint, url) for endpoint, url in _schedule(paths, requests)]:
+            future.result()
+    return tally.summary(time.perf_counter() - started)
+
+
+def run_asgi(paths, requests, concurrency):
+    """Serve ``requests`` catalog requests through ASGI, ``concurrency`` at a time on one event loop"""
+    application = get_asgi_application()
+    tally = Tally()
+
+    async def call(endpoint, url):
+        url = urlsplit(url)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': [(b'host', HOST.encode())],
+            'client': (HOST, 0),
+            'server': (HOST, 80),
+        }
+        sent = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The handler listens for a disconnect until the response is sent
+            await sent.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                sent.set()
+
+        started = tally.started()
+        await application(scope, receive, send)
+        tally.finished(endpoint, started, status[0])
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def limited(endpoint, url):
+            async with slots:
+                await call(endpoint, url)
+
+        await asyncio.gather(*(limited(endpoint, url) for endpoint, url in _schedule(paths, requests)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return tally.summary(time.perf_counter() - started)
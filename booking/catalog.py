@@ -0,0 +1,44 @@
+"""The data behind the movie detail page, cached per movie, day and cinema.
+
+Everyone looking at a movie on the same day sees the same showtimes, so
+movie_detail reads its movie, showtimes and cinemas from the cache and
+only queries on a miss. Entries live for MOVIE_DETAIL_CACHE_SECONDS; the
+page shows showtimes, not seats left, so that staleness only delays newly
+scheduled showtimes. warm_showtimes fills the entries ahead of a release.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Cinema, Movie, Showtime
+
+
+def movie_detail_key(movie_id, day, cinema_id=None):
+    return f'movie-detail:{movie_id}:{day:%Y-%m-%d}:{cinema_id or ""}'
+
+
+def day_bounds(day):
+    """Start and end of a local day, as a range the (movie, start_time) index covers"""
+    day_start = timezone.make_aware(datetime.combine(day, time.min))
+    return day_start, day_start + timedelta(days=1)
+
+
+def movie_detail_querysets(movie_id, day, cinema_id=None):
+    """The movie, its showtimes on ``day`` and the cinemas showing it"""
+    day_start, day_end = day_bounds(day)
+    showtimes = Showtime.objects.filter(
+        movie_id=movie_id,
+        start_time__gte=day_start,
+        start_time__lt=day_end
+    ).select_related('screen__cinema')
+    if cinema_id:
+        showtimes = showtimes.filter(screen__cinema_id=cinema_id)
+    cinemas = Cinema.objects.filter(screens__showtimes__movie_id=movie_id).distinct()
+    return Movie.objects.filter(id=movie_id), showtimes, cinemas
+
+
+def movie_detail_payload(movie, showtimes, cinemas):
+    """Cache entry from the evaluated querysets; None if the movie does not exist"""
+    if not movie:
+        return None
+    return {'movie': movie[0], 'showtimes': showtimes, 'cinemas': cinemas}
@@ -0,0 +1,199 @@
+"""Ticket check-in at the door, online and offline.
+
+Online, the scanner posts the ticket code (or the booking reference typed
+in by hand) to the check-in API and admit() answers from one indexed
+lookup of the reference plus an insert into Admission. The Admission
+primary key is the booking, so a ticket shown twice is let in only once
+however the scans race.
+
+For doors with poor connectivity, export_checkin_snapshot writes one
+signed snapshot per showtime: the sorted references of its confirmed
+bookings with their seats and those already admitted. A scanner loads it
+with Snapshot.load, answers lookups by binary search without the network,
+and keeps its own admissions. Those are written as JSON Lines and
+reconciled afterwards with ``import_file admissions`` (AdmissionImporter),
+which reports tickets let in twice or no longer valid.
+
+Snapshots are signed with CHECKIN_SNAPSHOT_KEY, which scanners need to
+verify them; it is separate from SECRET_KEY so a lost scanner cannot
+forge ticket codes.
+"""
+import json
+from bisect import bisect_left
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from . import tickets
+from .models import Admission, Booking, Seat
+
+SNAPSHOT_SALT = 'booking.checkin.snapshot'
+SNAPSHOT_VERSION = 1
+
+ADMITTED = 'admitted'
+ALREADY_ADMITTED = 'already_admitted'
+UNKNOWN = 'unknown'
+NOT_CONFIRMED = 'not_confirmed'
+WRONG_SHOWTIME = 'wrong_showtime'
+
+
+@dataclass
+class CheckinResult:
+    status: str
+    reference: str
+    showtime: int = None
+    seats: list = field(default_factory=list)
+    admitted_at: object = None
+    gate: str = ''
+
+    @property
+    def ok(self):
+        return self.status == ADMITTED
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'reference': self.reference,
+            'showtime': self.showtime,
+            'seats': self.seats,
+            'admitted_at': self.admitted_at.isoformat() if self.admitted_at else None,
+            'gate': self.gate,
+        }
+
+
+def reference_from_code(code):
+    """The booking reference in a scanned ticket code; raises signing.BadSignature"""
+    return tickets.read_token(code)['ref']
+
+
+def seat_labels(booking_id):
+    return [f'{row}{number}' for row, number in Seat.objects.filter(booking=booking_id).order_by('row', 'number').values_list('row', 'number')]
+
+
+def admit(reference, showtime_id=None, gate=''):
+    """Let the ticket in if it is valid and not used yet; returns a CheckinResult.
+
+    ``showtime_id`` is the showtime the door is admitting for, if any.
+    """
+    found = (
+        Booking.objects.filter(booking_reference=reference)
+        .values_list('id', 'showtime_id', 'status')
+        .first()
+    )
+    if found is None:
+        return CheckinResult(UNKNOWN, reference)
+    booking_id, booking_showtime, status = found
+    result = CheckinResult(ADMITTED, reference, booking_showtime, seat_labels(booking_id))
+    if status != 'Confirmed':
+        result.status = NOT_CONFIRMED
+        return result
+    if showtime_id is not None and showtime_id != booking_showtime:
+        result.status = WRONG_SHOWTIME
+        return result
+
+    # The insert is the admission; a concurrent scan of the same ticket gets the existing row
+    admission, created = Admission.objects.get_or_create(
+        booking_id=booking_id,
+        defaults={'showtime_id': booking_showtime, 'admitted_at': timezone.now(), 'gate': gate},
+    )
+    if not created:
+        result.status = ALREADY_ADMITTED
+    result.admitted_at = admission.admitted_at
+    result.gate = admission.gate
+    return result
+
+
+def _signer():
+    return signing.Signer(key=settings.CHECKIN_SNAPSHOT_KEY, salt=SNAPSHOT_SALT)
+
+
+def snapshot_payload(showtime):
+    """Confirmed bookings of a showtime, sorted by reference, as parallel lists"""
+    rows = sorted(
+        Booking.objects.filter(showtime=showtime, status='Confirmed')
+        .values_list('booking_reference', 'id', 'admission__admitted_at')
+    )
+    seats = {}
+    for booking_id, row, number in (
+        Booking.seats.through.objects.filter(booking__in=[booking_id for _, booking_id, _ in rows])
+        .order_by('seat__row', 'seat__number')
+        .values_list('booking_id', 'seat__row', 'seat__number')
+    ):
+        seats.setdefault(booking_id, []).append(f'{row}{number}')
+    return {
+        'v': SNAPSHOT_VERSION,
+        'showtime': showtime.id,
+        'start': showtime.start_time.isoformat(),
+        'generated': timezone.now().isoformat(),
+        'refs': [reference for reference, _, _ in rows],
+        'seats': [' '.join(seats.get(booking_id, [])) for _, booking_id, _ in rows],
+        # Positions in refs of the tickets already let in online
+        'admitted': [index for index, (_, _, admitted_at) in enumerate(rows) if admitted_at],
+    }
+
+
+def dump_snapshot(showtime):
+    """The signed snapshot file contents of a showtime"""
+    return _signer().sign_object(snapshot_payload(showtime), compress=True)
+
+
+class Snapshot:
+    """A showtime's valid tickets for a scanner without network access"""
+
+    def __init__(self, payload):
+        if payload.get('v') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {payload.get('v')}")
+        self.showtime = payload['showtime']
+        self.start = payload['start']
+        self.generated = payload['generated']
+        self.refs = payload['refs']
+        self.seats = payload['seats']
+        self.admitted = set(payload['admitted'])
+        # Admissions made on this scanner, for reconciliation
+        self.scans = []
+
+    @classmethod
+    def loads(cls, data):
+        """Verify and parse snapshot contents; raises signing.BadSignature if tampered with"""
+        return cls(_signer().unsign_object(data.strip()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='ascii') as source:
+            return cls.loads(source.read())
+
+    def __len__(self):
+        return len(self.refs)
+
+    def index(self, reference):
+        position = bisect_left(self.refs, reference)
+        if position < len(self.refs) and self.refs[position] == reference:
+            return position
+        return None
+
+    def admit(self, reference, gate='', now=None):
+        """Offline counterpart of admit(); returns a CheckinResult"""
+        position = self.index(reference)
+        if position is None:
+            # Unknown here: never confirmed, cancelled or for another showtime
+            return CheckinResult(UNKNOWN, reference, self.showtime)
+        result = CheckinResult(ADMITTED, reference, self.showtime, self.seats[position].split(), gate=gate)
+        if position in self.admitted:
+            result.status = ALREADY_ADMITTED
+            return result
+        self.admitted.add(position)
+        result.admitted_at = now or timezone.now()
+        self.scans.append(result)
+        return result
+
+    def write_scans(self, stream):
+        """Write this scanner's admissions as JSON Lines for ``import_file admissions``"""
+        for scan in self.scans:
+            stream.write(json.dumps({
+                'reference': scan.reference,
+                'showtime': scan.showtime,
+                'admitted_at': scan.admitted_at.isoformat(),
+                'gate': scan.gate,
+            }) + '\n')
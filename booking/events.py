@@ -0,0 +1,104 @@
+"""Transactional outbox of booking state changes.
+
+Every change to a booking, payment, cancellation request or seat hold
+appends a BookingEvent through record() inside the transaction making the
+change, so an event is visible exactly when its change is committed and
+never for one that was rolled back. Consumers (analytics, cache
+invalidation, notifications) follow the log by event ID instead of
+re-scanning the source tables:
+
+    from booking import events
+    events.consume('analytics', handle_batch)
+
+consume() hands the events after the consumer's cursor to the handler in
+ID order and advances the cursor once the handler returns, so every event
+is delivered at least once; handlers should tolerate seeing a batch again
+after a crash. The tail_events command prints the log as it grows.
+
+IDs are allocated when a transaction inserts its event, not when it
+commits, so on PostgreSQL a smaller ID can become visible after a larger
+one. read_events stops before such a gap until the event after it is
+OUTBOX_SETTLE_SECONDS old; older gaps are IDs of rolled back transactions.
+
+Kinds and their data:
+
+    booking.held            seat_ids, amount
+    booking.confirmed
+    booking.cancelled
+    booking.expired         (a hold not paid in time)
+    booking.imported        seat_ids, amount, status
+    payment.completed       method, amount, transaction_id
+    payment.refunded        amount
+    cancellation.requested  reason
+    cancellation.approved   reviewer, refund_amount
+    cancellation.rejected   reviewer
+    seats.released          count, reason (cancellation, expired or cleanup)
+    waitlist.joined         entry, user, seats, seat_type
+    waitlist.offered        entry, user, seats, expires_at
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, BookingEvent, EventCursor
+
+KINDS = (
+    'booking.held', 'booking.confirmed', 'booking.cancelled', 'booking.expired', 'booking.imported',
+    'payment.completed', 'payment.refunded',
+    'cancellation.requested', 'cancellation.approved', 'cancellation.rejected',
+    'seats.released',
+    'waitlist.joined', 'waitlist.offered',
+)
+
+
+def event(kind, booking=None, showtime_id=None, **data):
+    """An unsaved event about ``booking`` (a Booking or its ID); see record()"""
+    if kind not in KINDS:
+        raise ValueError(f'Unknown event kind {kind!r}')
+    if isinstance(booking, Booking):
+        showtime_id = showtime_id or booking.showtime_id
+        booking = booking.id
+    return BookingEvent(kind=kind, booking_id=booking, showtime_id=showtime_id, data=data)
+
+
+def record(kind, booking=None, showtime_id=None, **data):
+    """Append an event; must run in the transaction of the change it describes"""
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError('Booking events must be recorded inside the transaction making the change')
+    instance = event(kind, booking, showtime_id, **data)
+    instance.save()
+    return instance
+
+
+def read_events(after=0, limit=500):
+    """Committed events with an ID above ``after``, in ID order, up to the first unsettled gap"""
+    candidates = list(BookingEvent.objects.filter(id__gt=after).order_by('id')[:limit])
+    settle = timezone.now() - timedelta(seconds=settings.OUTBOX_SETTLE_SECONDS)
+    events = []
+    expected = after + 1
+    for candidate in candidates:
+        if candidate.id != expected and candidate.created_at > settle:
+            # The missing IDs may belong to transactions still in flight
+            break
+        events.append(candidate)
+        expected = candidate.id + 1
+    return events
+
+
+def position(name):
+    cursor = EventCursor.objects.filter(name=name).values_list('position', flat=True).first()
+    return cursor or 0
+
+
+def consume(name, handler, limit=500):
+    """Pass the next events of consumer ``name`` to handler(events) and advance its cursor.
+
+    Returns how many events were handled; 0 when the consumer is up to date.
+    """
+    events = read_events(position(name), limit)
+    if events:
+        handler(events)
+        EventCursor.objects.update_or_create(name=name, defaults={'position': events[-1].id})
+    return len(events)
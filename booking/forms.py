@@ -1,6 +1,11 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from datetime import datetime
+
+from .backends import users_with_email
+from .layouts import parse_layout
+from .models import Screen, Seat
 
 class SignUpForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={
@@ -30,6 +35,12 @@ class SignUpForm(UserCreationForm):
             }),
         }
     
+    def clean_email(self):
+        email = self.cleaned_data['email']
+        if users_with_email(email).exists():
+            raise forms.ValidationError('An account with this email already exists.')
+        return email
+    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['password1'].widget.attrs.update({
@@ -49,4 +60,75 @@ class LoginForm(forms.Form):
     password = forms.CharField(widget=forms.PasswordInput(attrs={
         'class': 'form-control',
         'placeholder': 'Enter your password'
-    }))
\ No newline at end of file
+    }))
+
+class ScheduleShowtimesForm(forms.Form):
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+        (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday'),
+    ]
+    
+    screens = forms.ModelMultipleChoiceField(queryset=Screen.objects.select_related('cinema'))
+    start_date = forms.DateField(help_text="First day of the schedule (YYYY-MM-DD)")
+    weeks = forms.IntegerField(min_value=1, max_value=12, initial=4)
+    slots = forms.CharField(help_text="Daily start times, comma separated, e.g. 10:00, 13:30, 19:00")
+    price = forms.DecimalField(max_digits=6, decimal_places=2)
+    weekdays = forms.TypedMultipleChoiceField(
+        choices=WEEKDAY_CHOICES, coerce=int, required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text="Leave empty to schedule every day",
+    )
+    
+    def clean_slots(self):
+        slots = []
+        for value in self.cleaned_data['slots'].split(','):
+            value = value.strip()
+            if not value:
+                continue
+            try:
+                slots.append(datetime.strptime(value, '%H:%M').time())
+            except ValueError:
+                raise forms.ValidationError(f"'{value}' is not a valid HH:MM time.")
+        if not slots:
+            raise forms.ValidationError('Enter at least one start time.')
+        return sorted(set(slots))
+
+
+class ScreenAdminForm(forms.ModelForm):
+    layout_spec = forms.CharField(
+        label="Layout", required=False,
+        widget=forms.Textarea(attrs={'rows': 10, 'cols': 60, 'style': 'font-family: monospace'}),
+        help_text="Either shorthand (rows: A-J / seats: 12 / aisles: 4, 8 / gaps: A1 / VIP: A-B / Premium: C-E) "
+                  "or one grid line per row (A: RRRR|RRRR, with P/V for Premium/VIP and . for no seat). "
+                  "Saving a layout regenerates all seats of the screen.",
+    )
+    
+    class Meta:
+        model = Screen
+        fields = ('cinema', 'name')
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        layout = self.instance.get_layout() if self.instance.pk else None
+        if layout is not None:
+            self.fields['layout_spec'].initial = layout.to_text()
+    
+    def clean_layout_spec(self):
+        text = self.cleaned_data['layout_spec'].strip()
+        if not text:
+            return None
+        layout = parse_layout(text)
+        current = self.instance.get_layout() if self.instance.pk else None
+        if current is not None and current.rows == layout.rows:
+            return None
+        return layout
+
+class WaitlistForm(forms.Form):
+    seats = forms.IntegerField(min_value=1, max_value=10, initial=2)
+    seat_type = forms.ChoiceField(choices=[('', 'Any seat type')] + Seat.SEAT_TYPE_CHOICES, required=False)
+
+class SeatsTogetherForm(forms.Form):
+    party_size = forms.IntegerField(min_value=1, max_value=20, initial=2)
+    seat_type = forms.ChoiceField(choices=[('', 'Any seat type')] + Seat.SEAT_TYPE_CHOICES, required=False)
+    area = forms.CharField(required=False, max_length=200)
+    date = forms.DateField(required=False)
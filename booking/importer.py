@@ -0,0 +1,551 @@
+"""Streaming bulk import of distributor schedules and partner bookings.
+
+Files are CSV (with a header row) or JSON Lines, read one row at a time and
+processed in batches of ``batch_size`` rows, each written in its own
+transaction. Memory use depends on the batch size, not on the file:
+
+- movies, cinemas and screens are loaded once into lookup tables;
+- showtimes, users, existing references and booked seats are looked up
+  per batch with one query each;
+- seat maps are kept for the most recently used screens only.
+
+Rows that fail validation go to a reject file in the input's format, with
+the original fields plus an ``error`` column, so it can be fixed and fed
+back in. A batch that still hits a database constraint is retried row by
+row so only the offending rows are rejected.
+
+Schedule rows::
+
+    movie,cinema,screen,start_time,price[,end_time]
+
+``movie`` is an ID or an exact title, ``cinema`` an ID or name, ``screen``
+the screen's name in that cinema, ``start_time`` an ISO date-time (local
+time unless it has an offset). end_time defaults to start plus the movie's
+duration. Overlaps, including cleaning time, with existing showtimes and
+with earlier rows of the file are rejected.
+
+Booking rows::
+
+    reference,showtime,seats,email[,status][,payment_method][,amount]
+
+``seats`` is a list of labels such as ``A1 A2`` (space, ``;`` or ``|``
+separated, or a JSON list). ``status`` is Confirmed (default) or Pending;
+confirmed bookings get a completed Payment. Customers are matched by
+email; unknown customers get an account without a usable password.
+
+Admission rows, the offline scans of booking.checkin snapshots::
+
+    reference,admitted_at[,showtime][,gate]
+
+Tickets already admitted, scanned twice in the file, no longer confirmed
+or for another showtime than ``showtime`` are rejected, so the reject
+file lists the conflicts to look into.
+"""
+import csv
+import json
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from . import events
+from .inventory import lock_showtimes, refresh_inventory
+from .models import Admission, Booking, BookingEvent, Cinema, Movie, Payment, Screen, Seat, SeatBooking, Showtime
+from .scheduling import build_screen_index, cleaning_buffer
+
+FORMATS = ('csv', 'jsonl')
+SEAT_LABEL = re.compile(r'^([A-Z]{1,2})(\d+)$')
+SEAT_SEPARATORS = re.compile(r'[\s;|,]+')
+# Screens whose seat maps a BookingImporter keeps in memory
+SEAT_MAP_LIMIT = 256
+
+
+class RowError(Exception):
+    """A row that cannot be imported; the message goes to the reject file"""
+
+
+def detect_format(path):
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict or None, error) from a CSV or JSONL stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Columns added to reject files, so fixed rows can be fed back in
+            row.pop('line', None)
+            row.pop('error', None)
+            if None in row:
+                yield reader.line_num, row, 'More values than header columns.'
+            else:
+                yield reader.line_num, row, None
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield number, {'raw': line.rstrip('\n')}, f'Invalid JSON: {exc}'
+            continue
+        if not isinstance(row, dict):
+            yield number, {'raw': line.rstrip('\n')}, 'Each line must be a JSON object.'
+            continue
+        row.pop('line', None)
+        row.pop('error', None)
+        yield number, row, None
+
+
+class RejectWriter:
+    """Writes rejected rows in the input's format, plus line and error columns"""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        self.writer = None
+        self.count = 0
+
+    def write(self, line, row, error):
+        self.count += 1
+        if self.stream is None:
+            return
+        if self.fmt == 'jsonl':
+            self.stream.write(json.dumps({**row, 'line': line, 'error': error}, default=str) + '\n')
+            return
+        row = {key: value for key, value in row.items() if key is not None}
+        if self.writer is None:
+            self.writer = csv.DictWriter(
+                self.stream, fieldnames=[*row, 'line', 'error'], extrasaction='ignore', restval='',
+            )
+            self.writer.writeheader()
+        self.writer.writerow({**row, 'line': line, 'error': error})
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    imported: int = 0
+    rejected: int = 0
+    batches: int = 0
+
+
+def _text(row, key, required=True):
+    value = row.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"Missing '{key}'.")
+    return value
+
+
+def _decimal(value, key):
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f"Invalid {key} '{value}'.")
+    if not number.is_finite() or number <= 0:
+        raise RowError(f"Invalid {key} '{value}'.")
+    return number
+
+
+def _datetime(value, key):
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError(f"Invalid {key} '{value}'; use YYYY-MM-DD HH:MM.")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Importer:
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    def run(self, rows, rejects, progress=None):
+        """Import (line, row, error) tuples from read_rows; returns ImportStats"""
+        stats = ImportStats()
+        batch = []
+        for line, row, error in rows:
+            stats.read += 1
+            if error:
+                rejects.write(line, row, error)
+                continue
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self._flush(batch, rejects, stats, progress)
+                batch = []
+        if batch:
+            self._flush(batch, rejects, stats, progress)
+        stats.rejected = rejects.count
+        return stats
+
+    def _flush(self, batch, rejects, stats, progress):
+        stats.imported += self._import(batch, rejects)
+        stats.batches += 1
+        if progress:
+            progress(stats.read, stats.imported, rejects.count)
+
+    def _import(self, batch, rejects):
+        rejected = []
+        try:
+            imported = self.import_batch(batch, lambda *reject: rejected.append(reject))
+        except IntegrityError as exc:
+            if len(batch) == 1:
+                rejects.write(*batch[0], f'Database error: {exc}')
+                return 0
+            # Isolate the rows that break a constraint
+            return sum(self._import([item], rejects) for item in batch)
+        for reject in rejected:
+            rejects.write(*reject)
+        return imported
+
+    def import_batch(self, batch, reject):
+        """Validate and write one batch; returns how many rows were imported.
+
+        Invalid rows are passed to ``reject(line, row, error)``.
+        """
+        raise NotImplementedError
+
+
+class ScheduleImporter(Importer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.movies = {}
+        titles = {}
+        for movie in Movie.objects.only('id', 'title', 'duration'):
+            self.movies[movie.id] = movie
+            titles.setdefault(movie.title.lower(), []).append(movie)
+        # Titles are not unique; ambiguous ones must be given by ID
+        self.titles = {title: movies[0] if len(movies) == 1 else None for title, movies in titles.items()}
+
+        cinemas = {}
+        for cinema_id, name in Cinema.objects.values_list('id', 'name'):
+            cinemas.setdefault(name.lower(), []).append(cinema_id)
+        self.cinemas = {name: ids[0] if len(ids) == 1 else None for name, ids in cinemas.items()}
+        self.screens = {
+            (cinema_id, name.lower()): screen_id
+            for screen_id, cinema_id, name in Screen.objects.values_list('id', 'cinema_id', 'name')
+        }
+
+    def lookup_movie(self, value):
+        if value.isdigit() and int(value) in self.movies:
+            return self.movies[int(value)]
+        movie = self.titles.get(value.lower(), False)
+        if movie is None:
+            raise RowError(f"Several movies are titled '{value}'; give the movie ID.")
+        if movie is False:
+            raise RowError(f"Unknown movie '{value}'.")
+        return movie
+
+    def lookup_screen(self, cinema, screen):
+        cinema_id = int(cinema) if cinema.isdigit() else self.cinemas.get(cinema.lower(), False)
+        if cinema_id is None:
+            raise RowError(f"Several cinemas are named '{cinema}'; give the cinema ID.")
+        screen_id = self.screens.get((cinema_id, screen.lower()))
+        if screen_id is None:
+            raise RowError(f"Unknown screen '{screen}' in cinema '{cinema}'.")
+        return screen_id
+
+    def clean(self, row, now):
+        movie = self.lookup_movie(_text(row, 'movie'))
+        screen_id = self.lookup_screen(_text(row, 'cinema'), _text(row, 'screen'))
+        start = _datetime(_text(row, 'start_time'), 'start_time')
+        if start <= now:
+            raise RowError('start_time is in the past.')
+        end_value = _text(row, 'end_time', required=False)
+        end = _datetime(end_value, 'end_time') if end_value else start + timedelta(minutes=movie.duration)
+        if end <= start:
+            raise RowError('end_time must be after start_time.')
+        price = _decimal(_text(row, 'price'), 'price')
+        if price >= 10000:
+            raise RowError(f"Invalid price '{price}'.")
+        return Showtime(movie=movie, screen_id=screen_id, start_time=start, end_time=end, price=price)
+
+    def import_batch(self, batch, reject):
+        now = timezone.now()
+        valid = []
+        for line, row in batch:
+            try:
+                valid.append((line, row, self.clean(row, now)))
+            except RowError as exc:
+                reject(line, row, str(exc))
+        if not valid:
+            return 0
+
+        with transaction.atomic():
+            # Earlier batches are committed, so the index also covers the file so far
+            window_start = min(showtime.start_time for _, _, showtime in valid)
+            window_end = max(showtime.end_time + cleaning_buffer(showtime.movie) for _, _, showtime in valid)
+            screens = [Screen(id=screen_id) for screen_id in {showtime.screen_id for _, _, showtime in valid}]
+            index = build_screen_index(screens, window_start, window_end)
+            showtimes = []
+            for line, row, showtime in valid:
+                blocked = (showtime.start_time, showtime.end_time + cleaning_buffer(showtime.movie))
+                if index[showtime.screen_id].overlaps(*blocked):
+                    reject(line, row, 'Overlaps another showtime on this screen (including cleaning time).')
+                    continue
+                index[showtime.screen_id].add(*blocked)
+                showtimes.append(showtime)
+            if not self.dry_run:
+                Showtime.objects.bulk_create(showtimes)
+        return len(showtimes)
+
+
+class BookingImporter(Importer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.seat_maps = OrderedDict()
+
+    def seat_map(self, screen_id):
+        """{'A1': seat id} of a screen, from a small LRU of screens"""
+        seats = self.seat_maps.get(screen_id)
+        if seats is None:
+            seats = {
+                f'{row}{number}': seat_id
+                for seat_id, row, number in Seat.objects.filter(screen_id=screen_id).values_list('id', 'row', 'number')
+            }
+            self.seat_maps[screen_id] = seats
+            if len(self.seat_maps) > SEAT_MAP_LIMIT:
+                self.seat_maps.popitem(last=False)
+        else:
+            self.seat_maps.move_to_end(screen_id)
+        return seats
+
+    def parse(self, row):
+        reference = _text(row, 'reference')
+        if len(reference) > 20:
+            raise RowError('reference is longer than 20 characters.')
+        showtime = _text(row, 'showtime')
+        if not showtime.isdigit():
+            raise RowError(f"Invalid showtime '{showtime}'.")
+        seats = row.get('seats')
+        if not isinstance(seats, list):
+            seats = SEAT_SEPARATORS.split(_text(row, 'seats'))
+        labels = [str(label).strip().upper() for label in seats if str(label).strip()]
+        if not labels:
+            raise RowError("Missing 'seats'.")
+        if len(set(labels)) != len(labels):
+            raise RowError('The same seat is listed twice.')
+        for label in labels:
+            if not SEAT_LABEL.match(label):
+                raise RowError(f"Invalid seat '{label}'.")
+        email = _text(row, 'email').lower()
+        if '@' not in email or len(email) > 150:
+            raise RowError(f"Invalid email '{email}'.")
+        status = _text(row, 'status', required=False) or 'Confirmed'
+        if status not in ('Confirmed', 'Pending'):
+            raise RowError(f"Invalid status '{status}'; use Confirmed or Pending.")
+        method = _text(row, 'payment_method', required=False) or 'card'
+        if method not in dict(Payment.PAYMENT_METHOD_CHOICES):
+            raise RowError(f"Invalid payment_method '{method}'.")
+        amount = _text(row, 'amount', required=False)
+        return {
+            'reference': reference,
+            'showtime_id': int(showtime),
+            'labels': labels,
+            'email': email,
+            'status': status,
+            'method': method,
+            'amount': _decimal(amount, 'amount') if amount else None,
+        }
+
+    def import_batch(self, batch, reject):
+        parsed = []
+        for line, row in batch:
+            try:
+                parsed.append((line, row, self.parse(row)))
+            except RowError as exc:
+                reject(line, row, str(exc))
+        if not parsed:
+            return 0
+
+        now = timezone.now()
+        with transaction.atomic():
+            showtime_ids = {data['showtime_id'] for _, _, data in parsed}
+            # Holds from the site may claim released seats between the check and the upsert
+            lock_showtimes(showtime_ids)
+            showtimes = Showtime.objects.in_bulk(showtime_ids)
+            taken_refs = set(Booking.objects.filter(
+                booking_reference__in=[data['reference'] for _, _, data in parsed],
+            ).values_list('booking_reference', flat=True))
+            booked = set(
+                SeatBooking.objects.filter(showtime_id__in=showtimes, is_booked=True)
+                .values_list('showtime_id', 'seat_id')
+            )
+
+            accepted = []
+            for line, row, data in parsed:
+                try:
+                    showtime = showtimes.get(data['showtime_id'])
+                    if showtime is None:
+                        raise RowError(f"Unknown showtime {data['showtime_id']}.")
+                    if showtime.end_time <= now:
+                        raise RowError('The showtime is over.')
+                    if data['reference'] in taken_refs:
+                        raise RowError(f"Booking reference {data['reference']} already exists.")
+                    seat_map = self.seat_map(showtime.screen_id)
+                    unknown = [label for label in data['labels'] if label not in seat_map]
+                    if unknown:
+                        raise RowError(f"No such seat on this screen: {', '.join(unknown)}.")
+                    seat_ids = [seat_map[label] for label in data['labels']]
+                    taken = [label for label, seat_id in zip(data['labels'], seat_ids) if (showtime.id, seat_id) in booked]
+                    if taken:
+                        raise RowError(f"Already booked: {', '.join(taken)}.")
+                except RowError as exc:
+                    reject(line, row, str(exc))
+                    continue
+                taken_refs.add(data['reference'])
+                booked.update((showtime.id, seat_id) for seat_id in seat_ids)
+                accepted.append((showtime, seat_ids, data))
+            if accepted and not self.dry_run:
+                self.write(accepted)
+        return len(accepted)
+
+    def write(self, accepted):
+        emails = {data['email'] for _, _, data in accepted}
+        # Emails were lowercased in parse; registration keeps them as typed
+        users = dict(
+            User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails)
+            .values_list('email_lower', 'id')
+        )
+        new_users = [
+            User(username=email, email=email, password='!')  # "!" prefix: no usable password
+            for email in sorted(emails - set(users))
+        ]
+        for user in User.objects.bulk_create(new_users):
+            users[user.email] = user.id
+
+        bookings = Booking.objects.bulk_create([
+            Booking(
+                user_id=users[data['email']], showtime=showtime, status=data['status'],
+                total_amount=data['amount'] or showtime.price * len(seat_ids),
+                booking_reference=data['reference'],
+            )
+            for showtime, seat_ids, data in accepted
+        ])
+        Booking.seats.through.objects.bulk_create([
+            Booking.seats.through(booking_id=booking.id, seat_id=seat_id)
+            for booking, (_, seat_ids, _) in zip(bookings, accepted)
+            for seat_id in seat_ids
+        ])
+        # Released seats keep their row, so update it rather than insert
+        SeatBooking.objects.bulk_create(
+            [
+                SeatBooking(showtime_id=booking.showtime_id, seat_id=seat_id, booking_id=booking.id, is_booked=True)
+                for booking, (_, seat_ids, _) in zip(bookings, accepted)
+                for seat_id in seat_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['showtime', 'seat'],
+            update_fields=['booking', 'is_booked'],
+        )
+        payments = Payment.objects.bulk_create([
+            Payment(
+                booking_id=booking.id, payment_method=data['method'], amount=booking.total_amount,
+                transaction_id=f"IMP-{data['reference']}", status='completed',
+            )
+            for booking, (_, _, data) in zip(bookings, accepted)
+            if data['status'] == 'Confirmed'
+        ])
+        showtime_of = {booking.id: booking.showtime_id for booking in bookings}
+        BookingEvent.objects.bulk_create([
+            *(
+                events.event(
+                    'booking.imported', booking, seat_ids=seat_ids, amount=booking.total_amount, status=booking.status,
+                )
+                for booking, (_, seat_ids, _) in zip(bookings, accepted)
+            ),
+            *(
+                events.event(
+                    'payment.completed', payment.booking_id, showtime_of[payment.booking_id],
+                    method=payment.payment_method, amount=payment.amount, transaction_id=payment.transaction_id,
+                )
+                for payment in payments
+            ),
+        ])
+        refresh_inventory({booking.showtime_id for booking in bookings})
+
+
+class AdmissionImporter(Importer):
+    def parse(self, row, now):
+        reference = _text(row, 'reference')
+        admitted_at = _datetime(_text(row, 'admitted_at'), 'admitted_at')
+        if admitted_at > now:
+            raise RowError('admitted_at is in the future.')
+        showtime = _text(row, 'showtime', required=False)
+        if showtime and not showtime.isdigit():
+            raise RowError(f"Invalid showtime '{showtime}'.")
+        gate = _text(row, 'gate', required=False)
+        if len(gate) > 50:
+            raise RowError('gate is longer than 50 characters.')
+        return {
+            'reference': reference,
+            'admitted_at': admitted_at,
+            'showtime_id': int(showtime) if showtime else None,
+            'gate': gate,
+        }
+
+    def import_batch(self, batch, reject):
+        now = timezone.now()
+        parsed = []
+        for line, row in batch:
+            try:
+                parsed.append((line, row, self.parse(row, now)))
+            except RowError as exc:
+                reject(line, row, str(exc))
+        if not parsed:
+            return 0
+
+        with transaction.atomic():
+            bookings = {
+                reference: (booking_id, showtime_id, status)
+                for reference, booking_id, showtime_id, status in Booking.objects.filter(
+                    booking_reference__in={data['reference'] for _, _, data in parsed},
+                ).values_list('booking_reference', 'id', 'showtime_id', 'status')
+            }
+            admitted = {
+                admission.booking_id: admission
+                for admission in Admission.objects.filter(booking__in=[found[0] for found in bookings.values()])
+            }
+
+            admissions = []
+            for line, row, data in parsed:
+                try:
+                    found = bookings.get(data['reference'])
+                    if found is None:
+                        raise RowError(f"Unknown booking reference {data['reference']}.")
+                    booking_id, showtime_id, status = found
+                    if data['showtime_id'] is not None and data['showtime_id'] != showtime_id:
+                        raise RowError(f"Booking {data['reference']} is for showtime {showtime_id}.")
+                    if status != 'Confirmed':
+                        raise RowError(f"Booking {data['reference']} is {status}.")
+                    earlier = admitted.get(booking_id)
+                    if earlier is not None:
+                        gate = f" at gate {earlier.gate}" if earlier.gate else ''
+                        raise RowError(
+                            f"Already admitted {timezone.localtime(earlier.admitted_at):%Y-%m-%d %H:%M:%S}"
+                            f"{gate} ({earlier.source})."
+                        )
+                except RowError as exc:
+                    reject(line, row, str(exc))
+                    continue
+                admission = Admission(
+                    booking_id=booking_id, showtime_id=showtime_id, admitted_at=data['admitted_at'],
+                    gate=data['gate'], source='offline',
+                )
+                admitted[booking_id] = admission
+                admissions.append(admission)
+            if admissions and not self.dry_run:
+                Admission.objects.bulk_create(admissions)
+        return len(admissions)
+
+
+IMPORTERS = {'schedules': ScheduleImporter, 'bookings': BookingImporter, 'admissions': AdmissionImporter}
@@ -0,0 +1,159 @@
+"""Per-request SQL, template and wall-time instrumentation.
+
+RequestTimingMiddleware measures every request and reports it as a
+``Server-Timing`` header; requests slower than SLOW_REQUEST_MS are logged
+as JSON to the ``booking.performance`` logger, along with statements that
+ran N_PLUS_ONE_THRESHOLD or more times (the usual sign of an N+1 query).
+
+Queries are timed by an execute_wrapper that install_query_timer adds to
+every database connection as it opens, and templates through
+InstrumentedDjangoTemplates, so nothing depends on DEBUG and the cost per
+query is one extra function call. The wrapper finds the request through a
+context variable, so queries an async view runs on worker threads are
+counted too. The middleware itself works under WSGI and ASGI.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('booking.performance')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def current_metrics():
+    """Metrics of the request being served, or None outside a request"""
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver; wrappers outlive reconnects, so only add it once"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            # Parameters are left out, so one query per row of a loop
+            # collapses into a single repeated statement.
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+    def server_timing(self, wall):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={wall * 1000:.1f}',
+        ])
+
+
+class TimedTemplate:
+    """Wraps a backend template to add its render time to the current request"""
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics, time.perf_counter() - started)
+
+    def report(self, request, response, metrics, wall):
+        response['Server-Timing'] = metrics.server_timing(wall)
+
+        duplicates = metrics.duplicates(settings.N_PLUS_ONE_THRESHOLD)
+        if wall * 1000 >= settings.SLOW_REQUEST_MS or duplicates:
+            match = request.resolver_match
+            record = {
+                'view': match.view_name if match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'wall_ms': round(wall * 1000, 1),
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'template_ms': round(metrics.template_time * 1000, 1),
+                'queries': metrics.queries,
+            }
+            if duplicates:
+                record['repeated_queries'] = [
+                    {'count': count, 'sql': sql} for sql, count in sorted(duplicates.items(), key=lambda i: -i[1])
+                ]
+            event = 'slow_request' if wall * 1000 >= settings.SLOW_REQUEST_MS else 'repeated_queries'
+            logger.warning(json.dumps({'event': event, **record}))
+        return response
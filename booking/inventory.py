@@ -0,0 +1,145 @@
+"""Per-showtime index of free seats and of the longest run of free seats together.
+
+ShowtimeInventory rows answer "which showtimes have N seats together"
+without reading a single seat at search time. refresh_inventory rebuilds
+the rows of any number of showtimes from their seat maps and booked seats
+in a handful of queries, and is called wherever reservations change: seat
+holds, releases, cancellations and compaction. Showtimes without a row yet
+(new ones, or ones whose screen layout changed) are indexed lazily by
+find_seats_together.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, IntegerField, Value, When
+
+from cinema_booking.routers import pin_to_primary
+
+from .models import Screen, Seat, SeatArchive, SeatBooking, Showtime, ShowtimeInventory
+
+SEAT_TYPE_FIELDS = {'Regular': 'longest_regular', 'Premium': 'longest_premium', 'VIP': 'longest_vip'}
+REFRESH_BATCH = 500
+# Showtimes indexed on the fly by one search; the rest wait for rebuild_inventory
+LAZY_REFRESH_LIMIT = 200
+
+
+def screen_rows(screens):
+    """{screen id: rows}, each row a list of (seat id, seat type), None where adjacency breaks"""
+    result = {}
+    plain = []
+    for screen in screens:
+        layout = screen.get_layout()
+        if layout is None:
+            plain.append(screen.id)
+            continue
+        result[screen.id] = [
+            [(cell['id'], cell['seat_type']) if cell['kind'] == 'seat' else None for cell in cells]
+            for _, cells in layout.seat_map()
+        ]
+
+    # Screens without a layout: seats are adjacent when their numbers are
+    rows = defaultdict(dict)
+    for screen_id, seat_id, row, number, seat_type in (
+        Seat.objects.filter(screen_id__in=plain)
+        .order_by('screen_id', 'row', 'number')
+        .values_list('screen_id', 'id', 'row', 'number', 'seat_type')
+    ):
+        cells, last = rows[screen_id].get(row, ([], None))
+        if last is not None and number != last + 1:
+            cells.append(None)
+        cells.append((seat_id, seat_type))
+        rows[screen_id][row] = (cells, number)
+    for screen_id in plain:
+        result[screen_id] = [cells for cells, _ in rows[screen_id].values()]
+    return result
+
+
+def summarize(rows, booked):
+    """Field values of a ShowtimeInventory for a seat map and the booked seat IDs"""
+    summary = {'seats_left': 0, 'longest_run': 0, **{field: 0 for field in SEAT_TYPE_FIELDS.values()}}
+    for row in rows:
+        run = typed_run = 0
+        run_type = None
+        for cell in row:
+            if cell is None or cell[0] in booked:
+                run = typed_run = 0
+                run_type = None
+                continue
+            seat_type = cell[1]
+            summary['seats_left'] += 1
+            run += 1
+            typed_run = typed_run + 1 if seat_type == run_type else 1
+            run_type = seat_type
+            summary['longest_run'] = max(summary['longest_run'], run)
+            field = SEAT_TYPE_FIELDS[seat_type]
+            summary[field] = max(summary[field], typed_run)
+    return summary
+
+
+def lock_showtimes(showtime_ids):
+    """Lock these Showtime rows until the end of the transaction.
+
+    Everything that changes the seats of a showtime takes this lock first,
+    so the changes apply one at a time and the inventory written by each
+    one counts all the others.
+    """
+    list(Showtime.objects.select_for_update().filter(id__in=showtime_ids).order_by('id').values_list('id', flat=True))
+
+
+def refresh_inventory(showtime_ids):
+    """Recompute the inventory rows of these showtimes"""
+    showtime_ids = list(showtime_ids)
+    with pin_to_primary():
+        for offset in range(0, len(showtime_ids), REFRESH_BATCH):
+            _refresh_batch(showtime_ids[offset:offset + REFRESH_BATCH])
+
+
+def _refresh_batch(showtime_ids):
+    screens_of = dict(Showtime.objects.filter(id__in=showtime_ids).order_by().values_list('id', 'screen_id'))
+    if not screens_of:
+        return
+    seat_maps = screen_rows(Screen.objects.filter(id__in=set(screens_of.values())))
+    booked = defaultdict(set)
+    for showtime_id, seat_id in (
+        SeatBooking.objects.filter(showtime_id__in=screens_of, is_booked=True).values_list('showtime_id', 'seat_id')
+    ):
+        booked[showtime_id].add(seat_id)
+    for archive in SeatArchive.objects.filter(showtime_id__in=screens_of):
+        booked[archive.showtime_id] |= archive.booked_seat_ids()
+
+    ShowtimeInventory.objects.bulk_create(
+        [
+            ShowtimeInventory(showtime_id=showtime_id, **summarize(seat_maps[screen_id], booked[showtime_id]))
+            for showtime_id, screen_id in screens_of.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['showtime'],
+        update_fields=['seats_left', 'longest_run', *SEAT_TYPE_FIELDS.values(), 'updated_at'],
+    )
+
+
+def invalidate_screen(screen_id):
+    """Drop the rows of a screen whose seats changed; they are rebuilt on the next search"""
+    ShowtimeInventory.objects.filter(showtime__screen_id=screen_id).delete()
+
+
+def find_seats_together(showtimes, party_size, seat_type=None):
+    """Showtimes with ``party_size`` adjacent free seats, by start time then best seat type"""
+    field = SEAT_TYPE_FIELDS.get(seat_type, 'longest_run')
+    quality = Case(
+        When(inventory__longest_vip__gte=party_size, then=Value(3)),
+        When(inventory__longest_premium__gte=party_size, then=Value(2)),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+    matches = (
+        showtimes.filter(**{f'inventory__{field}__gte': party_size})
+        .select_related('movie', 'screen__cinema', 'inventory')
+        .annotate(quality=quality)
+        .order_by('start_time', '-quality', 'id')
+    )
+    # The index is written on the primary; a replica may not have it yet
+    with pin_to_primary():
+        missing = list(showtimes.filter(inventory__isnull=True).values_list('id', flat=True)[:LAZY_REFRESH_LIMIT])
+        if missing:
+            refresh_inventory(missing)
+        return list(matches)
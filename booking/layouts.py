@@ -0,0 +1,229 @@
+"""Screen layout specs and bulk seat generation.
+
+A layout can be written two ways. The shorthand form describes a regular
+auditorium::
+
+    rows: A-J
+    seats: 12
+    aisles: 4, 8
+    gaps: A1, A12
+    VIP: A-B
+    Premium: C-E
+
+The grid form gives every row explicitly, one cell per character
+(R/P/V = Regular/Premium/VIP seat, ``.`` = no seat, ``|`` = aisle)::
+
+    A: VVVV|VVVV
+    B: PPPP|PP.P
+
+Both are normalized into a ScreenLayout, which is what gets stored on the
+screen as a compressed blob alongside the generated seat IDs.
+"""
+import hashlib
+import json
+import re
+import zlib
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .inventory import invalidate_screen
+from .models import Booking, Seat, SeatBooking
+
+# Keys carry a hash of the layout, so a changed layout never reads a stale map
+SEAT_MAP_CACHE_SECONDS = 24 * 60 * 60
+
+SEAT_CODES = {'R': 'Regular', 'P': 'Premium', 'V': 'VIP'}
+TYPE_CODES = {seat_type: code for code, seat_type in SEAT_CODES.items()}
+GAP = '.'
+AISLE = '|'
+
+GRID_LINE = re.compile(r'^([A-Z]{1,2})\s*:\s*([RPV.|]+)$')
+ROW_LABEL = re.compile(r'^[A-Z]{1,2}$')
+
+
+def _row_labels(value):
+    """Expand "A-C, E" into ['A', 'B', 'C', 'E']"""
+    labels = []
+    for part in value.split(','):
+        part = part.strip().upper()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = (p.strip() for p in part.split('-', 1))
+            if len(first) != 1 or len(last) != 1 or first > last:
+                raise ValidationError(f"Invalid row range '{part}'.")
+            labels.extend(chr(c) for c in range(ord(first), ord(last) + 1))
+        elif ROW_LABEL.match(part):
+            labels.append(part)
+        else:
+            raise ValidationError(f"Invalid row label '{part}'.")
+    return labels
+
+
+class ScreenLayout:
+    """Normalized seat map: one cell string per row, plus the generated seat IDs"""
+
+    def __init__(self, rows, seat_ids=None):
+        self.rows = rows
+        self.seat_ids = seat_ids or []
+
+    @property
+    def seat_count(self):
+        return sum(sum(cell in SEAT_CODES for cell in cells) for _, cells in self.rows)
+
+    def seats(self):
+        """Yield (row, number, seat_type) for every seat, in cell order"""
+        for label, cells in self.rows:
+            number = 0
+            for cell in cells:
+                if cell == AISLE:
+                    continue
+                number += 1
+                if cell in SEAT_CODES:
+                    yield label, number, SEAT_CODES[cell]
+
+    def to_text(self):
+        return '\n'.join(f"{label}: {cells}" for label, cells in self.rows)
+
+    def encode(self):
+        payload = {'rows': self.rows, 'ids': self.seat_ids}
+        return zlib.compress(json.dumps(payload, separators=(',', ':')).encode())
+
+    @classmethod
+    def decode(cls, blob):
+        payload = json.loads(zlib.decompress(bytes(blob)))
+        return cls([tuple(row) for row in payload['rows']], payload['ids'])
+
+    def seat_map(self):
+        """Rows ready for rendering: (label, cells), each cell a dict.
+
+        Seat cells carry ``id``, ``number`` and ``seat_type``; aisles and gaps
+        carry ``kind`` so the template can draw spacing without touching Seat.
+        """
+        ids = iter(self.seat_ids)
+        result = []
+        for label, cells in self.rows:
+            row = []
+            number = 0
+            for cell in cells:
+                if cell == AISLE:
+                    row.append({'kind': 'aisle'})
+                    continue
+                number += 1
+                if cell == GAP:
+                    row.append({'kind': 'gap'})
+                else:
+                    row.append({'kind': 'seat', 'id': next(ids), 'number': number, 'seat_type': SEAT_CODES[cell]})
+            result.append((label, row))
+        return result
+
+
+def seat_map_key(screen):
+    return f'seat-map:{screen.id}:{hashlib.md5(bytes(screen.layout)).hexdigest()}'
+
+
+def cached_seat_map(screen):
+    """The screen's layout seat map from the cache, or None for screens without a layout"""
+    if not screen.layout:
+        return None
+    key = seat_map_key(screen)
+    seat_rows = cache.get(key)
+    if seat_rows is None:
+        seat_rows = screen.get_layout().seat_map()
+        cache.set(key, seat_rows, SEAT_MAP_CACHE_SECONDS)
+    return seat_rows
+
+
+def _parse_grid(lines):
+    rows = []
+    for line in lines:
+        match = GRID_LINE.match(line)
+        if not match:
+            raise ValidationError(f"Invalid layout row '{line}'.")
+        rows.append((match.group(1), match.group(2)))
+    return rows
+
+
+def _parse_shorthand(lines):
+    options = {}
+    for line in lines:
+        key, sep, value = line.partition(':')
+        if not sep:
+            raise ValidationError(f"Invalid layout line '{line}'.")
+        options[key.strip()] = value.strip()
+
+    try:
+        labels = _row_labels(options.pop('rows'))
+        per_row = int(options.pop('seats'))
+    except KeyError as exc:
+        raise ValidationError(f"Layout is missing '{exc.args[0]}'.")
+    except ValueError:
+        raise ValidationError('Seats per row must be a number.')
+    if not labels or not 0 < per_row <= 99:
+        raise ValidationError('A layout needs at least one row and 1-99 seats per row.')
+
+    try:
+        aisles = {int(n) for n in options.pop('aisles', '').split(',') if n.strip()}
+    except ValueError:
+        raise ValidationError('Aisles must be a list of seat numbers.')
+    gaps = {g.strip().upper() for g in options.pop('gaps', '').split(',') if g.strip()}
+
+    zones = {}
+    for seat_type, value in options.items():
+        if seat_type not in TYPE_CODES:
+            raise ValidationError(f"Unknown layout option '{seat_type}'.")
+        for label in _row_labels(value):
+            zones[label] = TYPE_CODES[seat_type]
+
+    rows = []
+    for label in labels:
+        cells = []
+        for number in range(1, per_row + 1):
+            cells.append(GAP if f"{label}{number}" in gaps else zones.get(label, 'R'))
+            if number in aisles and number < per_row:
+                cells.append(AISLE)
+        rows.append((label, ''.join(cells)))
+    return rows
+
+
+def parse_layout(text):
+    """Parse a shorthand or grid layout spec into a ScreenLayout"""
+    lines = [line.split('#', 1)[0].strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        raise ValidationError('Layout is empty.')
+    if all(GRID_LINE.match(line) for line in lines):
+        rows = _parse_grid(lines)
+    else:
+        rows = _parse_shorthand(lines)
+
+    labels = [label for label, _ in rows]
+    if len(labels) != len(set(labels)):
+        raise ValidationError('Each row may only appear once.')
+    layout = ScreenLayout(rows)
+    if not layout.seat_count:
+        raise ValidationError('Layout has no seats.')
+    return layout
+
+
+@transaction.atomic
+def apply_layout(screen, layout):
+    """Replace the screen's seats with the layout's, in one bulk insert"""
+    seats = Seat.objects.filter(screen=screen)
+    if (SeatBooking.objects.filter(seat__in=seats).exists()
+            or Booking.seats.through.objects.filter(seat__in=seats).exists()):
+        raise ValidationError('Seats of this screen have bookings; its layout can no longer be regenerated.')
+    seats.delete()
+
+    created = Seat.objects.bulk_create([
+        Seat(screen=screen, row=row, number=number, seat_type=seat_type)
+        for row, number, seat_type in layout.seats()
+    ])
+    layout.seat_ids = [seat.id for seat in created]
+    screen.layout = layout.encode()
+    screen.total_seats = len(created)
+    screen.save(update_fields=['layout', 'total_seats'])
+    invalidate_screen(screen.id)
+    return created
@@ -0,0 +1,302 @@
+"""Building blocks for the load-test harness (see the loadtest command).
+
+Seeds a realistic catalog into a throwaway database, serves the real WSGI
+application from a local threaded server and drives it with virtual users
+over HTTP, collecting per-endpoint latencies.
+"""
+import http.client
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import time as clock, timedelta
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+
+from .layouts import apply_layout, parse_layout
+from .models import Booking, Cinema, Movie, Payment, Screen, Showtime
+from .scheduling import schedule_showtimes
+
+AVAILABLE_SEAT = re.compile(r'data-seat-id="(\d+)"\s+data-booked="false"')
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+SCREEN_LAYOUT = """
+rows: A-L
+seats: 18
+aisles: 4, 14
+VIP: A-B
+Premium: C-E
+"""
+
+GENRES = ['Action', 'Drama', 'Comedy', 'Thriller', 'Romance']
+LANGUAGES = ['Nepali', 'Hindi', 'English']
+
+
+def seed_dataset(rng, cinemas=3, screens_per_cinema=3, movies=8, days=7, users=50):
+    """Create a catalog shaped like a real multiplex chain.
+
+    Returns (premiere showtimes ordered by start, users). The premiere movie
+    plays on every screen; the other movies fill the remaining slots.
+    """
+    layout = parse_layout(SCREEN_LAYOUT)
+    screens = []
+    for c in range(cinemas):
+        cinema = Cinema.objects.create(
+            name=f"Cinema {c + 1}", location=f"City {c % 3 + 1}", address=f"{c + 1} Main Road", phone='01-000000',
+        )
+        for s in range(screens_per_cinema):
+            screen = Screen.objects.create(cinema=cinema, name=f"Audi {s + 1}")
+            apply_layout(screen, layout)
+            screens.append(screen)
+
+    today = timezone.localdate()
+    catalog = Movie.objects.bulk_create([
+        Movie(
+            title=f"Movie {m + 1}", description='Load test movie', duration=rng.randint(90, 170),
+            genre=rng.choice(GENRES), language=rng.choice(LANGUAGES), rating=rng.choice(['U', 'PG', 'Adult']),
+            release_date=today, is_now_showing=True,
+        )
+        for m in range(movies)
+    ])
+    premiere, others = catalog[0], catalog[1:]
+    start = today + timedelta(days=1)
+    schedule_showtimes(premiere, screens, start, 1, [clock(19, 0)], 500)
+    slots = [clock(10, 0), clock(13, 0), clock(16, 0), clock(22, 30)]
+    for movie in others:
+        schedule_showtimes(movie, rng.sample(screens, min(3, len(screens))), start, max(1, days // 7), slots, 350)
+
+    password = make_password('loadtest-password')
+    people = User.objects.bulk_create([
+        User(username=f"vu{i}", email=f"vu{i}@loadtest.local", password=password) for i in range(users)
+    ])
+    return list(Showtime.objects.filter(movie=premiere).order_by('start_time', 'id')), people
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LoadTestServer(ThreadedWSGIServer):
+    request_queue_size = 256
+
+
+class QueryCounter:
+    """Counts SQL statements run by the server, in total and against django_session"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.session_queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries += 1
+            if 'django_session' in sql:
+                self.session_queries += 1
+        return execute(sql, params, many, context)
+
+
+class LocalServer:
+    """Serve the project's WSGI application on an ephemeral local port"""
+
+    def __init__(self, counter):
+        self.counter = counter
+        application = get_wsgi_application()
+
+        def app(environ, start_response):
+            with connections['default'].execute_wrapper(self.counter):
+                return application(environ, start_response)
+
+        self.httpd = LoadTestServer(('127.0.0.1', 0), QuietHandler)
+        self.httpd.set_app(app)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+
+class HttpSession:
+    """Minimal cookie-keeping HTTP client that does not follow redirects"""
+
+    def __init__(self, port, cookies=None):
+        self.port = port
+        self.cookies = dict(cookies or {})
+
+    def request(self, method, path, data=None):
+        headers = {'Connection': 'close'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if data is not None:
+            body = urlencode(data, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            content = response.read().decode('utf-8', 'replace')
+        finally:
+            conn.close()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['max-age'] == '0':
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        return response.status, response.headers.get('Location', ''), content
+
+
+class Recorder:
+    """Thread-safe latency and error collection, keyed by endpoint name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.flows = defaultdict(int)
+
+    def call(self, session, endpoint, method, path, data=None, expect=(200,)):
+        started = time.perf_counter()
+        try:
+            status, location, content = session.request(method, path, data)
+        except OSError:
+            status, location, content = None, '', ''
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if status not in expect:
+                self.errors[endpoint] += 1
+        if status not in expect:
+            raise FlowError(f"{endpoint} returned {status}")
+        return location, content
+
+    def flow_finished(self, outcome):
+        with self.lock:
+            self.flows[outcome] += 1
+
+
+class FlowError(Exception):
+    pass
+
+
+def booking_flow(recorder, session, showtime, seats_wanted, rng):
+    """movie_detail -> select_seats -> payment_page -> process_payment"""
+    day = timezone.localtime(showtime.start_time).date()
+    recorder.call(session, 'movie_detail', 'GET', f"/movie/{showtime.movie_id}/?date={day:%Y-%m-%d}")
+
+    _, page = recorder.call(session, 'select_seats', 'GET', f"/select-seats/{showtime.id}/")
+    available = AVAILABLE_SEAT.findall(page)
+    if len(available) < seats_wanted:
+        return 'sold_out'
+    csrf = CSRF_TOKEN.search(page).group(1)
+    choice = rng.sample(available, seats_wanted)
+    location, _ = recorder.call(
+        session, 'select_seats_post', 'POST', f"/select-seats/{showtime.id}/",
+        {'seats': choice, 'csrfmiddlewaretoken': csrf}, expect=(302,),
+    )
+    payment_path = urlsplit(location).path
+    if not payment_path.startswith('/payment/'):
+        return 'rejected'
+
+    _, page = recorder.call(session, 'payment_page', 'GET', payment_path)
+    booking_id = payment_path.rstrip('/').rsplit('/', 1)[1]
+    csrf = CSRF_TOKEN.search(page).group(1)
+    location, _ = recorder.call(
+        session, 'process_payment', 'POST', f"/process-payment/{booking_id}/",
+        {'payment_method': rng.choice(['esewa', 'khalti', 'fonepay']), 'csrfmiddlewaretoken': csrf},
+        expect=(302,),
+    )
+    return 'confirmed' if '/booking-confirmation/' in location else 'rejected'
+
+
+def login_cookies(user):
+    """Session cookie for a user, created without going through password hashing"""
+    client = Client()
+    client.force_login(user)
+    return {name: morsel.value for name, morsel in client.cookies.items()}
+
+
+def run_virtual_user(recorder, port, cookies, showtimes, iterations, seats_wanted, seed):
+    rng = random.Random(seed)
+    session = HttpSession(port, cookies)
+    for _ in range(iterations):
+        try:
+            outcome = booking_flow(recorder, session, rng.choice(showtimes), seats_wanted, rng)
+        except FlowError:
+            outcome = 'failed'
+        recorder.flow_finished(outcome)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def endpoint_summary(recorder, duration):
+    summary = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        errors = recorder.errors[endpoint]
+        summary[endpoint] = {
+            'requests': len(values),
+            'throughput_rps': round(len(values) / duration, 2),
+            'errors': errors,
+            'error_rate': round(errors / len(values), 4),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+        }
+    return summary
+
+
+def double_bookings():
+    """Seats held or sold to more than one live booking of the same showtime"""
+    through = Booking.seats.through.objects.filter(booking__status__in=['Pending', 'Confirmed'])
+    duplicates = (
+        through.values('booking__showtime_id', 'seat_id')
+        .annotate(bookings=Count('booking_id'))
+        .filter(bookings__gt=1)
+    )
+    return sum(row['bookings'] - 1 for row in duplicates)
+
+
+def booking_totals():
+    return {
+        'confirmed_bookings': Booking.objects.filter(status='Confirmed').count(),
+        'pending_bookings': Booking.objects.filter(status='Pending').count(),
+        'payments': Payment.objects.count(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
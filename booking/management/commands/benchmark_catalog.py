@@ -0,0 +1,107 @@
+# Run with: python manage.py benchmark_catalog --concurrency 1,8,32 --db-latency 2
+# Compares the catalog pages served through WSGI (one worker, N threads) and
+# ASGI (one worker, N requests in flight on its event loop) against a
+# throwaway copy of the schema; the real database is never touched.
+
+import json
+import os
+import random
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.utils import timezone
+from booking import benchmark, loadtest
+
+class Command(BaseCommand):
+    help = 'Benchmark the catalog pages under WSGI and ASGI at several concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Requests per run')
+        parser.add_argument('--concurrency', default='1,8,32',
+                            help='Comma-separated levels: WSGI threads and ASGI requests in flight')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Milliseconds added to every query, as a network round trip would')
+        parser.add_argument('--cinemas', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Also save the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency takes comma-separated integers, e.g. 1,8,32')
+
+        connection = connections['default']
+        if connection.vendor == 'sqlite':
+            # A file, not :memory:, so worker threads share it the way workers would
+            handle, path = tempfile.mkstemp(prefix='benchmark-', suffix='.sqlite3')
+            os.close(handle)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+
+        # Behave like production: no debug query log, catalog on the primary
+        with override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, benchmark.HOST],
+            DATABASE_REPLICAS=[],
+            # Every request must reach the views, not the availability cache
+            AVAILABILITY_CACHE_SECONDS=0,
+            # Under load every request is "slow"; don't log them all
+            SLOW_REQUEST_MS=float('inf'),
+        ):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.run(options, levels)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results)
+        if options['output']:
+            output = Path(options['output'])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"\n✅ Results saved to {output}"))
+
+    def run(self, options, levels):
+        self.stdout.write('Seeding dataset...')
+        loadtest.seed_dataset(random.Random(options['seed']), cinemas=options['cinemas'])
+        paths = benchmark.catalog_paths()
+
+        runs = []
+        with benchmark.SimulatedLatency(options['db_latency'] / 1000):
+            # Warm up both stacks (template loading, URL resolver, connections)
+            benchmark.run_wsgi(paths, len(paths), 1)
+            benchmark.run_asgi(paths, len(paths), 1)
+            for level in levels:
+                for mode, run in (('wsgi', benchmark.run_wsgi), ('asgi', benchmark.run_asgi)):
+                    self.stdout.write(f"Running {mode.upper()} at concurrency {level}...")
+                    runs.append({'mode': mode, 'concurrency': level, **run(paths, options['requests'], level)})
+        return {
+            'git_revision': loadtest.git_revision(),
+            'finished_at': timezone.now().isoformat(),
+            'config': {
+                'requests': options['requests'],
+                'db_latency_ms': options['db_latency'],
+                'db_vendor': connections['default'].vendor,
+                'paths': paths,
+                'seed': options['seed'],
+            },
+            'runs': runs,
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"\n{'mode':<6}{'conc':>6}{'req/s':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'peak':>6}{'errors':>8}"
+        )
+        for run in results['runs']:
+            self.stdout.write(
+                f"{run['mode']:<6}{run['concurrency']:>6}{run['throughput_rps']:>10}{run['p50_ms']:>10}"
+                f"{run['p95_ms']:>10}{run['p99_ms']:>10}{run['peak_in_flight']:>6}{run['errors']:>8}"
+            )
+        self.stdout.write('\np50 per endpoint (ms):')
+        for run in results['runs']:
+            endpoints = ', '.join(f'{name} {value}' for name, value in run['endpoints'].items())
+            self.stdout.write(f"  {run['mode']} x{run['concurrency']}: {endpoints}")
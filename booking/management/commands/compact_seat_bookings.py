@@ -0,0 +1,50 @@
+# Run with: python manage.py compact_seat_bookings --older-than 24
+# Schedule it (e.g. nightly from cron) so SeatBooking only holds upcoming showtimes.
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from booking.archive import compact_batch, showtimes_to_compact
+
+class Command(BaseCommand):
+    help = 'Fold the seat rows of ended showtimes into per-showtime archives and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=24, help='Hours since the showtime ended')
+        parser.add_argument('--batch-size', type=int, default=200, help='Showtimes per transaction')
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches so writers are not starved')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the showtimes that would be compacted')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['older_than'])
+        if options['dry_run']:
+            count = showtimes_to_compact(cutoff).count()
+            self.stdout.write(f"{count} showtime(s) ended before {cutoff:%Y-%m-%d %H:%M} have seat rows to compact")
+            return
+
+        batch_size = options['batch_size']
+        showtimes = archives = rows = 0
+        last_id = 0
+        started = time.monotonic()
+        while True:
+            batch = list(showtimes_to_compact(cutoff).filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            batch_archives, batch_rows = compact_batch(batch)
+            showtimes += len(batch)
+            archives += batch_archives
+            rows += batch_rows
+            last_id = batch[-1]
+            if len(batch) < batch_size:
+                break
+            time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - started
+        if showtimes:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Compacted {rows} seat row(s) of {showtimes} showtime(s) into {archives} archive(s) in {elapsed:.2f}s"
+            ))
+        else:
+            self.stdout.write("No ended showtimes to compact")
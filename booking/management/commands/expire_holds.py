@@ -0,0 +1,41 @@
+# Run with: python manage.py expire_holds
+#       or: python manage.py expire_holds --minutes 30 --dry-run
+# Schedule it every minute or so: bookings left unpaid for SEAT_HOLD_MINUTES
+# are cancelled and their seats go back on sale, or to the showtime's waitlist.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from booking.models import Booking
+from booking.reservations import expire_hold
+
+class Command(BaseCommand):
+    help = 'Cancel pending bookings held longer than SEAT_HOLD_MINUTES and release their seats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=settings.SEAT_HOLD_MINUTES, help='Hold lifetime in minutes')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired holds')
+
+    def handle(self, *args, **options):
+        if options['minutes'] < 1:
+            raise CommandError('--minutes must be at least 1')
+        cutoff = timezone.now() - timedelta(minutes=options['minutes'])
+        stale = Booking.objects.filter(status='Pending', booking_date__lt=cutoff).select_related('showtime').order_by('id')
+        
+        if options['dry_run']:
+            self.stdout.write(f"{stale.count()} holds older than {options['minutes']} minutes")
+            return
+        
+        expired = released = 0
+        for booking in stale.iterator():
+            seats = expire_hold(booking, cutoff)
+            if seats is None:
+                # Paid while we were getting to it
+                continue
+            expired += 1
+            released += seats
+            self.stdout.write(f"  {booking.booking_reference}: released {seats} seats of {booking.showtime}")
+        
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Expired {expired} holds, released {released} seats"))
@@ -0,0 +1,60 @@
+# Run with: python manage.py export_checkin_snapshot --date today --cinema 3
+#       or: python manage.py export_checkin_snapshot --showtime 812 --output /media/scanner/
+# Writes one signed snapshot per showtime for door scanners that may lose the
+# network; load them with booking.checkin.Snapshot.load and reconcile the scans
+# afterwards with: python manage.py import_file admissions <scans>.jsonl
+
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from booking.catalog import day_bounds
+from booking.checkin import dump_snapshot
+from booking.models import Showtime
+from cinema_booking.routers import pin_to_primary
+
+class Command(BaseCommand):
+    help = 'Export signed offline check-in snapshots of the valid tickets of showtimes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--showtime', type=int, action='append', default=[], help='Showtime ID (repeatable)')
+        parser.add_argument('--date', help='Every showtime starting on this date: YYYY-MM-DD or "today"')
+        parser.add_argument('--cinema', type=int, help='With --date, only this cinema')
+        parser.add_argument('--output', default='checkin-snapshots', help='Directory to write the snapshots to')
+
+    def handle(self, *args, **options):
+        if options['showtime']:
+            showtimes = Showtime.objects.filter(id__in=options['showtime'])
+            missing = set(options['showtime']) - set(showtimes.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"No showtime with ID {', '.join(map(str, sorted(missing)))}")
+        elif options['date']:
+            day_start, day_end = day_bounds(self.day(options['date']))
+            showtimes = Showtime.objects.filter(start_time__gte=day_start, start_time__lt=day_end)
+            if options['cinema']:
+                showtimes = showtimes.filter(screen__cinema_id=options['cinema'])
+        else:
+            raise CommandError('Pass --showtime <id> or --date <date>')
+
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+        written = total = 0
+        # Admissions just recorded online must be in the snapshot
+        with pin_to_primary():
+            for showtime in showtimes.order_by('start_time', 'id'):
+                path = output / f'showtime-{showtime.id}.snapshot'
+                path.write_text(dump_snapshot(showtime), encoding='ascii')
+                size = path.stat().st_size
+                total += size
+                written += 1
+                self.stdout.write(f"  {path.name}: {showtime} ({size:,} bytes)")
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Wrote {written} snapshots ({total:,} bytes) to {output}"))
+
+    def day(self, value):
+        if value == 'today':
+            return timezone.localdate()
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Invalid --date '{value}'; use YYYY-MM-DD or today")
@@ -0,0 +1,51 @@
+# Run with: python manage.py import_file schedules distributor-week-45.csv
+#       or: python manage.py import_file bookings partner-batch.jsonl --rejects partner-batch.rejects.jsonl
+#       or: python manage.py import_file admissions scanner-gate-2.jsonl
+# Streams the file in batches; rows that fail validation are written to the reject file.
+
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from booking.importer import FORMATS, IMPORTERS, RejectWriter, detect_format, read_rows
+
+class Command(BaseCommand):
+    help = 'Bulk-import distributor schedules, partner bookings or offline ticket scans from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help='What the file contains')
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--rejects', help='Reject file (default: <path>.rejects.<format>)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate without writing anything')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f"No such file: {path}")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        fmt = options['format'] or detect_format(path)
+        rejects_path = Path(options['rejects'] or f"{path}.rejects.{fmt}")
+
+        importer = IMPORTERS[options['kind']](batch_size=options['batch_size'], dry_run=options['dry_run'])
+        started = time.monotonic()
+        with path.open(newline='', encoding='utf-8-sig') as source, \
+                rejects_path.open('w', newline='', encoding='utf-8') as reject_file:
+            rejects = RejectWriter(reject_file, fmt)
+            stats = importer.run(read_rows(source, fmt), rejects, progress=self.progress)
+        elapsed = time.monotonic() - started
+        if not stats.rejected:
+            rejects_path.unlink()
+
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        rate = stats.read / elapsed if elapsed else stats.read
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ {verb} {stats.imported:,} of {stats.read:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)"
+        ))
+        if stats.rejected:
+            self.stdout.write(self.style.WARNING(f"{stats.rejected:,} rejected rows written to {rejects_path}"))
+
+    def progress(self, read, imported, rejected):
+        self.stdout.write(f"  {read:,} rows read, {imported:,} imported, {rejected:,} rejected")
@@ -0,0 +1,138 @@
+# Run with: python manage.py loadtest --users 100 --iterations 3
+# Simulates a premiere sell-out against a throwaway copy of the schema; the
+# real database is never touched.
+
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from django.utils import timezone
+from booking import loadtest
+
+class Command(BaseCommand):
+    help = 'Load-test the booking flow with concurrent virtual users and save the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Concurrent virtual users')
+        parser.add_argument('--iterations', type=int, default=3, help='Booking flows per virtual user')
+        parser.add_argument('--seats', type=int, default=2, help='Seats per booking')
+        parser.add_argument('--showtimes', type=int, default=1, help='Premiere showtimes the users compete for')
+        parser.add_argument('--cinemas', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Result file (default: loadtest-results/<timestamp>-<commit>.json)')
+
+    def handle(self, *args, **options):
+        connection = connections['default']
+        if connection.vendor == 'sqlite':
+            # A file, not :memory:, so server threads share it the way workers would
+            handle, path = tempfile.mkstemp(prefix='loadtest-', suffix='.sqlite3')
+            os.close(handle)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+
+        # Behave like production: no debug query log, catalog on the primary.
+        # Every simulated customer comes from 127.0.0.1 and several flows of one
+        # customer can be at the payment step at once.
+        with override_settings(
+            DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'], DATABASE_REPLICAS=[],
+            HOLD_THROTTLE_RATES={}, HOLD_QUOTAS={},
+        ):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = options['output']
+        if not output:
+            stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+            output = Path('loadtest-results') / f"{stamp}-{results['git_revision'] or 'nogit'}.json"
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+
+        self.report(results)
+        if results['crashed_users']:
+            raise CommandError(f"{results['crashed_users']} virtual users crashed: {results['crashes'][0]}")
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Results saved to {output}"))
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        self.stdout.write('Seeding dataset...')
+        premiere, users = loadtest.seed_dataset(rng, cinemas=options['cinemas'], users=options['users'])
+        showtimes = premiere[:options['showtimes']]
+        cookies = [loadtest.login_cookies(user) for user in users]
+
+        recorder = loadtest.Recorder()
+        counter = loadtest.QueryCounter()
+        self.stdout.write(f"Running {options['users']} virtual users x {options['iterations']} flows...")
+        with loadtest.LocalServer(counter) as server:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['users']) as pool:
+                futures = [
+                    pool.submit(
+                        loadtest.run_virtual_user, recorder, server.port, user_cookies, showtimes,
+                        options['iterations'], options['seats'], options['seed'] * 100003 + i,
+                    )
+                    for i, user_cookies in enumerate(cookies)
+                ]
+            duration = time.perf_counter() - started
+        # A virtual user that crashed stopped booking; its flows must not vanish from the report
+        crashes = [repr(future.exception()) for future in futures if future.exception() is not None]
+
+        total_requests = sum(len(values) for values in recorder.latencies.values())
+        return {
+            'git_revision': loadtest.git_revision(),
+            'finished_at': timezone.now().isoformat(),
+            'config': {
+                'users': options['users'],
+                'iterations': options['iterations'],
+                'seats_per_booking': options['seats'],
+                'showtimes': len(showtimes),
+                'seats_on_sale': sum(showtime.screen.total_seats for showtime in showtimes),
+                'seed': options['seed'],
+                'db_vendor': connections['default'].vendor,
+                'session_engine': settings.SESSION_ENGINE,
+            },
+            'duration_s': round(duration, 3),
+            'throughput_rps': round(total_requests / duration, 2),
+            'flows': dict(recorder.flows),
+            'crashed_users': len(crashes),
+            'crashes': sorted(set(crashes)),
+            'endpoints': loadtest.endpoint_summary(recorder, duration),
+            'server': {
+                'queries': counter.queries,
+                'session_queries': counter.session_queries,
+                'queries_per_request': round(counter.queries / max(total_requests, 1), 2),
+            },
+            'double_booked_seats': loadtest.double_bookings(),
+            **loadtest.booking_totals(),
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"\n{results['throughput_rps']} req/s over {results['duration_s']}s; flows: {results['flows']}"
+        )
+        self.stdout.write(f"{'endpoint':<20}{'reqs':>7}{'err%':>8}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}")
+        for name, row in results['endpoints'].items():
+            self.stdout.write(
+                f"{name:<20}{row['requests']:>7}{row['error_rate'] * 100:>8.2f}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+        self.stdout.write(
+            f"SQL queries: {results['server']['queries']} "
+            f"({results['server']['session_queries']} on django_session)"
+        )
+        if results['crashes']:
+            self.stdout.write(self.style.ERROR(f"Crashed virtual users: {results['crashed_users']}"))
+            for crash in results['crashes']:
+                self.stdout.write(self.style.ERROR(f"  {crash}"))
+        style = self.style.ERROR if results['double_booked_seats'] else self.style.SUCCESS
+        self.stdout.write(style(f"Double-booked seats: {results['double_booked_seats']}"))
@@ -0,0 +1,42 @@
+# Run with: python manage.py purge_sessions
+# Schedule it (e.g. hourly from cron) to keep django_session from growing without bound.
+
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions from the database in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to sleep between batches so writers are not starved')
+
+    def handle(self, *args, **options):
+        # Unlike clearsessions, which deletes everything in one statement,
+        # batches keep each write transaction (and SQLite's write lock) short.
+        cutoff = timezone.now()
+        batch_size = options['batch_size']
+        total = 0
+        started = time.monotonic()
+
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=cutoff)
+                .values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                break
+            deleted, _ = Session.objects.filter(session_key__in=keys).delete()
+            total += deleted
+            if len(keys) < batch_size:
+                break
+            time.sleep(options['pause'])
+
+        elapsed = time.monotonic() - started
+        if total:
+            self.stdout.write(self.style.SUCCESS(f"✅ Purged {total} expired session(s) in {elapsed:.2f}s"))
+        else:
+            self.stdout.write("No expired sessions to purge")
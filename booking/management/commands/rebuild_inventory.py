@@ -0,0 +1,32 @@
+# Run with: python manage.py rebuild_inventory
+# Backfills the seats-together index (booking/inventory.py), e.g. after a bulk
+# import or generate_dataset; reservation changes keep it current afterwards.
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from booking.inventory import REFRESH_BATCH, refresh_inventory
+from booking.models import Showtime
+
+class Command(BaseCommand):
+    help = 'Rebuild the free-seat and seats-together index of upcoming showtimes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Include showtimes that have already started')
+        parser.add_argument('--missing', action='store_true', help='Only showtimes that are not indexed yet')
+
+    def handle(self, *args, **options):
+        showtimes = Showtime.objects.order_by('id')
+        if not options['all']:
+            showtimes = showtimes.filter(start_time__gte=timezone.now())
+        if options['missing']:
+            showtimes = showtimes.filter(inventory__isnull=True)
+        ids = list(showtimes.values_list('id', flat=True))
+
+        started = time.monotonic()
+        for offset in range(0, len(ids), REFRESH_BATCH):
+            refresh_inventory(ids[offset:offset + REFRESH_BATCH])
+            self.stdout.write(f"  {min(offset + REFRESH_BATCH, len(ids))}/{len(ids)}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Indexed {len(ids)} showtime(s) in {elapsed:.2f}s"))
@@ -2,6 +2,9 @@
 # Run with: python manage.py release_cancelled_seats
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from booking import events, metrics, waitlist
+from booking.inventory import lock_showtimes, refresh_inventory
 from booking.models import Booking, SeatBooking
 
 class Command(BaseCommand):
@@ -18,10 +21,12 @@ class Command(BaseCommand):
             # Get seat IDs from this booking
             seat_ids = list(booking.seats.values_list('id', flat=True))
             
-            # Find SeatBooking records that are still marked as booked
+            # Find SeatBooking records that are still marked as booked for it
+            # (a seat released earlier may have been sold to someone else since)
             still_booked = SeatBooking.objects.filter(
                 showtime=booking.showtime,
                 seat_id__in=seat_ids,
+                booking=booking,
                 is_booked=True
             )
             
@@ -31,8 +36,14 @@ class Command(BaseCommand):
                 self.stdout.write(f"  Seats still marked as booked: {still_booked.count()}")
                 
                 # Release them
-                released = still_booked.update(is_booked=False, booking=None)
+                with transaction.atomic():
+                    lock_showtimes([booking.showtime_id])
+                    released = still_booked.update(is_booked=False, booking=None)
+                    events.record('seats.released', booking, count=released, reason='cleanup')
+                    refresh_inventory([booking.showtime_id])
+                    waitlist.offer_released_seats(booking.showtime)
                 total_released += released
+                metrics.SEATS_RELEASED.labels(reason='cleanup').inc(released)
                 
                 self.stdout.write(self.style.SUCCESS(f"  ✓ Released {released} seats"))
         
@@ -0,0 +1,72 @@
+# Run with: python manage.py schedule_showtimes --movie 1 --cinema 2 --start 2026-11-01 --weeks 4 --slots 10:00 13:30 19:00 --price 350
+
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from booking.models import Movie, Screen
+from booking.scheduling import plan_showtimes, schedule_showtimes
+
+class Command(BaseCommand):
+    help = 'Generate recurring showtimes for a movie, skipping slots that overlap existing ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movie', type=int, required=True, help='Movie ID')
+        parser.add_argument('--screens', type=int, nargs='+', default=[], help='Screen IDs')
+        parser.add_argument('--cinema', type=int, action='append', default=[], help='Use every screen of this cinema (repeatable)')
+        parser.add_argument('--start', required=True, help='First day, YYYY-MM-DD')
+        parser.add_argument('--weeks', type=int, default=1)
+        parser.add_argument('--slots', nargs='+', required=True, help='Daily start times, HH:MM')
+        parser.add_argument('--price', required=True, help='Ticket price, e.g. 350 or 299.50')
+        parser.add_argument('--weekdays', type=int, nargs='*', help='Only these weekdays (0=Monday)')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be created without writing')
+
+    def handle(self, *args, **options):
+        try:
+            movie = Movie.objects.get(id=options['movie'])
+        except Movie.DoesNotExist:
+            raise CommandError(f"Movie {options['movie']} does not exist")
+
+        screens = Screen.objects.filter(id__in=options['screens'])
+        if options['cinema']:
+            screens = screens | Screen.objects.filter(cinema_id__in=options['cinema'])
+        screens = list(screens.select_related('cinema'))
+        if not screens:
+            raise CommandError('No screens selected; pass --screens or --cinema')
+
+        try:
+            start_date = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            slots = sorted({datetime.strptime(s, '%H:%M').time() for s in options['slots']})
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        price = self.price(options['price'])
+
+        args = (movie, screens, start_date, options['weeks'], slots, price, options['weekdays'])
+        started = time.monotonic()
+        if options['dry_run']:
+            result = plan_showtimes(*args)
+        else:
+            result = schedule_showtimes(*args)
+        elapsed = time.monotonic() - started
+
+        for screen, start, end in result.conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"  Skipped {screen} {start:%Y-%m-%d %H:%M}-{end:%H:%M}: overlaps an existing showtime"
+            ))
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ {verb} {len(result.showtimes)} showtime(s) for {movie.title} on {len(screens)} screen(s) "
+            f"in {elapsed:.2f}s ({len(result.conflicts)} conflict(s))"
+        ))
+
+    def price(self, value):
+        # Same bounds as Showtime.price: 6 digits, 2 of them decimals
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            raise CommandError(f"Invalid --price '{value}'; use a number such as 350 or 299.50")
+        if not price.is_finite() or price <= 0 or price >= 10000 or price != price.quantize(Decimal('0.01')):
+            raise CommandError(f"Invalid --price '{value}'; it must be above 0 and below 10000, with at most 2 decimals")
+        return price
@@ -0,0 +1,88 @@
+# Run with: python manage.py stress_booking --workers 16 --operations 50
+#       or: python manage.py stress_booking --processes --workers 8 --seed 7
+# Many customers fight over the same seats of one showtime (holds, payments,
+# double payments, cancellations) against a throwaway file database, then the
+# bookings are audited. Exits with an error if any invariant is broken.
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from booking import loadtest
+from booking.stress import StressConfig, run_stress
+
+class Command(BaseCommand):
+    help = 'Stress seat booking with concurrent workers and check that no seat is sold twice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent customers')
+        parser.add_argument('--operations', type=int, default=25, help='Attempts per worker')
+        parser.add_argument('--hot-seats', type=int, default=24, help='Seats all workers compete for')
+        parser.add_argument('--max-party', type=int, default=3, help='Most seats per booking')
+        parser.add_argument('--processes', action='store_true', help='Fork a process per worker instead of a thread')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Also save the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['operations'] < 1 or options['max_party'] < 1:
+            raise CommandError('--workers, --operations and --max-party must be at least 1')
+        config = StressConfig(
+            workers=options['workers'], operations=options['operations'], hot_seats=options['hot_seats'],
+            max_party=options['max_party'], processes=options['processes'], seed=options['seed'],
+        )
+
+        connection = connections['default']
+        if connection.vendor == 'sqlite':
+            # A file, not :memory:, so threads and processes share it the way workers would
+            handle, path = tempfile.mkstemp(prefix='stress-', suffix='.sqlite3')
+            os.close(handle)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+
+        with override_settings(
+            DEBUG=False,
+            # Workers go through django.test.Client
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            DATABASE_REPLICAS=[],
+            # Under contention every request is "slow"; don't log them all
+            SLOW_REQUEST_MS=float('inf'),
+            # Workers come from one address, book far faster than people and abandon holds on purpose
+            HOLD_THROTTLE_RATES={},
+            HOLD_QUOTAS={},
+        ):
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.stdout.write(f"Running {config.workers} {'processes' if config.processes else 'threads'} "
+                                  f"x {config.operations} operations on {config.hot_seats} seats...")
+                results = {'git_revision': loadtest.git_revision(), **run_stress(config)}
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results)
+        if options['output']:
+            output = Path(options['output'])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Results saved to {output}")
+        if results['violations']:
+            raise CommandError(f"{len(results['violations'])} invariant violations")
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ All invariants hold: {results['seats_sold']} seats sold, "
+            f"{results['operations_per_s']} operations/s ({results['requests_per_s']} requests/s)"
+        ))
+
+    def report(self, results):
+        self.stdout.write(
+            f"\n{results['operations']} operations, {results['requests']} requests in {results['duration_s']}s; "
+            f"errors: {results['errors']}"
+        )
+        self.stdout.write(f"{'operation':<10}{'p50ms':>10}{'p95ms':>10}{'maxms':>10}  outcomes")
+        for kind, latency in results['latency_ms'].items():
+            outcomes = ', '.join(f'{outcome} {count}' for outcome, count in sorted(results['outcomes'][kind].items()))
+            self.stdout.write(f"{kind:<10}{latency['p50']:>10}{latency['p95']:>10}{latency['max']:>10}  {outcomes}")
+        for violation in results['violations']:
+            self.stdout.write(self.style.ERROR(f"  {violation}"))
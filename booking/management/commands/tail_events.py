@@ -0,0 +1,80 @@
+# Run with: python manage.py tail_events --follow
+#       or: python manage.py tail_events --consumer analytics --json
+# Prints the booking event log (booking/events.py) from an event ID, or from
+# where a named consumer left off, advancing that consumer's cursor.
+
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from booking import events
+
+class Command(BaseCommand):
+    help = 'Print booking events after a cursor, optionally following the log as it grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, help='Start after this event ID (default: 0, or the consumer cursor)')
+        parser.add_argument('--consumer', help='Resume from and advance this named cursor')
+        parser.add_argument('--kind', action='append', default=[], help='Only print events of this kind (repeatable)')
+        parser.add_argument('--follow', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --follow')
+        parser.add_argument('--limit', type=int, default=500, help='Events per batch')
+        parser.add_argument('--json', action='store_true', help='Print one JSON object per line')
+
+    def handle(self, *args, **options):
+        unknown = set(options['kind']) - set(events.KINDS)
+        if unknown:
+            raise CommandError(f"Unknown kind {', '.join(sorted(unknown))}; choose from {', '.join(events.KINDS)}")
+        if options['limit'] < 1:
+            raise CommandError('--limit must be at least 1')
+        self.kinds = set(options['kind'])
+        self.json = options['json']
+        consumer = options['consumer']
+        position = options['after']
+        if position is None:
+            position = events.position(consumer) if consumer else 0
+        elif consumer:
+            raise CommandError('--after and --consumer are exclusive; the consumer resumes from its cursor')
+
+        printed = 0
+        try:
+            while True:
+                if consumer:
+                    handled = events.consume(consumer, self.show, options['limit'])
+                else:
+                    batch = events.read_events(position, options['limit'])
+                    self.show(batch)
+                    handled = len(batch)
+                    position = batch[-1].id if batch else position
+                printed += handled
+                if handled == options['limit']:
+                    continue
+                if not options['follow']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        if not self.json:
+            self.stdout.write(self.style.SUCCESS(f"\n✅ Read {printed} events"))
+
+    def show(self, batch):
+        for event in batch:
+            if self.kinds and event.kind not in self.kinds:
+                continue
+            if self.json:
+                self.stdout.write(json.dumps({
+                    'id': event.id,
+                    'kind': event.kind,
+                    'booking': event.booking_id,
+                    'showtime': event.showtime_id,
+                    'created_at': event.created_at,
+                    'data': event.data,
+                }, cls=DjangoJSONEncoder))
+                continue
+            data = ' '.join(f'{key}={value}' for key, value in event.data.items())
+            self.stdout.write(
+                f"#{event.id:<8} {timezone.localtime(event.created_at):%Y-%m-%d %H:%M:%S} {event.kind:<24}"
+                f"booking={event.booking_id} showtime={event.showtime_id} {data}".rstrip()
+            )
@@ -0,0 +1,67 @@
+# Run with: python manage.py warm_showtimes --movie 12 --workers 8
+#       or: python manage.py warm_showtimes --release 2026-11-06
+# Schedule it for the on-sale time of a release, e.g. from cron:
+#   0 9 * * * cd /srv/cinema && python manage.py warm_showtimes --release today
+
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from booking import warming
+from booking.models import Movie
+
+class Command(BaseCommand):
+    help = "Precompute the caches behind a movie's upcoming showtimes before its tickets go on sale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movie', type=int, action='append', default=[], help='Movie ID (repeatable)')
+        parser.add_argument('--release', help='Warm the movies released on this date: YYYY-MM-DD or "today"')
+        parser.add_argument('--workers', type=int, default=4, help='Parallel warming threads')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        if options['movie']:
+            missing = set(options['movie']) - set(Movie.objects.filter(id__in=options['movie']).values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"No movie with ID {', '.join(map(str, sorted(missing)))}")
+            report = warming.warm_movies(options['movie'], options['workers'])
+        elif options['release']:
+            report = warming.warm_release(self.release_day(options['release']), options['workers'])
+        else:
+            raise CommandError('Pass --movie <id> or --release <date>')
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'movies': report.movies,
+                'showtimes': report.showtimes,
+                'workers': report.workers,
+                'wall_s': round(report.wall, 3),
+                'steps': {step: {**values, 'seconds': round(values['seconds'], 3)} for step, values in report.steps.items()},
+            }, indent=2))
+            return
+
+        self.stdout.write(f"Movies: {', '.join(map(str, report.movies)) or 'none'}; upcoming showtimes: {report.showtimes}")
+        self.stdout.write(f"{'step':<14}{'tasks':>7}{'items':>8}{'total s':>10}{'avg ms':>9}")
+        for step in warming.STEPS:
+            values = report.steps.get(step)
+            if not values:
+                continue
+            average = values['seconds'] / values['tasks'] * 1000
+            self.stdout.write(
+                f"{step:<14}{values['tasks']:>7}{values['items']:>8}{values['seconds']:>10.3f}{average:>9.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Warmed {report.showtimes} showtimes of {len(report.movies)} movies "
+            f"in {report.wall:.2f}s with {report.workers} workers"
+        ))
+
+    def release_day(self, value):
+        if value == 'today':
+            return timezone.localdate()
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Invalid --release date '{value}'; use YYYY-MM-DD or today")
@@ -0,0 +1,329 @@
+"""In-process metrics with Prometheus text exposition.
+
+Every worker process keeps its counters and histograms in memory and a
+background thread snapshots them to ``METRICS_DIR/<pid>-<start>.json`` at
+most every METRICS_FLUSH_INTERVAL seconds. The /metrics endpoint adds up
+the snapshots of all processes, including ones that have exited, so totals
+stay monotonic across restarts: snapshots of processes that are gone are
+folded into ``cumulative.json`` and deleted, so the directory holds one file
+per live process. Process liveness is checked by PID, so the directory must
+not be shared between hosts. Gauges are computed from the database when
+scraped, which makes them exact whatever the number of workers.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CUMULATIVE = 'cumulative.json'
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    inner = ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"')) for k, v in pairs)
+    return '{' + inner + '}'
+
+
+def _serialize(values):
+    """{name: {label key: value}} as JSON-friendly snapshot entries"""
+    return {
+        name: [[list(map(list, key)), value] for key, value in entries.items()]
+        for name, entries in values.items()
+    }
+
+
+def _merge(merged, snapshot):
+    """Add the values of a snapshot into ``merged``"""
+    for name, entries in snapshot.items():
+        target = merged.setdefault(name, {})
+        for key, value in entries:
+            key = tuple(tuple(pair) for pair in key)
+            if isinstance(value, dict):
+                state = target.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                state['buckets'] = [a + b for a, b in zip(state['buckets'], value['buckets'])]
+                state['sum'] += value['sum']
+                state['count'] += value['count']
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def _process_alive(process_id):
+    """Whether the process of a ``<pid>-<start>`` snapshot is still running on this host"""
+    pid = process_id.split('-', 1)[0]
+    if not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        # An earlier process that had our PID; ours is skipped by the caller
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def labels(self, **labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return BoundMetric(self, _label_key(labels))
+
+
+class BoundMetric:
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1):
+        self.metric._inc(self.key, amount)
+
+    def observe(self, value):
+        self.metric._observe(self.key, value)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self._inc((), amount)
+
+    def _inc(self, key, amount):
+        with self.registry.lock:
+            values = self.registry.values.setdefault(self.name, {})
+            values[key] = values.get(key, 0) + amount
+        self.registry.changed()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def _observe(self, key, value):
+        with self.registry.lock:
+            values = self.registry.values.setdefault(self.name, {})
+            state = values.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+        self.registry.changed()
+
+
+class Gauge(Metric):
+    """Value computed at scrape time by ``function``, returning {labels: value} or a number"""
+
+    kind = 'gauge'
+
+    def __init__(self, registry, name, documentation, function, labelnames=()):
+        super().__init__(registry, name, documentation, labelnames)
+        self.function = function
+
+    def collect(self):
+        result = self.function()
+        if isinstance(result, dict):
+            return {_label_key(labels): value for labels, value in result.items()}
+        return {(): result}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.values = {}
+        self.lock = threading.Lock()
+        self.process_id = f"{os.getpid()}-{int(time.time())}"
+        self._dirty = threading.Event()
+        self._flusher = None
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function, labelnames=()):
+        return self._register(Gauge(self, name, documentation, function, labelnames))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    # Persistence across processes
+
+    def directory(self):
+        return Path(settings.METRICS_DIR)
+
+    def changed(self):
+        if self._flusher is None or self._flusher.pid != os.getpid():
+            self._start_flusher()
+        self._dirty.set()
+
+    def _start_flusher(self):
+        with self.lock:
+            if self._flusher is not None and self._flusher.pid == os.getpid():
+                return
+            # A forked worker must not overwrite its parent's snapshot
+            self.process_id = f"{os.getpid()}-{int(time.time())}"
+            thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+            thread.pid = os.getpid()
+            self._flusher = thread
+        thread.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        self._dirty.clear()
+        with self.lock:
+            snapshot = _serialize(self.values)
+        directory = self.directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._write_json(directory / f"{self.process_id}.json", snapshot)
+
+    @contextmanager
+    def _directory_lock(self):
+        """Serialize compaction and scrapes between processes"""
+        directory = self.directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _write_json(self, path, data):
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, path)
+
+    def _compact(self, cumulative):
+        """Fold the snapshots of processes that have exited into ``cumulative`` and delete them"""
+        # Left behind if we crashed between writing cumulative.json and deleting them
+        for process_id in cumulative['processes']:
+            (self.directory() / f"{process_id}.json").unlink(missing_ok=True)
+        values = {}
+        _merge(values, cumulative['values'])
+        folded = []
+        for path in self.directory().glob('*-*.json'):
+            if path.stem == self.process_id or _process_alive(path.stem):
+                continue
+            try:
+                _merge(values, json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+            folded.append(path.stem)
+        cumulative['processes'] = folded
+        if folded:
+            cumulative['values'] = _serialize(values)
+            self._write_json(self.directory() / CUMULATIVE, cumulative)
+            for process_id in folded:
+                (self.directory() / f"{process_id}.json").unlink(missing_ok=True)
+
+    def merged_values(self):
+        """Counter and histogram values summed over every process snapshot"""
+        self.flush()
+        with self._directory_lock():
+            path = self.directory() / CUMULATIVE
+            try:
+                cumulative = json.loads(path.read_text())
+            except (OSError, ValueError):
+                cumulative = {'processes': [], 'values': {}}
+            self._compact(cumulative)
+            merged = {}
+            _merge(merged, cumulative['values'])
+            for path in self.directory().glob('*-*.json'):
+                try:
+                    _merge(merged, json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+        return merged
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4)"""
+        merged = self.merged_values()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            if metric.kind == 'gauge':
+                values = metric.collect()
+            else:
+                values = merged.get(name, {})
+            for key, value in sorted(values.items()):
+                if metric.kind == 'histogram':
+                    for bound, count in zip(metric.buckets, value['buckets']):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {value['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {value['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _held_seats():
+    from .models import SeatBooking
+    return SeatBooking.objects.filter(is_booked=True, booking__status='Pending').count()
+
+
+def _sold_seats():
+    from .archive import archived_sold_seats
+    from .models import SeatBooking
+    return SeatBooking.objects.filter(is_booked=True, booking__status='Confirmed').count() + archived_sold_seats()
+
+
+REGISTRY = Registry()
+
+SEAT_HOLDS = REGISTRY.counter(
+    'booking_holds_total', 'Pending bookings created from seat selection')
+SEATS_HELD = REGISTRY.counter(
+    'booking_seats_held_total', 'Seats put on hold by seat selection')
+HOLDS_REFUSED = REGISTRY.counter(
+    'booking_holds_refused_total', 'Seat selections refused by the hold throttle or quotas', ['reason'])
+CONFIRMATIONS = REGISTRY.counter(
+    'booking_confirmations_total', 'Bookings confirmed by a completed payment', ['payment_method'])
+PAYMENT_DURATION = REGISTRY.histogram(
+    'booking_payment_duration_seconds', 'Time spent processing a payment', ['payment_method'])
+CANCELLATIONS = REGISTRY.counter(
+    'booking_cancellations_total', 'Cancellation requests by outcome', ['outcome'])
+SEATS_RELEASED = REGISTRY.counter(
+    'booking_seats_released_total', 'Seats returned to sale', ['reason'])
+HELD_SEATS = REGISTRY.gauge(
+    'booking_held_seats', 'Seats currently held by pending bookings', _held_seats)
+SOLD_SEATS = REGISTRY.gauge(
+    'booking_sold_seats', 'Seats currently sold to confirmed bookings', _sold_seats)
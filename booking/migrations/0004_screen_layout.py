@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0003_payment_refund_amount_payment_refund_date_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="screen",
+            name="layout",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="screen",
+            name="total_seats",
+            field=models.IntegerField(default=0),
+        ),
+    ]
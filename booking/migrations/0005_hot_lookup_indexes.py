@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-19 08:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0004_screen_layout"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["user", "-booking_date"], name="booking_user_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["status", "booking_date"], name="booking_status_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cancellationrequest",
+            index=models.Index(
+                fields=["status", "-request_date"], name="cancellation_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="seatbooking",
+            index=models.Index(
+                condition=models.Q(("is_booked", True)),
+                fields=["showtime", "seat"],
+                name="seatbooking_booked_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="showtime",
+            index=models.Index(
+                fields=["movie", "start_time"], name="showtime_movie_start_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="showtime",
+            index=models.Index(
+                fields=["screen", "start_time"], name="showtime_screen_start_idx"
+            ),
+        ),
+        # auth.User belongs to another app, so its email index is raw SQL;
+        # login_view looks users up by email.
+        migrations.RunSQL(
+            sql="CREATE INDEX booking_user_email_idx ON auth_user (email)",
+            reverse_sql="DROP INDEX booking_user_email_idx",
+        ),
+    ]
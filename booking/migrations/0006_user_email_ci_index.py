@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0005_hot_lookup_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # EmailBackend looks users up by LOWER(email), which the plain index
+        # on email cannot serve, so it is replaced by an index on LOWER(email).
+        # The partial unique index keeps emails unique regardless of case while
+        # still allowing users without one; being partial, the planner cannot
+        # use it for lookups that don't exclude empty emails.
+        migrations.RunSQL(
+            sql="DROP INDEX booking_user_email_idx",
+            reverse_sql="CREATE INDEX booking_user_email_idx ON auth_user (email)",
+        ),
+        migrations.RunSQL(
+            sql="CREATE INDEX booking_user_email_ci_idx ON auth_user (LOWER(email))",
+            reverse_sql="DROP INDEX booking_user_email_ci_idx",
+        ),
+        migrations.RunSQL(
+            sql="CREATE UNIQUE INDEX booking_user_email_ci_uniq ON auth_user (LOWER(email)) WHERE email <> ''",
+            reverse_sql="DROP INDEX booking_user_email_ci_uniq",
+        ),
+    ]
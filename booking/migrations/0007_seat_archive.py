@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-19 08:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0006_user_email_ci_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SeatArchive",
+            fields=[
+                (
+                    "showtime",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="seat_archive",
+                        serialize=False,
+                        to="booking.showtime",
+                    ),
+                ),
+                ("first_seat_id", models.BigIntegerField()),
+                ("bitmap", models.BinaryField()),
+                ("bookings", models.BinaryField()),
+                ("sold_seats", models.IntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
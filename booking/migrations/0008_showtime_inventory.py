@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 08:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0007_seat_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShowtimeInventory",
+            fields=[
+                (
+                    "showtime",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="inventory",
+                        serialize=False,
+                        to="booking.showtime",
+                    ),
+                ),
+                ("seats_left", models.IntegerField()),
+                ("longest_run", models.IntegerField()),
+                ("longest_regular", models.IntegerField(default=0)),
+                ("longest_premium", models.IntegerField(default=0)),
+                ("longest_vip", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-19 08:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booking", "0008_showtime_inventory"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Admission",
+            fields=[
+                (
+                    "booking",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="admission",
+                        serialize=False,
+                        to="booking.booking",
+                    ),
+                ),
+                ("admitted_at", models.DateTimeField()),
+                ("gate", models.CharField(blank=True, max_length=50)),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("online", "Online"), ("offline", "Offline")],
+                        default="online",
+                        max_length=10,
+                    ),
+                ),
+                ("recorded_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "showtime",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="admissions",
+                        to="booking.showtime",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 class Cinema(models.Model):
@@ -35,10 +37,23 @@ class Movie(models.Model):
 class Screen(models.Model):
     cinema = models.ForeignKey(Cinema, on_delete=models.CASCADE, related_name='screens')
     name = models.CharField(max_length=50)
-    total_seats = models.IntegerField()
+    total_seats = models.IntegerField(default=0)
+    # Compressed normalized seat map, written by booking.layouts.apply_layout
+    layout = models.BinaryField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.cinema.name} - {self.name}"
+    
+    def get_layout(self):
+        """Decoded ScreenLayout, or None if seats were not generated from a layout"""
+        if not self.layout:
+            return None
+        from .layouts import ScreenLayout
+        return ScreenLayout.decode(self.layout)
+    
+    def refresh_total_seats(self):
+        self.total_seats = self.seats.count()
+        self.save(update_fields=['total_seats'])
 
 class Showtime(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='showtimes')
@@ -49,9 +64,26 @@ class Showtime(models.Model):
     
     class Meta:
         ordering = ['start_time']
+        indexes = [
+            models.Index(fields=['movie', 'start_time'], name='showtime_movie_start_idx'),
+            models.Index(fields=['screen', 'start_time'], name='showtime_screen_start_idx'),
+        ]
     
     def __str__(self):
         return f"{self.movie.title} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
+    
+    def clean(self):
+        """Reject showtimes that overlap another one on the same screen"""
+        if not (self.screen_id and self.movie_id and self.start_time and self.end_time):
+            return
+        if self.end_time <= self.start_time:
+            raise ValidationError({'end_time': 'End time must be after the start time.'})
+        from .scheduling import find_overlap
+        other = find_overlap(self)
+        if other is not None:
+            raise ValidationError(
+                f"Overlaps {other} on {self.screen} (including cleaning time)."
+            )
 
 class Seat(models.Model):
     SEAT_TYPE_CHOICES = [
@@ -87,6 +119,12 @@ class Booking(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     booking_reference = models.CharField(max_length=20, unique=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-booking_date'], name='booking_user_date_idx'),
+            models.Index(fields=['status', 'booking_date'], name='booking_status_date_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.booking_reference} - {self.user.username}"
     
@@ -158,6 +196,9 @@ class CancellationRequest(models.Model):
     
     class Meta:
         ordering = ['-request_date']
+        indexes = [
+            models.Index(fields=['status', '-request_date'], name='cancellation_status_idx'),
+        ]
     
     def __str__(self):
         return f"Cancellation Request - {self.booking.booking_reference} ({self.status})"
@@ -171,6 +212,131 @@ class SeatBooking(models.Model):
     
     class Meta:
         unique_together = ['showtime', 'seat']
+        indexes = [
+            # Covers the booked-seat lookup in select_seats without touching
+            # the rows of released seats.
+            models.Index(
+                fields=['showtime', 'seat'],
+                condition=models.Q(is_booked=True),
+                name='seatbooking_booked_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.showtime} - {self.seat}"
+
+
+class SeatArchive(models.Model):
+    """Compacted SeatBooking rows of a showtime that has ended, written by booking.archive"""
+    showtime = models.OneToOneField(Showtime, on_delete=models.CASCADE, primary_key=True, related_name='seat_archive')
+    # Booked seats as a bitmap of offsets from first_seat_id
+    first_seat_id = models.BigIntegerField()
+    bitmap = models.BinaryField()
+    # Compressed {booking id: [seat offsets]} for the booked seats
+    bookings = models.BinaryField()
+    sold_seats = models.IntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.showtime} - {self.sold_seats} seats (archived)"
+    
+    def booked_seat_ids(self):
+        from .archive import unpack_bitmap
+        return unpack_bitmap(self.first_seat_id, self.bitmap)
+    
+    def seat_bookings(self):
+        """{seat id: booking id} for every seat sold when the showtime was archived"""
+        from .archive import unpack_bookings
+        return unpack_bookings(self.first_seat_id, self.bookings)
+
+class ShowtimeInventory(models.Model):
+    """Free-seat summary of a showtime, rebuilt by booking.inventory on every reservation change"""
+    showtime = models.OneToOneField(Showtime, on_delete=models.CASCADE, primary_key=True, related_name='inventory')
+    seats_left = models.IntegerField()
+    # Longest run of adjacent free seats in one row, overall and per seat type
+    longest_run = models.IntegerField()
+    longest_regular = models.IntegerField(default=0)
+    longest_premium = models.IntegerField(default=0)
+    longest_vip = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.showtime} - {self.seats_left} left, {self.longest_run} together"
+
+class Admission(models.Model):
+    """A ticket let in at the door, recorded by booking.checkin; at most one per booking"""
+    SOURCE_CHOICES = [
+        ('online', 'Online'),
+        ('offline', 'Offline'),
+    ]
+    
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, primary_key=True, related_name='admission')
+    showtime = models.ForeignKey(Showtime, on_delete=models.CASCADE, related_name='admissions')
+    # When the ticket was scanned; for offline scans, the scanner's clock
+    admitted_at = models.DateTimeField()
+    gate = models.CharField(max_length=50, blank=True)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='online')
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.booking_id} admitted at {self.admitted_at:%Y-%m-%d %H:%M}"
+
+class BookingEvent(models.Model):
+    """Append-only log of booking state changes, written by booking.events in the changing transaction"""
+    kind = models.CharField(max_length=40)
+    # No database constraints: events outlive the rows they describe
+    booking = models.ForeignKey(
+        Booking, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='events',
+    )
+    showtime = models.ForeignKey(
+        Showtime, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+',
+    )
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"#{self.id} {self.kind}"
+
+class EventCursor(models.Model):
+    """How far a named consumer has read the BookingEvent log"""
+    name = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} at #{self.position}"
+
+class WaitlistEntry(models.Model):
+    """A party waiting for seats of a showtime, offered released seats by booking.waitlist"""
+    STATUS_CHOICES = [
+        ('Waiting', 'Waiting'),
+        ('Offered', 'Offered'),
+        ('Expired', 'Expired'),
+        ('Cancelled', 'Cancelled'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waitlist_entries')
+    showtime = models.ForeignKey(Showtime, on_delete=models.CASCADE, related_name='waitlist')
+    seats = models.PositiveSmallIntegerField(validators=[MinValueValidator(1)])
+    # Blank for any seat type
+    seat_type = models.CharField(max_length=20, choices=Seat.SEAT_TYPE_CHOICES, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Waiting')
+    # The pending booking holding the seats offered
+    booking = models.OneToOneField(
+        Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    offered_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # The queue of a showtime in arrival order, for the matcher
+            models.Index(
+                fields=['showtime', 'created_at'],
+                condition=models.Q(status='Waiting'),
+                name='waitlist_waiting_idx',
+            ),
+        ]
     
     def __str__(self):
-        return f"{self.showtime} - {self.seat}"
\ No newline at end of file
+        return f"{self.user.username} - {self.seats} seats for {self.showtime} ({self.status})"
@@ -0,0 +1,60 @@
+"""Resized WebP variants of movie posters.
+
+Posters are uploaded at whatever size the distributor sends, often several
+megabytes, while the catalog shows them as cards and on the movie page.
+make_variants writes one WebP per POSTER_WIDTHS entry next to the
+original; the ``poster_url`` template filter serves a variant once it
+exists and falls back to the original, so pages never resize on the fly.
+Variants are made ahead of time by the warm_showtimes command.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+# Name used in templates -> width in pixels
+POSTER_WIDTHS = {'card': 400, 'large': 800}
+VARIANT_DIR = 'variants'
+QUALITY = 80
+
+
+def variant_name(name, width):
+    """Storage name of a poster's variant of this width"""
+    folder, filename = os.path.split(name)
+    stem, _ = os.path.splitext(filename)
+    return os.path.join(folder, VARIANT_DIR, f'{stem}-{width}w.webp')
+
+
+def make_variant(poster, width):
+    """Write one variant unless it already exists; returns True if it was written"""
+    name = variant_name(poster.name, width)
+    if poster.storage.exists(name):
+        return False
+    with poster.storage.open(poster.name, 'rb') as source:
+        image = Image.open(source)
+        image.load()
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=QUALITY, method=4)
+    poster.storage.save(name, ContentFile(buffer.getvalue()))
+    return True
+
+
+def make_variants(movie):
+    """Write the missing variants of a movie's poster; returns how many were written"""
+    if not movie.poster:
+        return 0
+    return sum(make_variant(movie.poster, width) for width in POSTER_WIDTHS.values())
+
+
+def poster_url(movie, size):
+    """URL of the ``size`` variant of a movie's poster, or of the original until it exists"""
+    poster = movie.poster
+    name = variant_name(poster.name, POSTER_WIDTHS[size])
+    if poster.storage.exists(name):
+        return poster.storage.url(name)
+    return poster.url
@@ -0,0 +1,156 @@
+"""Opt-in sampling profiler for live requests.
+
+A request is profiled when it carries a valid profiling token (generated on
+the staff profiles page) in the ``X-Profile-Token`` header or ``_profile``
+query parameter, or when it is picked by the random 1-in-PROFILER_SAMPLE_RATE
+sample. A background thread then samples the request thread's stack every
+PROFILER_INTERVAL seconds and the result is written to PROFILER_DIR in the
+collapsed-stack format read by flamegraph.pl and speedscope.
+
+Requests that are not profiled only pay for a header lookup and, when
+sampling is enabled, one random number.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+TOKEN_PARAM = '_profile'
+TOKEN_SALT = 'booking.profiling'
+PROFILE_SUFFIX = '.collapsed'
+
+
+def make_token(user):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def token_is_valid(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    path = code.co_filename
+    for prefix in sys.path:
+        if prefix and path.startswith(prefix):
+            path = path[len(prefix):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    """Samples one thread's stack from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def profile_dir():
+    return Path(settings.PROFILER_DIR)
+
+
+def save_profile(stacks, view_name, wall):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+    view = (view_name or 'unresolved').replace(':', '-').replace('/', '-')
+    path = directory / f"{stamp}-{view}-{wall * 1000:.0f}ms{PROFILE_SUFFIX}"
+    path.write_text(''.join(f"{stack} {count}\n" for stack, count in stacks.items()))
+
+    # Keep the directory bounded; oldest profiles go first
+    profiles = sorted(directory.glob(f"*{PROFILE_SUFFIX}"))
+    for old in profiles[:-settings.PROFILER_MAX_FILES]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def list_profiles():
+    profiles = []
+    for path in sorted(profile_dir().glob(f"*{PROFILE_SUFFIX}"), reverse=True):
+        stat = path.stat()
+        modified = datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+        profiles.append({'name': path.name, 'size': stat.st_size, 'modified': modified})
+    return profiles
+
+
+class SamplingProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_profile(self, request):
+        token = request.META.get(TOKEN_HEADER)
+        if token is None and TOKEN_PARAM in request.META.get('QUERY_STRING', ''):
+            token = request.GET.get(TOKEN_PARAM)
+        if token is not None:
+            return token_is_valid(token)
+        rate = settings.PROFILER_SAMPLE_RATE
+        return bool(rate) and random.randrange(rate) == 0
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with SamplingProfiler(threading.get_ident(), settings.PROFILER_INTERVAL) as profiler:
+            response = self.get_response(request)
+        return self.save(request, response, profiler, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.should_profile(request):
+            return await self.get_response(request)
+
+        # Samples the event loop thread; work an async view hands to threads is not seen
+        started = time.perf_counter()
+        with SamplingProfiler(threading.get_ident(), settings.PROFILER_INTERVAL) as profiler:
+            response = await self.get_response(request)
+        return self.save(request, response, profiler, time.perf_counter() - started)
+
+    def save(self, request, response, profiler, wall):
+        match = request.resolver_match
+        if profiler.stacks:
+            path = save_profile(profiler.stacks, match.view_name if match else None, wall)
+            response['X-Profile'] = path.name
+        return response
@@ -0,0 +1,42 @@
+"""Run independent ORM queries of an async view at the same time.
+
+Django's async ORM runs every query through sync_to_async on the request's
+own thread, so two awaited querysets still execute one after the other.
+gather_querysets evaluates each queryset on a worker thread with its own
+database connection instead, so their round trips overlap. Inside a
+transaction (tests, or a caller holding an atomic block) other connections
+cannot see its writes, and the querysets are evaluated in turn on the
+request's connection.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connections
+
+
+def in_transaction():
+    """Whether this thread holds an open atomic block on any connection"""
+    return any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+
+
+def _evaluate(queryset):
+    # Worker threads keep their connection between calls; drop it once it is
+    # past CONN_MAX_AGE or broken, the way request_started/finished would.
+    close_old_connections()
+    try:
+        return list(queryset)
+    finally:
+        close_old_connections()
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def gather_querysets(*querysets):
+    """Evaluate the querysets concurrently; returns one list per queryset"""
+    if await sync_to_async(in_transaction)():
+        return [await alist(queryset) for queryset in querysets]
+    return await asyncio.gather(
+        *(sync_to_async(_evaluate, thread_sensitive=False)(queryset) for queryset in querysets)
+    )
@@ -0,0 +1,189 @@
+"""Seat holds, payment confirmation and cancellation, safe under concurrency.
+
+Every change to the seats of a showtime first locks its Showtime row, so
+changes to one showtime apply one at a time (SQLite takes its write lock
+up front anyway) and the ShowtimeInventory summary written at the end of
+the transaction counts all earlier ones. Seats are claimed with a
+conditional UPDATE of their SeatBooking rows that only matches free seats,
+so a seat taken in the meantime makes the whole hold roll back instead of
+moving the seat to the new booking. Status changes are conditional on the
+status they start from, so a payment and a cancellation racing on one
+booking cannot both win.
+
+Seats released here are offered to the showtime's waitlist in the same
+transaction (booking/waitlist.py).
+
+Customers are limited in what they can hold by HOLD_QUOTAS. select_seats
+checks check_hold_quota before writing anything, and hold_seats checks
+again under the showtime lock, which makes the per-showtime quota exact;
+the per-customer total can be overshot by requests racing on different
+showtimes, which the hold throttle keeps to a handful.
+"""
+import random
+import string
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import events, metrics, waitlist
+from .archive import release_booking_seats
+from .inventory import lock_showtimes, refresh_inventory
+from .models import Booking, CancellationRequest, Payment, Seat, SeatBooking, WaitlistEntry
+
+
+class SeatsUnavailable(Exception):
+    """The seats cannot be held; the message is shown to the customer"""
+
+
+class HoldQuotaExceeded(SeatsUnavailable):
+    """The customer already holds as much as HOLD_QUOTAS allows"""
+
+
+def generate_booking_reference():
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def generate_transaction_id():
+    return 'TXN' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
+
+
+def check_hold_quota(user, showtime, seat_count):
+    """Raise HoldQuotaExceeded if the customer may not hold ``seat_count`` more seats of a showtime"""
+    quotas = settings.HOLD_QUOTAS
+    limit = quotas.get('seats_per_booking')
+    if limit and seat_count > limit:
+        raise HoldQuotaExceeded(f'You can book at most {limit} seats at a time.')
+    per_user, per_showtime = quotas.get('pending_per_user'), quotas.get('pending_per_showtime')
+    if not (per_user or per_showtime):
+        return
+    # A hold past SEAT_HOLD_MINUTES keeps its seats, and can still be paid,
+    # until expire_holds releases it, so it counts until then
+    pending = Booking.objects.filter(
+        Exists(SeatBooking.objects.filter(booking=OuterRef('pk'), is_booked=True)), user=user, status='Pending',
+    ).aggregate(total=Count('id'), here=Count('id', filter=Q(showtime=showtime)))
+    if per_showtime and pending['here'] >= per_showtime:
+        raise HoldQuotaExceeded(
+            'You already have seats on hold for this showtime. Pay for them from My Bookings or let them expire first.'
+        )
+    if per_user and pending['total'] >= per_user:
+        raise HoldQuotaExceeded(
+            f"You have {pending['total']} bookings awaiting payment. Pay for them or let them expire first."
+        )
+
+
+@transaction.atomic
+def hold_seats(user, showtime, seat_ids, quota=False):
+    """Create a Pending booking holding these seats; raises SeatsUnavailable if any is taken.
+
+    With ``quota``, also raises HoldQuotaExceeded if the customer is over HOLD_QUOTAS.
+    """
+    seat_ids = sorted(set(seat_ids))
+    if showtime.end_time <= timezone.now():
+        raise SeatsUnavailable('This showtime is over.')
+    lock_showtimes([showtime.id])
+    if quota:
+        check_hold_quota(user, showtime, len(seat_ids))
+    if Seat.objects.filter(screen_id=showtime.screen_id, id__in=seat_ids).count() != len(seat_ids):
+        raise SeatsUnavailable('Some of the selected seats are not in this screen.')
+
+    booking = Booking.objects.create(
+        user=user,
+        showtime=showtime,
+        total_amount=showtime.price * len(seat_ids),
+        status='Pending',
+        booking_reference=generate_booking_reference(),
+    )
+    # Seats never booked have no row yet; released seats keep theirs
+    SeatBooking.objects.bulk_create(
+        [SeatBooking(showtime=showtime, seat_id=seat_id) for seat_id in seat_ids], ignore_conflicts=True,
+    )
+    claimed = SeatBooking.objects.filter(showtime=showtime, seat_id__in=seat_ids, is_booked=False).update(
+        is_booked=True, booking=booking,
+    )
+    if claimed != len(seat_ids):
+        # Rolls back the booking and the seats claimed so far
+        raise SeatsUnavailable('Some of the selected seats were just booked by someone else. Please choose again.')
+    booking.seats.set(seat_ids)
+    refresh_inventory([showtime.id])
+    events.record('booking.held', booking, seat_ids=seat_ids, amount=booking.total_amount)
+    return booking
+
+
+@transaction.atomic
+def confirm_booking(booking, payment_method, **payment_fields):
+    """Confirm a Pending booking and record its completed Payment.
+
+    Returns the Payment, or None if the booking was no longer pending
+    (already paid, or cancelled meanwhile).
+    """
+    if not Booking.objects.filter(id=booking.id, status='Pending').update(status='Confirmed'):
+        return None
+    booking.status = 'Confirmed'
+    payment = Payment.objects.create(
+        booking=booking,
+        payment_method=payment_method,
+        amount=booking.total_amount,
+        transaction_id=generate_transaction_id(),
+        status='completed',
+        **payment_fields,
+    )
+    events.record('booking.confirmed', booking)
+    events.record(
+        'payment.completed', booking,
+        method=payment_method, amount=payment.amount, transaction_id=payment.transaction_id,
+    )
+    return payment
+
+
+@transaction.atomic
+def approve_cancellation(cancellation, reviewer):
+    """Cancel the booking of a pending request, release its seats and refund its payment.
+
+    Returns the number of seats released, or None if the request was no
+    longer pending (e.g. approved by another admin meanwhile).
+    """
+    booking = cancellation.booking
+    now = timezone.now()
+    approved = CancellationRequest.objects.filter(id=cancellation.id, status='Pending').update(
+        status='Approved', reviewed_by=reviewer, review_date=now, refund_amount=booking.total_amount,
+    )
+    if not approved:
+        return None
+    events.record(
+        'cancellation.approved', booking, reviewer=reviewer.get_username(), refund_amount=booking.total_amount,
+    )
+    Booking.objects.filter(id=booking.id).update(status='Cancelled')
+    booking.status = 'Cancelled'
+    events.record('booking.cancelled', booking)
+    released = release_booking_seats(booking)
+    refunded = Payment.objects.filter(booking=booking).update(
+        status='refunded', refund_date=now, refund_amount=booking.total_amount,
+    )
+    if refunded:
+        events.record('payment.refunded', booking, amount=booking.total_amount)
+    CancellationRequest.objects.filter(id=cancellation.id).update(refund_processed=bool(refunded))
+    cancellation.refresh_from_db()
+    waitlist.offer_released_seats(booking.showtime)
+    return released
+
+
+@transaction.atomic
+def expire_hold(booking, cutoff):
+    """Cancel a booking still pending since before ``cutoff`` and release its seats.
+
+    Returns the number of seats released, or None if the booking was paid
+    or cancelled meanwhile or held again after the cutoff.
+    """
+    if not Booking.objects.filter(id=booking.id, status='Pending', booking_date__lt=cutoff).update(status='Cancelled'):
+        return None
+    booking.status = 'Cancelled'
+    events.record('booking.expired', booking)
+    released = release_booking_seats(booking, reason='expired')
+    metrics.SEATS_RELEASED.labels(reason='expired').inc(released)
+    # The party of an unpaid waitlist offer has had its turn
+    WaitlistEntry.objects.filter(booking=booking, status='Offered').update(status='Expired')
+    waitlist.offer_released_seats(booking.showtime)
+    return released
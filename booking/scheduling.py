@@ -0,0 +1,141 @@
+"""Bulk scheduling of recurring showtimes with per-screen overlap detection."""
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Showtime
+
+# Longest turnaround any movie can need, used to widen the existing-showtime query
+MAX_CLEANING_BUFFER = timedelta(minutes=45)
+
+
+def cleaning_buffer(movie):
+    """Turnaround time after a screening, derived from the movie's duration"""
+    minutes = max(15, movie.duration // 10)
+    return min(timedelta(minutes=minutes), MAX_CLEANING_BUFFER)
+
+
+class ScreenSchedule:
+    """Interval index of the time blocked on one screen.
+
+    Intervals are kept merged and sorted by start, so an overlap check is a
+    single bisect against the start list plus one comparison.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def overlaps(self, start, end):
+        i = bisect_left(self.starts, end)
+        return i > 0 and self.ends[i - 1] > start
+
+    def add(self, start, end):
+        i = bisect_left(self.starts, start)
+        # Merge with any neighbours the new interval touches
+        if i > 0 and self.ends[i - 1] >= start:
+            i -= 1
+            start = self.starts[i]
+        j = i
+        while j < len(self.starts) and self.starts[j] <= end:
+            end = max(end, self.ends[j])
+            j += 1
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+
+def blocked_interval(showtime, movie=None):
+    """Time a showtime occupies its screen, including cleaning afterwards"""
+    movie = movie or showtime.movie
+    return showtime.start_time, showtime.end_time + cleaning_buffer(movie)
+
+
+def build_screen_index(screens, window_start, window_end, exclude_id=None):
+    """Load existing showtimes in the window into one ScreenSchedule per screen"""
+    index = {screen.id: ScreenSchedule() for screen in screens}
+    existing = Showtime.objects.filter(
+        screen__in=list(index),
+        start_time__lt=window_end,
+        end_time__gt=window_start - MAX_CLEANING_BUFFER,
+    ).select_related('movie')
+    if exclude_id is not None:
+        existing = existing.exclude(id=exclude_id)
+    for showtime in existing:
+        index[showtime.screen_id].add(*blocked_interval(showtime))
+    return index
+
+
+def find_overlap(showtime):
+    """Return an existing showtime on the same screen that overlaps this one"""
+    start, end = blocked_interval(showtime)
+    candidates = Showtime.objects.filter(
+        screen_id=showtime.screen_id,
+        start_time__lt=end,
+        end_time__gt=start - MAX_CLEANING_BUFFER,
+    ).select_related('movie')
+    if showtime.pk:
+        candidates = candidates.exclude(pk=showtime.pk)
+    for other in candidates:
+        other_start, other_end = blocked_interval(other)
+        if other_start < end and start < other_end:
+            return other
+    return None
+
+
+@dataclass
+class ScheduleResult:
+    showtimes: list = field(default_factory=list)
+    conflicts: list = field(default_factory=list)
+
+
+def plan_showtimes(movie, screens, start_date, weeks, slots, price, weekdays=None):
+    """Build unsaved showtimes for every day/slot/screen in the window.
+
+    Candidates that overlap an existing showtime (or one planned earlier in the
+    same run) are reported in ``conflicts`` instead of being scheduled.
+    """
+    screens = list(screens)
+    tz = timezone.get_current_timezone()
+    duration = timedelta(minutes=movie.duration)
+    buffer = cleaning_buffer(movie)
+    days = [start_date + timedelta(days=i) for i in range(weeks * 7)]
+    if weekdays:
+        days = [day for day in days if day.weekday() in weekdays]
+
+    result = ScheduleResult()
+    if not days or not slots:
+        return result
+
+    window_start = timezone.make_aware(datetime.combine(days[0], min(slots)), tz)
+    window_end = timezone.make_aware(datetime.combine(days[-1], max(slots)), tz) + duration + buffer
+    index = build_screen_index(screens, window_start, window_end)
+
+    for day in days:
+        for slot in sorted(slots):
+            start = timezone.make_aware(datetime.combine(day, slot), tz)
+            end = start + duration
+            for screen in screens:
+                schedule = index[screen.id]
+                if schedule.overlaps(start, end + buffer):
+                    result.conflicts.append((screen, start, end))
+                    continue
+                schedule.add(start, end + buffer)
+                result.showtimes.append(Showtime(
+                    movie=movie,
+                    screen=screen,
+                    start_time=start,
+                    end_time=end,
+                    price=price,
+                ))
+    return result
+
+
+def schedule_showtimes(movie, screens, start_date, weeks, slots, price, weekdays=None, batch_size=500):
+    """Plan recurring showtimes and write the non-conflicting ones in bulk"""
+    with transaction.atomic():
+        result = plan_showtimes(movie, screens, start_date, weeks, slots, price, weekdays)
+        result.showtimes = Showtime.objects.bulk_create(result.showtimes, batch_size=batch_size)
+    return result
@@ -0,0 +1,17 @@
+function togglePassword(event) {
+    event.preventDefault(); // Prevent any form submission
+    event.stopPropagation(); // Stop event bubbling
+
+    const input = document.getElementById('passwordField');
+    const icon = event.target;
+
+    if (input.type === 'password') {
+        input.type = 'text';
+        icon.textContent = '👁️‍🗨️';
+    } else {
+        input.type = 'password';
+        icon.textContent = '👁️';
+    }
+
+    return false;
+}
@@ -0,0 +1,27 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const reasonTextarea = document.getElementById('reason');
+    const charCount = document.getElementById('charCount');
+    const submitBtn = document.getElementById('submitBtn');
+    const form = document.getElementById('cancellationForm');
+
+    // Character counter
+    reasonTextarea.addEventListener('input', function() {
+        const length = this.value.length;
+        charCount.textContent = length;
+
+        if (length < 10) {
+            charCount.style.color = 'red';
+            submitBtn.disabled = true;
+        } else {
+            charCount.style.color = 'green';
+            submitBtn.disabled = false;
+        }
+    });
+
+    // Confirmation before submit
+    form.addEventListener('submit', function(e) {
+        if (!confirm('Are you sure you want to cancel this booking? This action requires admin approval.')) {
+            e.preventDefault();
+        }
+    });
+});
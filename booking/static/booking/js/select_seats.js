@@ -0,0 +1,53 @@
+'use strict';
+
+const price = parseFloat(document.getElementById('seatForm').dataset.price);
+const selectedSeats = new Set();
+
+const seats = document.querySelectorAll('.seat');
+const seatCountEl = document.getElementById('seatCount');
+const totalAmountEl = document.getElementById('totalAmount');
+const hiddenBox = document.getElementById('hiddenCheckboxes');
+const proceedBtn = document.getElementById('proceedBtn');
+
+function updateUI() {
+    seatCountEl.textContent = selectedSeats.size;
+    totalAmountEl.textContent = (selectedSeats.size * price).toFixed(2);
+
+    hiddenBox.innerHTML = '';
+    selectedSeats.forEach(id => {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = 'seats';
+        input.value = id;
+        hiddenBox.appendChild(input);
+    });
+}
+
+seats.forEach(seat => {
+    seat.addEventListener('click', () => {
+        if (seat.dataset.booked === 'true') {
+            alert('This seat is already booked!');
+            return;
+        }
+
+        const seatId = seat.dataset.seatId;
+
+        if (selectedSeats.has(seatId)) {
+            selectedSeats.delete(seatId);
+            seat.classList.remove('selected');
+        } else {
+            selectedSeats.add(seatId);
+            seat.classList.add('selected');
+        }
+
+        updateUI();
+    });
+});
+
+proceedBtn.addEventListener('click', () => {
+    if (selectedSeats.size === 0) {
+        alert('Please select at least one seat!');
+        return;
+    }
+    document.getElementById('seatForm').submit();
+});
@@ -0,0 +1,301 @@
+"""Concurrency stress test of seat booking (see the stress_booking command).
+
+Workers, as threads or as forked processes, all book from the same small
+pool of seats of one showtime through the real views: select_seats, then
+process_payment (sometimes submitted twice, sometimes never), and now
+and then they cancel one of their confirmed bookings and approve the
+request while the others are grabbing the released seats. Each worker
+follows a plan drawn from the seed, so the same seed makes the same
+attempts; only their interleaving depends on scheduling.
+
+check_invariants then audits the database:
+
+- no seat is held or sold to two live bookings of a showtime;
+- booked SeatBooking rows and Booking.seats agree;
+- ShowtimeInventory counters equal the free seats counted from the rows;
+- every confirmed booking has a completed Payment, pending bookings have
+  none and cancelled ones have theirs refunded.
+"""
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict, dataclass
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from .inventory import refresh_inventory
+from .loadtest import percentile, seed_dataset
+from .models import Booking, CancellationRequest, Payment, Seat, SeatArchive, SeatBooking, Showtime, ShowtimeInventory
+from .reservations import approve_cancellation
+
+# How a worker follows up a successful hold
+PAY, PAY_TWICE, ABANDON = 'pay', 'pay_twice', 'abandon'
+
+
+@dataclass
+class StressConfig:
+    workers: int = 8
+    # Attempts per worker
+    operations: int = 25
+    # Seats everyone competes for
+    hot_seats: int = 24
+    max_party: int = 3
+    cancel_rate: float = 0.15
+    double_pay_rate: float = 0.2
+    abandon_rate: float = 0.1
+    processes: bool = False
+    seed: int = 1
+
+
+def make_plan(config, worker):
+    """The operations of one worker: ('book', seat indexes, follow-up) or ('cancel', pick)"""
+    rng = random.Random(config.seed * 100003 + worker)
+    plan = []
+    for _ in range(config.operations):
+        if rng.random() < config.cancel_rate:
+            plan.append(('cancel', rng.random()))
+            continue
+        party = rng.randint(1, min(config.max_party, config.hot_seats))
+        roll = rng.random()
+        if roll < config.abandon_rate:
+            follow_up = ABANDON
+        elif roll < config.abandon_rate + config.double_pay_rate:
+            follow_up = PAY_TWICE
+        else:
+            follow_up = PAY
+        plan.append(('book', sorted(rng.sample(range(config.hot_seats), party)), follow_up))
+    return plan
+
+
+def seed_arena(config):
+    """One showtime, its hot seat IDs, a customer per worker and an approving admin"""
+    showtimes, users = seed_dataset(
+        random.Random(config.seed), cinemas=1, screens_per_cinema=1, movies=1, days=1, users=config.workers,
+    )
+    showtime = showtimes[0]
+    seat_ids = list(Seat.objects.filter(screen_id=showtime.screen_id).order_by('id').values_list('id', flat=True))
+    if len(seat_ids) < config.hot_seats:
+        raise ValueError(f'The screen has only {len(seat_ids)} seats')
+    refresh_inventory([showtime.id])
+    admin = User.objects.create_superuser('stress-admin', 'stress-admin@loadtest.local', None)
+    return showtime, seat_ids[:config.hot_seats], users, admin
+
+
+class Worker:
+    """One customer going through the plan with its own client and database connection"""
+
+    def __init__(self, user, admin, showtime, seat_ids):
+        self.user = user
+        self.admin = admin
+        self.showtime = showtime
+        self.seat_ids = seat_ids
+        self.confirmed = []
+        self.requests = 0
+        self.client = None
+
+    def login(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def post(self, client, url, data):
+        self.requests += 1
+        return client.post(url, data)
+
+    def book(self, client, indexes, follow_up):
+        response = self.post(
+            client, reverse('select_seats', args=[self.showtime.id]), {'seats': [self.seat_ids[i] for i in indexes]},
+        )
+        location = response.get('Location', '')
+        if response.status_code != 302:
+            return f'status {response.status_code}'
+        if not location.startswith('/payment/'):
+            return 'seats_taken'
+        if follow_up == ABANDON:
+            return 'held'
+        booking_id = int(location.rstrip('/').rsplit('/', 1)[1])
+        url = reverse('process_payment', args=[booking_id])
+        response = self.post(client, url, {'payment_method': 'esewa'})
+        if follow_up == PAY_TWICE:
+            # A double-clicked pay button must not pay twice
+            response = self.post(client, url, {'payment_method': 'esewa'})
+        if '/booking-confirmation/' not in response.get('Location', ''):
+            return 'payment_refused'
+        self.confirmed.append(booking_id)
+        return 'confirmed'
+
+    def cancel(self, client, pick):
+        if not self.confirmed:
+            return 'nothing_to_cancel'
+        booking_id = self.confirmed.pop(int(pick * len(self.confirmed)))
+        self.post(client, reverse('cancel_booking', args=[booking_id]), {'reason': 'Stress test cancellation'})
+        cancellation = CancellationRequest.objects.select_related('booking').filter(booking_id=booking_id).first()
+        if cancellation is None:
+            return 'not_requested'
+        # What the admin action runs, racing with the other workers' holds
+        if approve_cancellation(cancellation, self.admin) is None:
+            return 'not_pending'
+        return 'cancelled'
+
+    def run(self, plan, barrier):
+        """[(kind, outcome, seconds)] of every operation of the plan"""
+        client = self.client
+        results = []
+        try:
+            barrier.wait()
+            for kind, *args in plan:
+                started = time.perf_counter()
+                try:
+                    outcome = self.book(client, *args) if kind == 'book' else self.cancel(client, *args)
+                except Exception as exc:
+                    outcome = f'error {type(exc).__name__}'
+                results.append((kind, outcome, time.perf_counter() - started))
+        finally:
+            connections.close_all()
+        return results
+
+
+def _run_in_process(worker, plan, barrier, queue):
+    queue.put((worker.run(plan, barrier), worker.requests))
+
+
+def run_workers(config, workers):
+    """Run every worker's plan at once; returns (results, requests, seconds)"""
+    plans = [make_plan(config, index) for index in range(len(workers))]
+    # Sessions are created up front so the workers start together on the booking flow
+    for worker in workers:
+        worker.login()
+    if config.processes:
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(len(workers) + 1)
+        queue = context.Queue()
+        # Children must not share the parent's database connections
+        connections.close_all()
+        children = [
+            context.Process(target=_run_in_process, args=(worker, plan, barrier, queue))
+            for worker, plan in zip(workers, plans)
+        ]
+        for child in children:
+            child.start()
+        barrier.wait()
+        started = time.perf_counter()
+        outputs = [queue.get() for _ in children]
+        duration = time.perf_counter() - started
+        for child in children:
+            child.join()
+        results = [item for output, _ in outputs for item in output]
+        return results, sum(requests for _, requests in outputs), duration
+
+    barrier = threading.Barrier(len(workers) + 1)
+    outputs = [None] * len(workers)
+
+    def target(index):
+        outputs[index] = workers[index].run(plans[index], barrier)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    results = [item for output in outputs for item in output or []]
+    return results, sum(worker.requests for worker in workers), duration
+
+
+def check_invariants(showtime_ids=None):
+    """Descriptions of everything wrong with the bookings of these showtimes (default: all)"""
+    showtimes = Showtime.objects.all() if showtime_ids is None else Showtime.objects.filter(id__in=showtime_ids)
+    # Archived showtimes keep their seats in a SeatArchive, not in rows
+    showtimes = showtimes.exclude(id__in=SeatArchive.objects.values('showtime_id'))
+    violations = []
+
+    holders = defaultdict(list)
+    for booking_id, showtime_id, seat_id in (
+        Booking.seats.through.objects.filter(
+            booking__showtime__in=showtimes, booking__status__in=['Pending', 'Confirmed'],
+        ).values_list('booking_id', 'booking__showtime_id', 'seat_id')
+    ):
+        holders[showtime_id, seat_id].append(booking_id)
+    for (showtime_id, seat_id), booking_ids in sorted(holders.items()):
+        if len(booking_ids) > 1:
+            violations.append(f'Seat {seat_id} of showtime {showtime_id} is held by bookings {sorted(booking_ids)}')
+
+    rows = {
+        (showtime_id, seat_id): booking_id
+        for showtime_id, seat_id, booking_id in SeatBooking.objects.filter(
+            showtime__in=showtimes, is_booked=True,
+        ).values_list('showtime_id', 'seat_id', 'booking_id')
+    }
+    for key, booking_ids in sorted(holders.items()):
+        if rows.get(key) not in booking_ids:
+            violations.append(f'Seat {key[1]} of showtime {key[0]} is in booking {booking_ids[0]} but not booked for it')
+    for key, booking_id in sorted(rows.items()):
+        if key not in holders:
+            violations.append(f'Seat {key[1]} of showtime {key[0]} is booked for booking {booking_id}, which does not hold it')
+
+    booked = Counter(showtime_id for showtime_id, _ in rows)
+    screen_seats = Counter(Seat.objects.filter(screen__in=showtimes.values('screen_id')).values_list('screen_id', flat=True))
+    for showtime_id, screen_id, seats_left in ShowtimeInventory.objects.filter(showtime__in=showtimes).values_list(
+        'showtime_id', 'showtime__screen_id', 'seats_left',
+    ):
+        expected = screen_seats[screen_id] - booked[showtime_id]
+        if seats_left != expected:
+            violations.append(f'Showtime {showtime_id} counts {seats_left} seats left, its rows {expected}')
+
+    payments = dict(Payment.objects.filter(booking__showtime__in=showtimes).values_list('booking_id', 'status'))
+    for booking_id, status in Booking.objects.filter(showtime__in=showtimes).values_list('id', 'status'):
+        payment = payments.get(booking_id)
+        if status == 'Confirmed' and payment != 'completed':
+            violations.append(f'Confirmed booking {booking_id} has payment status {payment}')
+        elif status == 'Pending' and payment is not None:
+            violations.append(f'Pending booking {booking_id} has a {payment} payment')
+        elif status == 'Cancelled' and payment == 'completed':
+            violations.append(f'Cancelled booking {booking_id} was not refunded')
+    return violations
+
+
+def summarize(results, requests, duration):
+    outcomes = defaultdict(Counter)
+    latencies = defaultdict(list)
+    for kind, outcome, seconds in results:
+        outcomes[kind][outcome] += 1
+        latencies[kind].append(seconds)
+    return {
+        'duration_s': round(duration, 3),
+        'operations': len(results),
+        'requests': requests,
+        'operations_per_s': round(len(results) / duration, 2) if duration else None,
+        'requests_per_s': round(requests / duration, 2) if duration else None,
+        'errors': sum(
+            count for counts in outcomes.values() for outcome, count in counts.items()
+            if outcome.startswith(('error', 'status'))
+        ),
+        'outcomes': {kind: dict(counts) for kind, counts in sorted(outcomes.items())},
+        'latency_ms': {
+            kind: {
+                'p50': round(percentile(sorted(values), 50) * 1000, 2),
+                'p95': round(percentile(sorted(values), 95) * 1000, 2),
+                'max': round(max(values) * 1000, 2),
+            }
+            for kind, values in sorted(latencies.items())
+        },
+    }
+
+
+def run_stress(config):
+    """Seed an arena, attack it with config.workers workers and audit the result"""
+    showtime, seat_ids, users, admin = seed_arena(config)
+    workers = [Worker(user, admin, showtime, seat_ids) for user in users]
+    results, requests, duration = run_workers(config, workers)
+    return {
+        'config': asdict(config),
+        **summarize(results, requests, duration),
+        'seats_sold': SeatBooking.objects.filter(showtime=showtime, is_booked=True, booking__status='Confirmed').count(),
+        'violations': check_invariants([showtime.id]),
+    }
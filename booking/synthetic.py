@@ -0,0 +1,349 @@
+"""Deterministic synthetic dataset for benchmarking (see generate_dataset).
+
+Builds a multiplex-chain-sized catalog with its booking history, all
+through batched bulk_create: users, cinemas, screens with layouts, movies,
+showtimes, bookings, seat bookings, payments and cancellation requests.
+The same DatasetSpec (including ``start``) always produces the same rows,
+so a performance change can be measured against an identical corpus: the
+corpus is a snapshot taken at ``DatasetSpec.as_of``, not at the wall clock.
+
+Every generated row is tagged with the seed (``synth<seed>_`` usernames,
+``S<seed>B`` booking references), so corpora with different seeds can
+share a database.
+"""
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as clock, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .layouts import parse_layout
+from .models import Booking, CancellationRequest, Cinema, Movie, Payment, Screen, Seat, SeatBooking, Showtime
+from .scheduling import cleaning_buffer
+
+DEFAULT_LAYOUT = """
+rows: A-L
+seats: 16
+aisles: 4, 12
+VIP: A-B
+Premium: C-E
+"""
+
+GENRES = ['Action', 'Drama', 'Comedy', 'Thriller', 'Romance', 'Horror', 'Animation']
+LANGUAGES = ['Nepali', 'Hindi', 'English']
+CITIES = ['Kathmandu', 'Lalitpur', 'Bhaktapur', 'Pokhara', 'Biratnagar', 'Chitwan', 'Butwal', 'Dharan']
+PRICES = [Decimal('250.00'), Decimal('300.00'), Decimal('350.00'), Decimal('400.00'), Decimal('500.00')]
+# Party sizes and how often they occur
+GROUP_SIZES = [1, 2, 3, 4, 5, 6]
+GROUP_WEIGHTS = [15, 40, 15, 18, 6, 6]
+PAYMENT_METHODS = ['esewa', 'khalti', 'fonepay', 'card']
+PAYMENT_WEIGHTS = [40, 30, 15, 15]
+CANCELLATION_REASONS = ['Change of plans', 'Booked the wrong show', 'Feeling unwell', 'Traffic']
+
+
+@dataclass
+class DatasetSpec:
+    cinemas: int = 500
+    screens_per_cinema: int = 4
+    layout: str = DEFAULT_LAYOUT
+    movies: int = 200
+    # Showtimes run from ``start`` for ``days`` days; the first ``past_days``
+    # of them are over when the corpus is taken (see as_of).
+    days: int = 7
+    past_days: int = 3
+    start: date = None
+    slots: list = field(default_factory=lambda: [clock(10, 0), clock(13, 30), clock(17, 0), clock(20, 30)])
+    users: int = 20000
+    # Mean share of seats sold for a showtime that doesn't sell out
+    occupancy: float = 0.35
+    sellout_ratio: float = 0.05
+    cancellation_rate: float = 0.04
+    # Bookings on future showtimes still waiting for payment
+    pending_rate: float = 0.01
+    seed: int = 1
+    batch_size: int = 5000
+
+    @property
+    def first_day(self):
+        return self.start or timezone.localdate() - timedelta(days=self.past_days)
+
+    @property
+    def as_of(self):
+        """The moment the corpus is a snapshot of: midnight after the first ``past_days`` days"""
+        day = self.first_day + timedelta(days=self.past_days)
+        return timezone.make_aware(datetime.combine(day, clock(0, 0)), timezone.get_current_timezone())
+
+    def max_duration(self):
+        """Longest movie that fits between consecutive slots with its cleaning time"""
+        minutes = [slot.hour * 60 + slot.minute for slot in sorted(self.slots)]
+        gaps = [b - a for a, b in zip(minutes, minutes[1:])] + [minutes[0] + 24 * 60 - minutes[-1]]
+        duration = min(170, min(gaps) - 15)
+        while duration >= 90 and duration + cleaning_buffer(Movie(duration=duration)).seconds // 60 > min(gaps):
+            duration -= 1
+        if duration < 90:
+            raise ValueError('Slots must be at least 105 minutes apart')
+        return duration
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the dates we set on auto_now_add fields"""
+    saved = [(f, f.auto_now_add) for f in fields]
+    for f, _ in saved:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, value in saved:
+            f.auto_now_add = value
+
+
+class SyntheticDataset:
+    def __init__(self, spec, progress=None):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.progress = progress or (lambda message: None)
+        self.tag = f"S{spec.seed}"
+        self.counts = {}
+        self.next_booking = 0
+
+    def exists(self):
+        return Booking.objects.filter(booking_reference__startswith=f"{self.tag}B").exists()
+
+    def generate(self):
+        self.user_ids = self.create_users()
+        self.screen_rows = self.create_screens()
+        movies = self.create_movies()
+        showtimes = self.create_showtimes(movies)
+        self.create_bookings(showtimes)
+        return self.counts
+
+    def _bulk(self, model, objects):
+        created = model.objects.bulk_create(objects, batch_size=self.spec.batch_size)
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(created)
+        return created
+
+    def _insert_rows(self, model, columns, rows):
+        """executemany INSERT for the per-seat tables, skipping model instances"""
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(model._meta.get_field(name).column) for name in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            for offset in range(0, len(rows), self.spec.batch_size):
+                cursor.executemany(sql, rows[offset:offset + self.spec.batch_size])
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(rows)
+
+    def create_users(self):
+        self.progress(f"Creating {self.spec.users} users...")
+        password = make_password(f"synthetic-{self.spec.seed}")
+        ids = []
+        for offset in range(0, self.spec.users, self.spec.batch_size):
+            end = min(offset + self.spec.batch_size, self.spec.users)
+            with transaction.atomic():
+                ids += [user.id for user in self._bulk(User, [
+                    User(username=f"synth{self.spec.seed}_{i}", email=f"synth{self.spec.seed}_{i}@example.com",
+                         password=password)
+                    for i in range(offset, end)
+                ])]
+        return ids
+
+    def create_screens(self):
+        """Cinemas, screens and seats; returns {screen_id: [[seat ids of a row], ...]}"""
+        spec, rng = self.spec, self.rng
+        layout = parse_layout(spec.layout)
+        seats_per_screen = list(layout.seats())
+        self.progress(
+            f"Creating {spec.cinemas} cinemas, {spec.cinemas * spec.screens_per_cinema} screens "
+            f"of {len(seats_per_screen)} seats..."
+        )
+        with transaction.atomic():
+            cinemas = self._bulk(Cinema, [
+                Cinema(name=f"Synthetic {c + 1}", location=rng.choice(CITIES), address=f"{c + 1} Ring Road",
+                       phone=f"01-{rng.randrange(10 ** 6):06d}")
+                for c in range(spec.cinemas)
+            ])
+        screen_rows = {}
+        screens_per_batch = max(1, spec.batch_size // max(len(seats_per_screen), 1))
+        screens = [(cinema, s) for cinema in cinemas for s in range(spec.screens_per_cinema)]
+        for offset in range(0, len(screens), screens_per_batch):
+            with transaction.atomic():
+                batch = self._bulk(Screen, [
+                    Screen(cinema=cinema, name=f"Audi {s + 1}", total_seats=len(seats_per_screen))
+                    for cinema, s in screens[offset:offset + screens_per_batch]
+                ])
+                seats = self._bulk(Seat, [
+                    Seat(screen=screen, row=row, number=number, seat_type=seat_type)
+                    for screen in batch
+                    for row, number, seat_type in seats_per_screen
+                ])
+                for i, screen in enumerate(batch):
+                    own = seats[i * len(seats_per_screen):(i + 1) * len(seats_per_screen)]
+                    layout.seat_ids = [seat.id for seat in own]
+                    screen.layout = layout.encode()
+                    rows = {}
+                    for seat in own:
+                        rows.setdefault(seat.row, []).append(seat.id)
+                    screen_rows[screen.id] = list(rows.values())
+                Screen.objects.bulk_update(batch, ['layout'], batch_size=spec.batch_size)
+        return screen_rows
+
+    def create_movies(self):
+        spec, rng = self.spec, self.rng
+        longest = spec.max_duration()
+        with transaction.atomic():
+            return self._bulk(Movie, [
+                Movie(
+                    title=f"Synthetic Movie {m + 1}", description='Synthetic benchmark movie',
+                    duration=rng.randint(90, longest), genre=rng.choice(GENRES), language=rng.choice(LANGUAGES),
+                    rating=rng.choice(['U', 'PG', 'Adult']), release_date=spec.first_day - timedelta(days=rng.randrange(60)),
+                    is_now_showing=True,
+                )
+                for m in range(spec.movies)
+            ])
+
+    def create_showtimes(self, movies):
+        spec, rng = self.spec, self.rng
+        tz = timezone.get_current_timezone()
+        # A few titles take most screens, as they do in a real week
+        cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(movies))))
+        pending = []
+        showtimes = []
+        self.progress(f"Creating {len(self.screen_rows) * spec.days * len(spec.slots)} showtimes...")
+        for screen_id in self.screen_rows:
+            for d in range(spec.days):
+                day = spec.first_day + timedelta(days=d)
+                for slot in sorted(spec.slots):
+                    movie = rng.choices(movies, cum_weights=cum_weights)[0]
+                    start = timezone.make_aware(datetime.combine(day, slot), tz)
+                    pending.append(Showtime(
+                        movie=movie, screen_id=screen_id, start_time=start,
+                        end_time=start + timedelta(minutes=movie.duration), price=rng.choice(PRICES),
+                    ))
+            if len(pending) >= spec.batch_size:
+                with transaction.atomic():
+                    showtimes += self._bulk(Showtime, pending)
+                pending = []
+        with transaction.atomic():
+            showtimes += self._bulk(Showtime, pending)
+        return showtimes
+
+    # Bookings
+
+    def plan_groups(self, rows, occupancy):
+        """Contiguous seat groups covering roughly ``occupancy`` of the seats"""
+        rng = self.rng
+        mean_size = sum(s * w for s, w in zip(GROUP_SIZES, GROUP_WEIGHTS)) / sum(GROUP_WEIGHTS)
+        # Chance of starting a group at a free seat that yields the target occupancy
+        p = 1.0 if occupancy >= 1 else occupancy / (mean_size * (1 - occupancy) + occupancy)
+        groups = []
+        for row in rng.sample(rows, len(rows)):
+            i = 0
+            while i < len(row):
+                if rng.random() < p:
+                    size = rng.choices(GROUP_SIZES, GROUP_WEIGHTS)[0]
+                    groups.append(row[i:i + size])
+                    i += size
+                else:
+                    i += 1
+        return groups
+
+    def occupancy(self):
+        spec, rng = self.spec, self.rng
+        if rng.random() < spec.sellout_ratio:
+            return 1.0
+        mean = min(max(spec.occupancy, 0.01), 0.99)
+        return rng.betavariate(2, 2 * (1 - mean) / mean)
+
+    def create_bookings(self, showtimes):
+        spec = self.spec
+        self.progress(f"Creating bookings for {len(showtimes)} showtimes...")
+        now = spec.as_of
+        pending = []
+        seats_in_batch = 0
+        for showtime in showtimes:
+            for group in self.plan_groups(self.screen_rows[showtime.screen_id], self.occupancy()):
+                pending.append((showtime, group))
+                seats_in_batch += len(group)
+            if seats_in_batch >= spec.batch_size:
+                self.write_bookings(pending, now)
+                pending, seats_in_batch = [], 0
+        self.write_bookings(pending, now)
+
+    def write_bookings(self, groups, now):
+        spec, rng = self.spec, self.rng
+        bookings, plans = [], []
+        for showtime, seat_ids in groups:
+            booked_at = showtime.start_time - timedelta(minutes=rng.randrange(30, 14 * 24 * 60))
+            # Drawn whether needed or not, so later rows don't depend on the clamp
+            recently = now - timedelta(minutes=rng.randrange(1, 24 * 60))
+            if booked_at > now:
+                booked_at = recently
+            roll = rng.random()
+            if showtime.start_time > now and roll < spec.pending_rate:
+                status = 'Pending'
+            elif roll < spec.pending_rate + spec.cancellation_rate:
+                status = 'Cancelled'
+            else:
+                status = 'Confirmed'
+            self.next_booking += 1
+            bookings.append(Booking(
+                user_id=rng.choice(self.user_ids), showtime=showtime, booking_date=booked_at,
+                total_amount=showtime.price * len(seat_ids), status=status,
+                booking_reference=f"{self.tag}B{self.next_booking}",
+            ))
+            plans.append((seat_ids, rng.choices(PAYMENT_METHODS, PAYMENT_WEIGHTS)[0]))
+        if not bookings:
+            return
+
+        through = Booking.seats.through
+        with transaction.atomic(), explicit_timestamps(
+            Booking._meta.get_field('booking_date'),
+            Payment._meta.get_field('payment_date'),
+            CancellationRequest._meta.get_field('request_date'),
+        ):
+            bookings = self._bulk(Booking, bookings)
+            links, seat_bookings, payments, cancellations = [], [], [], []
+            for booking, (seat_ids, method) in zip(bookings, plans):
+                links += [(booking.id, seat_id) for seat_id in seat_ids]
+                # Approved cancellations release their seats, as the admin action does
+                live = booking.status != 'Cancelled'
+                seat_bookings += [
+                    (booking.showtime_id, seat_id, booking.id if live else None, live) for seat_id in seat_ids
+                ]
+                if booking.status == 'Pending':
+                    continue
+                paid_at = booking.booking_date + timedelta(seconds=rng.randrange(20, 600))
+                payment = Payment(
+                    booking=booking, payment_method=method, amount=booking.total_amount,
+                    transaction_id=f"{self.tag}T{booking.booking_reference[len(self.tag) + 1:]}",
+                    payment_date=paid_at, status='completed',
+                )
+                if method == 'card':
+                    payment.card_number = f"{rng.randrange(10000):04d}"
+                    payment.cardholder_name = 'Synthetic Holder'
+                if booking.status == 'Cancelled':
+                    requested = paid_at + timedelta(minutes=rng.randrange(5, 24 * 60))
+                    payment.status = 'refunded'
+                    payment.refund_date = requested
+                    payment.refund_amount = booking.total_amount
+                    cancellations.append(CancellationRequest(
+                        booking=booking, reason=rng.choice(CANCELLATION_REASONS), request_date=requested,
+                        status='Approved', review_date=requested, refund_amount=booking.total_amount,
+                        refund_processed=True,
+                    ))
+                payments.append(payment)
+            self._insert_rows(through, ['booking', 'seat'], links)
+            self._insert_rows(SeatBooking, ['showtime', 'seat', 'booking', 'is_booked'], seat_bookings)
+            self._bulk(Payment, payments)
+            self._bulk(CancellationRequest, cancellations)
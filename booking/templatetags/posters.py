@@ -0,0 +1,11 @@
+from django import template
+
+from booking import posters
+
+register = template.Library()
+
+
+@register.filter
+def poster_url(movie, size='card'):
+    """{{ movie|poster_url:'large' }}: the resized poster if it has been made"""
+    return posters.poster_url(movie, size)
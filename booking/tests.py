@@ -1,3 +1,1539 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, time as clock, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.templatetags.static import static
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from cinema_booking.database import database_config, replica_configs
+from cinema_booking.routers import PIN_COOKIE, PrimaryPinningMiddleware, ReplicaRouter, is_pinned, pin_to_primary
+
+from . import checkin, events, metrics, tickets, waitlist
+from .archive import booked_seat_ids, pack_bitmap, release_booking_seats, unpack_bitmap
+from .benchmark import SimulatedLatency
+from .catalog import movie_detail_key
+from .importer import AdmissionImporter, BookingImporter, RejectWriter, ScheduleImporter, read_rows
+from .instrumentation import RequestTimingMiddleware
+from .inventory import screen_rows, summarize
+from .layouts import apply_layout, parse_layout, seat_map_key
+from .posters import make_variants, poster_url
+from .profiling import list_profiles, make_token
+from .queries import gather_querysets
+from .scheduling import ScreenSchedule, cleaning_buffer, plan_showtimes
+from .reservations import SeatsUnavailable, approve_cancellation, confirm_booking, hold_seats
+from .stress import check_invariants
+from .synthetic import DatasetSpec, SyntheticDataset
+from .throttle import SlidingWindow
+from .models import Admission, Cinema, Movie, Screen, Showtime, Seat, Booking, SeatBooking, SeatArchive, ShowtimeInventory, Payment, CancellationRequest, BookingEvent, EventCursor, WaitlistEntry
+
+
+def create_catalog():
+    """Small but complete dataset: one cinema, two movies, seats and showtimes"""
+    cinema = Cinema.objects.create(name='ASA', location='Kathmandu', address='Main Road', phone='01-123456')
+    screen = Screen.objects.create(cinema=cinema, name='Audi 1', total_seats=20)
+    seats = Seat.objects.bulk_create([
+        Seat(screen=screen, row=row, number=number) for row in 'AB' for number in range(1, 11)
+    ])
+    movie = Movie.objects.create(
+        title='Sholay', description='Classic', duration=180, genre='Action', language='Hindi',
+        rating='U', release_date=timezone.now().date(),
+    )
+    Movie.objects.create(
+        title='Upcoming', description='Soon', duration=120, genre='Drama', language='Nepali',
+        rating='PG', release_date=timezone.now().date() + timedelta(days=30), is_now_showing=False,
+    )
+    start = timezone.now() + timedelta(hours=2)
+    showtime = Showtime.objects.create(
+        movie=movie, screen=screen, start_time=start, end_time=start + timedelta(minutes=180), price=300,
+    )
+    return showtime, seats
+
+
+class QueryPlanTests(TestCase):
+    """Run the real view queries through EXPLAIN QUERY PLAN.
+
+    Fails when a query on one of the hot tables falls back to a full table
+    scan, i.e. when a supporting index was dropped or a query stopped
+    matching it.
+    """
+
+    HOT_TABLES = {
+        'auth_user',
+        'booking_showtime',
+        'booking_seatbooking',
+        'booking_booking',
+        'booking_cancellationrequest',
+        'booking_payment',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('ram', 'ram@example.com', 'secret-pass-123')
+        cls.booking = Booking.objects.create(
+            user=cls.user, showtime=cls.showtime, total_amount=600, status='Confirmed', booking_reference='REF0000001',
+        )
+        cls.booking.seats.set(cls.seats[:2])
+        SeatBooking.objects.bulk_create([
+            SeatBooking(showtime=cls.showtime, seat=seat, booking=cls.booking, is_booked=True) for seat in cls.seats[:2]
+        ])
+        Payment.objects.create(
+            booking=cls.booking, payment_method='esewa', amount=600, transaction_id='TXN1', status='completed',
+        )
+        CancellationRequest.objects.create(booking=cls.booking, reason='Cannot make it anymore')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123')
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite specific')
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[3] for row in cursor.fetchall()]
+        aliases = self.table_aliases(sql)
+        scans = []
+        for detail in plan:
+            words = detail.split()
+            if words[0] != 'SCAN':
+                continue
+            table = aliases.get(words[1], words[1])
+            if table in self.HOT_TABLES:
+                scans.append(detail)
+        return scans
+
+    @staticmethod
+    def table_aliases(sql):
+        # Django aliases joined and subquery tables ("booking_booking" U0)
+        aliases = {}
+        tokens = sql.replace('"', ' ').replace(',', ' ').split()
+        for i, token in enumerate(tokens[:-1]):
+            if token.startswith(('booking_', 'auth_')) and tokens[i + 1][:1] in ('U', 'T', 'V') and tokens[i + 1][1:].isdigit():
+                aliases[tokens[i + 1]] = token
+        return aliases
+
+    def assertNoFullScans(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400, url)
+        problems = {}
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'django_session' in sql:
+                continue
+            scans = self.full_scans(sql)
+            if scans:
+                problems[sql] = scans
+        self.assertEqual(problems, {}, f"Full table scans while serving {url}")
+
+    def test_catalog_views(self):
+        self.assertNoFullScans('get', reverse('home'))
+        self.assertNoFullScans('get', reverse('movies'))
+        self.assertNoFullScans('get', reverse('movie_detail', args=[self.showtime.movie_id]))
+
+    def test_login_lookup(self):
+        self.assertNoFullScans('post', reverse('login'), {'email': 'ram@example.com', 'password': 'secret-pass-123'})
+
+    def test_booking_views(self):
+        self.client.force_login(self.user)
+        self.assertNoFullScans('get', reverse('select_seats', args=[self.showtime.id]))
+        self.assertNoFullScans('get', reverse('payment_page', args=[self.booking.id]))
+        self.assertNoFullScans('get', reverse('booking_confirmation', args=[self.booking.id]))
+        self.assertNoFullScans('get', reverse('my_bookings'))
+
+    def test_cancellation_review(self):
+        self.client.force_login(self.admin)
+        self.assertNoFullScans('get', reverse('admin:booking_cancellationrequest_changelist'), {'status__exact': 'Pending'})
+
+
+class SchedulingTests(TestCase):
+    def setUp(self):
+        showtime, _ = create_catalog()
+        self.movie, self.screen = showtime.movie, showtime.screen
+        self.day = timezone.localdate() + timedelta(days=10)
+        # 10:00-13:00, then cleaning until 13:18
+        self.existing = Showtime.objects.create(
+            movie=self.movie, screen=self.screen, price=300,
+            start_time=self.at(self.day, 10), end_time=self.at(self.day, 13),
+        )
+
+    def at(self, day, hour, minute=0):
+        return timezone.make_aware(datetime.combine(day, clock(hour, minute)))
+
+    def test_screen_schedule(self):
+        schedule = ScreenSchedule()
+        schedule.add(10, 12)
+        self.assertTrue(schedule.overlaps(11, 13))
+        self.assertTrue(schedule.overlaps(9, 11))
+        # Touching intervals don't overlap
+        self.assertFalse(schedule.overlaps(12, 13))
+        self.assertFalse(schedule.overlaps(8, 10))
+        schedule.add(12, 14)
+        schedule.add(20, 22)
+        self.assertEqual((schedule.starts, schedule.ends), ([10, 20], [14, 22]))
+        self.assertFalse(schedule.overlaps(14, 20))
+        self.assertTrue(schedule.overlaps(13, 21))
+        schedule.add(14, 20)
+        self.assertEqual((schedule.starts, schedule.ends), ([10], [22]))
+
+    def test_cleaning_gap_and_conflicts(self):
+        self.assertEqual(cleaning_buffer(self.movie), timedelta(minutes=18))
+        slots = [clock(6, 42), clock(13, 10), clock(13, 18)]
+        result = plan_showtimes(self.movie, [self.screen], self.day, 1, slots, Decimal('350'), [self.day.weekday()])
+        # 06:42 ends with its cleaning at 10:00 and 13:18 starts as cleaning ends;
+        # 13:10 falls into the cleaning after the existing showtime
+        self.assertEqual([showtime.start_time for showtime in result.showtimes], [self.at(self.day, 6, 42), self.at(self.day, 13, 18)])
+        self.assertEqual(result.conflicts, [(self.screen, self.at(self.day, 13, 10), self.at(self.day, 16, 10))])
+
+    def test_command_creates_in_bulk(self):
+        options = {
+            'movie': self.movie.id, 'screens': [self.screen.id], 'start': f'{self.day:%Y-%m-%d}', 'weeks': 2,
+            'slots': ['09:00', '19:00'], 'price': '350', 'weekdays': [0, 3],
+        }
+        out = StringIO()
+        call_command('schedule_showtimes', dry_run=True, stdout=out, **options)
+        self.assertIn('Would create', out.getvalue())
+        self.assertEqual(Showtime.objects.filter(start_time__date__gte=self.day).count(), 1)
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('schedule_showtimes', stdout=out, **options)
+        created = Showtime.objects.filter(start_time__date__gte=self.day).exclude(id=self.existing.id)
+        conflicts = 1 if self.day.weekday() in (0, 3) else 0
+        self.assertEqual(created.count(), 8 - conflicts)
+        self.assertEqual({timezone.localtime(showtime.start_time).weekday() for showtime in created}, {0, 3})
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertIn(f'({conflicts} conflict(s))', out.getvalue())
+
+        for price in ('abc', '-5', '12.345', '100000', 'NaN'):
+            with self.assertRaisesMessage(CommandError, 'Invalid --price'):
+                call_command('schedule_showtimes', stdout=StringIO(), **{**options, 'price': price})
+
+    def test_admin_action(self):
+        admin_user = User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:booking_movie_changelist')
+        data = {
+            'action': 'schedule_recurring_showtimes', '_selected_action': [self.movie.id], 'apply': '1',
+            'screens': [self.screen.id], 'start_date': f'{self.day:%Y-%m-%d}', 'weeks': 1, 'price': '350',
+        }
+        response = self.client.post(url, {**data, 'slots': '25:00'})
+        self.assertContains(response, 'is not a valid HH:MM time')
+
+        response = self.client.post(url, {**data, 'slots': '06:00, 13:10'}, follow=True)
+        self.assertContains(response, '13 showtime(s) scheduled.')
+        self.assertContains(response, '1 slot(s) skipped')
+        self.assertEqual(Showtime.objects.filter(start_time__date__gte=self.day).count(), 14)
+
+    def test_clean_rejects_overlaps(self):
+        showtime = Showtime(
+            movie=self.movie, screen=self.screen, price=300,
+            start_time=self.at(self.day, 13, 10), end_time=self.at(self.day, 16, 10),
+        )
+        with self.assertRaisesMessage(ValidationError, f'Overlaps {self.existing}'):
+            showtime.clean()
+        showtime.start_time = self.at(self.day, 13, 18)
+        showtime.end_time = self.at(self.day, 16, 18)
+        showtime.clean()
+        showtime.end_time = showtime.start_time
+        with self.assertRaisesMessage(ValidationError, 'End time must be after the start time.'):
+            showtime.clean()
+        # Editing a showtime doesn't conflict with itself
+        self.existing.clean()
+
+
+class LayoutTests(TestCase):
+    def setUp(self):
+        self.cinema = Cinema.objects.create(name='QFX', location='Lalitpur', address='Labim', phone='01-555555')
+        self.screen = Screen.objects.create(cinema=self.cinema, name='Audi 2')
+
+    def test_shorthand(self):
+        layout = parse_layout('rows: A-C, E\nseats: 6\naisles: 3\ngaps: a1\nVIP: A\nPremium: B-C  # middle rows')
+        self.assertEqual(layout.rows, [('A', '.VV|VVV'), ('B', 'PPP|PPP'), ('C', 'PPP|PPP'), ('E', 'RRR|RRR')])
+        self.assertEqual(layout.seat_count, 23)
+        seats = list(layout.seats())
+        # The gap keeps its number, aisles don't take one
+        self.assertEqual(seats[:2], [('A', 2, 'VIP'), ('A', 3, 'VIP')])
+        self.assertEqual(seats[-1], ('E', 6, 'Regular'))
+
+    def test_grid(self):
+        layout = parse_layout('A: VV|VV\n\n# back row\nB: P.P')
+        self.assertEqual(layout.rows, [('A', 'VV|VV'), ('B', 'P.P')])
+        self.assertEqual(list(layout.seats())[-2:], [('B', 1, 'Premium'), ('B', 3, 'Premium')])
+        self.assertEqual(parse_layout(layout.to_text()).rows, layout.rows)
+
+    def test_malformed_layouts(self):
+        cases = [
+            ('', 'Layout is empty.'),
+            ('rows: C-A\nseats: 4', "Invalid row range 'C-A'."),
+            ('rows: A1\nseats: 4', "Invalid row label 'A1'."),
+            ('rows: A\nseats: many', 'Seats per row must be a number.'),
+            ('seats: 4', "Layout is missing 'rows'."),
+            ('rows: A\nseats: 100', '1-99 seats per row'),
+            ('rows: A\nseats: 4\naisles: 2, x', 'Aisles must be a list of seat numbers.'),
+            ('rows: A\nseats: 4\nGold: A', "Unknown layout option 'Gold'."),
+            ('rows: A\nseats 4', "Invalid layout line 'seats 4'."),
+            ('A: RR\nA: PP', 'Each row may only appear once.'),
+            ('A: ..|..', 'Layout has no seats.'),
+        ]
+        for text, message in cases:
+            with self.subTest(text=text), self.assertRaisesMessage(ValidationError, message):
+                parse_layout(text)
+
+    def test_apply_keeps_total_seats_in_sync(self):
+        created = apply_layout(self.screen, parse_layout('rows: A-B\nseats: 5\ngaps: B5'))
+        self.screen.refresh_from_db()
+        self.assertEqual(self.screen.total_seats, 9)
+        self.assertEqual(self.screen.seats.count(), 9)
+        seat_ids = [cell['id'] for _, row in self.screen.get_layout().seat_map() for cell in row if cell['kind'] == 'seat']
+        self.assertEqual(seat_ids, [seat.id for seat in created])
+
+        apply_layout(self.screen, parse_layout('A: RRR'))
+        self.screen.refresh_from_db()
+        self.assertEqual((self.screen.total_seats, self.screen.seats.count()), (3, 3))
+
+    def test_layout_of_booked_screen_is_kept(self):
+        apply_layout(self.screen, parse_layout('rows: A\nseats: 4'))
+        movie = Movie.objects.create(
+            title='Kabaddi', description='Comedy', duration=120, genre='Comedy', language='Nepali',
+            rating='U', release_date=timezone.now().date(),
+        )
+        start = timezone.now() + timedelta(days=1)
+        showtime = Showtime.objects.create(
+            movie=movie, screen=self.screen, start_time=start, end_time=start + timedelta(hours=2), price=300,
+        )
+        user = User.objects.create_user('ram', 'ram@example.com', 'secret-pass-123')
+        hold_seats(user, showtime, [self.screen.seats.first().id])
+        with self.assertRaisesMessage(ValidationError, 'its layout can no longer be regenerated'):
+            apply_layout(self.screen, parse_layout('rows: A-B\nseats: 4'))
+
+        # Through the admin the screen is saved, but its seats are left alone
+        admin_user = User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:booking_screen_change', args=[self.screen.id]), {
+            'cinema': self.cinema.id, 'name': 'Audi 2 (renamed)', 'layout_spec': 'rows: A-B\nseats: 4',
+        }, follow=True)
+        self.assertContains(response, 'its layout can no longer be regenerated')
+        self.screen.refresh_from_db()
+        self.assertEqual((self.screen.name, self.screen.total_seats, self.screen.seats.count()), ('Audi 2 (renamed)', 4, 4))
+
+    def test_admin_generates_seats(self):
+        admin_user = User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:booking_screen_change', args=[self.screen.id])
+        response = self.client.post(url, {'cinema': self.cinema.id, 'name': 'Audi 2', 'layout_spec': 'A: RR|RR'}, follow=True)
+        self.assertContains(response, 'Generated 4 seat(s) from the layout.')
+        response = self.client.post(url, {'cinema': self.cinema.id, 'name': 'Audi 2', 'layout_spec': 'rows: A-Z-'})
+        self.assertContains(response, "Invalid row range")
+        self.screen.refresh_from_db()
+        self.assertEqual(self.screen.total_seats, 4)
+
+
+class BookingFlowTests(TestCase):
+    """The booking, payment and cancellation paths, end to end.
+
+    Backend agnostic: DatabaseConfigTests runs them on PostgreSQL when
+    TEST_POSTGRESQL_HOST is set.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123')
+
+    def hold_seats(self, seats):
+        response = self.client.post(
+            reverse('select_seats', args=[self.showtime.id]), {'seats': [seat.id for seat in seats]},
+        )
+        booking = Booking.objects.latest('id')
+        self.assertRedirects(response, reverse('payment_page', args=[booking.id]))
+        return booking
+
+    def pay(self, booking):
+        response = self.client.post(reverse('process_payment', args=[booking.id]), {'payment_method': 'khalti'})
+        self.assertRedirects(response, reverse('booking_confirmation', args=[booking.id]))
+
+    def test_book_and_pay(self):
+        self.client.force_login(self.user)
+        booking = self.hold_seats(self.seats[:3])
+        self.assertEqual(booking.status, 'Pending')
+        self.assertEqual(booking.total_amount, 900)
+        self.assertEqual(SeatBooking.objects.filter(showtime=self.showtime, is_booked=True).count(), 3)
+
+        self.pay(booking)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'Confirmed')
+        self.assertEqual(booking.payment.amount, 900)
+        self.assertContains(self.client.get(reverse('booking_confirmation', args=[booking.id])), booking.booking_reference)
+        self.assertContains(self.client.get(reverse('my_bookings')), booking.booking_reference)
+
+    def test_cancellation_releases_seats(self):
+        self.client.force_login(self.user)
+        booking = self.hold_seats(self.seats[:2])
+        self.pay(booking)
+        response = self.client.post(
+            reverse('cancel_booking', args=[booking.id]), {'reason': 'Plans changed, sorry'},
+        )
+        self.assertRedirects(response, reverse('my_bookings'))
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin:booking_cancellationrequest_changelist'), {
+            'action': 'approve_cancellation',
+            '_selected_action': [booking.cancellation_request.id],
+        })
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'Cancelled')
+        self.assertEqual(booking.payment.status, 'refunded')
+        self.assertFalse(SeatBooking.objects.filter(showtime=self.showtime, is_booked=True).exists())
+
+
+class DatabaseConfigTests(TestCase):
+    def test_sqlite_from_env(self):
+        config = database_config(Path('/srv/app'), {})
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], Path('/srv/app/db.sqlite3'))
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertEqual(config['OPTIONS']['timeout'], 20)
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL;', config['OPTIONS']['init_command'])
+
+        env = {'DB_NAME': '/data/cinema.sqlite3', 'DB_CONN_MAX_AGE': '0', 'DB_BUSY_TIMEOUT': '5'}
+        config = database_config(Path('/srv/app'), env)
+        self.assertEqual((config['NAME'], config['CONN_MAX_AGE'], config['OPTIONS']['timeout']),
+                         ('/data/cinema.sqlite3', 0, 5))
+        # Only the env passed in counts
+        with mock.patch.dict(os.environ, {'DB_CONN_MAX_AGE': '999'}):
+            self.assertEqual(database_config(Path('/srv/app'), {'DB_CONN_MAX_AGE': ''})['CONN_MAX_AGE'], 60)
+
+    def test_postgresql_from_env(self):
+        env = {'DB_ENGINE': 'PostgreSQL', 'DB_NAME': 'cinema', 'DB_USER': 'app', 'DB_HOST': 'db', 'DB_CONN_MAX_AGE': '300'}
+        config = database_config(Path('/srv/app'), env)
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((config['NAME'], config['USER'], config['HOST'], config['PORT']), ('cinema', 'app', 'db', ''))
+        self.assertEqual((config['CONN_MAX_AGE'], config['OPTIONS']), (300, {}))
+
+        config = database_config(Path('/srv/app'), {**env, 'DB_POOL_SIZE': '8'})
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool'], {'min_size': 1, 'max_size': 8})
+
+        with self.assertRaises(ValueError):
+            database_config(Path('/srv/app'), {'DB_ENGINE': 'mysql'})
+
+    def test_replicas_from_env(self):
+        primary = database_config(Path('/srv/app'), {})
+        replicas = replica_configs(primary, {'DB_REPLICAS': ' /data/r1.sqlite3, ,/data/r2.sqlite3'})
+        self.assertEqual(list(replicas), ['replica1', 'replica2'])
+        self.assertEqual(replicas['replica2']['NAME'], '/data/r2.sqlite3')
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+        self.assertEqual(replicas['replica1']['OPTIONS'], primary['OPTIONS'])
+        self.assertIsNot(replicas['replica1']['OPTIONS'], primary['OPTIONS'])
+
+        primary = database_config(Path('/srv/app'), {'DB_ENGINE': 'postgresql', 'DB_HOST': 'db', 'DB_PORT': '5432'})
+        replicas = replica_configs(primary, {'DB_REPLICAS': 'db-r1:5433,db-r2'})
+        self.assertEqual(
+            [(config['HOST'], config['PORT'], config['NAME']) for config in replicas.values()],
+            [('db-r1', '5433', 'cinema_booking'), ('db-r2', '5432', 'cinema_booking')],
+        )
+        self.assertEqual(replica_configs(primary, {}), {})
+
+    @skipUnless(os.environ.get('TEST_POSTGRESQL_HOST'), 'set TEST_POSTGRESQL_HOST (and DB_USER, DB_PASSWORD) to run')
+    def test_booking_paths_on_postgresql(self):
+        env = {**os.environ, 'DB_ENGINE': 'postgresql', 'DB_HOST': os.environ['TEST_POSTGRESQL_HOST'], 'DB_REPLICAS': ''}
+        finished = subprocess.run(
+            [sys.executable, 'manage.py', 'test', '--noinput', 'booking.tests.BookingFlowTests'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=600,
+        )
+        self.assertEqual(finished.returncode, 0, finished.stdout + finished.stderr)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_catalog_reads_use_replicas(self):
+        for model in (Cinema, Movie, Screen, Showtime, Seat):
+            self.assertIn(self.router.db_for_read(model), ['replica1', 'replica2'])
+            self.assertEqual(self.router.db_for_write(model), 'default')
+
+    def test_booking_models_stay_on_primary(self):
+        for model in (Booking, SeatBooking, Payment, CancellationRequest, User):
+            self.assertEqual(self.router.db_for_read(model), 'default')
+
+    def test_pinned_reads_use_primary(self):
+        with pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Movie), 'default')
+        self.assertNotEqual(self.router.db_for_read(Movie), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        self.assertEqual(self.router.db_for_read(Movie), 'default')
+
+    def test_write_sets_pin_cookie(self):
+        seen = []
+
+        def view(request):
+            seen.append(is_pinned())
+            return HttpResponse()
+
+        middleware = PrimaryPinningMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/login/'))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        request = factory.get('/movies/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        middleware(request)
+        middleware(factory.get('/movies/'))
+        self.assertEqual(seen, [True, True, False])
+
+
+REPLICA_READS = """
+import json
+import os
+import shutil
+from booking.models import Booking, Showtime
+from booking.tests import create_catalog
+from cinema_booking.routers import pin_to_primary
+from django.contrib.auth.models import User
+
+showtime, _ = create_catalog()
+user = User.objects.create_user('hari')
+Booking.objects.create(user=user, showtime=showtime, total_amount=300, status='Pending', booking_reference='R1')
+with pin_to_primary():
+    pinned = Showtime.objects.filter(id=showtime.id).exists()
+print(json.dumps({
+    'catalog': Showtime.objects.filter(id=showtime.id).exists(),
+    'pinned': pinned,
+    'bookings': Booking.objects.filter(showtime_id=showtime.id).count(),
+}))
+"""
+
+
+class ReplicaDatabaseTests(TestCase):
+    def test_reads_from_a_second_sqlite_file(self):
+        # The test database has no real replica, so this runs against two files:
+        # the replica is a copy taken before the writes, which it never sees
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = Path(directory) / 'primary.sqlite3', Path(directory) / 'replica.sqlite3'
+
+            def manage(*args, **env):
+                return subprocess.run(
+                    [sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                    env={**os.environ, 'DB_NAME': str(primary), **env}, timeout=300,
+                )
+
+            finished = manage('migrate', '--verbosity', '0')
+            self.assertEqual(finished.returncode, 0, finished.stderr)
+            shutil.copyfile(primary, replica)
+            finished = manage('shell', '--command', REPLICA_READS, DB_REPLICAS=str(replica))
+            self.assertEqual(finished.returncode, 0, finished.stderr)
+        results = json.loads(finished.stdout.splitlines()[-1])
+        self.assertEqual(results, {'catalog': False, 'pinned': True, 'bookings': 1})
+
+
+class EmailLoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hari', 'Hari@Example.com', 'secret-pass-123')
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, email, password):
+        return self.client.post(reverse('login'), {'email': email, 'password': password})
+
+    def test_email_is_case_insensitive(self):
+        response = self.login('hari@example.COM', 'secret-pass-123')
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+
+    def test_wrong_password(self):
+        response = self.login('hari@example.com', 'wrong')
+        self.assertContains(response, 'Invalid email or password!')
+
+    def test_duplicate_email_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('hari2', 'HARI@example.com', 'secret-pass-123')
+        User.objects.create_user('nomail1', '', 'secret-pass-123')
+        User.objects.create_user('nomail2', '', 'secret-pass-123')
+
+    @override_settings(LOGIN_THROTTLE_RATES={'ip': (3, 60), 'account': (10, 60)})
+    def test_throttled_before_password_check(self):
+        for _ in range(3):
+            self.login('hari@example.com', 'wrong')
+        with mock.patch('django.contrib.auth.models.User.check_password') as check_password:
+            response = self.login('hari@example.com', 'secret-pass-123')
+        check_password.assert_not_called()
+        self.assertContains(response, 'Too many login attempts')
+
+
+class SessionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('gita', 'gita@example.com', 'secret-pass-123')
+
+    # The engine used when CACHE_BACKEND is a shared cache
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_authenticated_views_skip_session_table(self):
+        self.client.force_login(self.user)
+        for url in (reverse('my_bookings'), reverse('select_seats', args=[self.showtime.id])):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            session_queries = [q['sql'] for q in ctx.captured_queries if 'django_session' in q['sql']]
+            self.assertEqual(session_queries, [], url)
+
+    def test_local_cache_keeps_sessions_in_the_database(self):
+        # Without a shared cache another worker would keep serving a logged-out session
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.client.force_login(self.user)
+        session_key = self.client.session.session_key
+        self.client.get(reverse('logout'))
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+
+    def test_purge_expired_sessions(self):
+        Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(days=1))
+        Session.objects.create(session_key='active', session_data='', expire_date=timezone.now() + timedelta(days=1))
+        call_command('purge_sessions', batch_size=1, pause=0, stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['active'])
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('movie_detail', args=[self.showtime.movie_id]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+
+    def test_repeated_queries_are_logged(self):
+        def view(request):
+            for seat in Seat.objects.all():
+                seat.screen.name
+            return HttpResponse()
+
+        middleware = RequestTimingMiddleware(view)
+        with self.assertLogs('booking.performance', 'WARNING') as logs:
+            middleware(RequestFactory().get('/seats/'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'repeated_queries')
+        self.assertEqual(record['repeated_queries'][0]['count'], len(self.seats))
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('booking.performance', 'WARNING') as logs:
+            self.client.get(reverse('home'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'slow_request')
+        self.assertEqual(record['view'], 'home')
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'staff-pass-123', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILER_DIR=directory.name, PROFILER_INTERVAL=0.0005)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_unsigned_requests_are_not_profiled(self):
+        response = self.client.get(reverse('home'), {'_profile': 'forged'})
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(list_profiles(), [])
+
+    def test_token_profiles_request(self):
+        token = make_token(self.staff)
+        response = self.client.get(
+            reverse('movie_detail', args=[self.showtime.movie_id]), HTTP_X_PROFILE_TOKEN=token,
+        )
+        name = response['X-Profile']
+        self.assertIn('movie_detail', name)
+
+        self.client.force_login(self.staff)
+        listing = self.client.get(reverse('profile_list'))
+        self.assertContains(listing, name)
+        download = self.client.get(reverse('profile_download', args=[name]))
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+    def test_profile_pages_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('profile_list')).status_code, 302)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('mina', 'mina@example.com', 'secret-pass-123')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(METRICS_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_booking_funnel(self):
+        before = self.scrape()
+        self.client.force_login(self.user)
+        self.client.post(reverse('select_seats', args=[self.showtime.id]), {'seats': [self.seats[0].id, self.seats[1].id]})
+        held = self.scrape()
+        booking = Booking.objects.get()
+        self.client.post(reverse('process_payment', args=[booking.id]), {'payment_method': 'esewa'})
+        after = self.scrape()
+
+        def delta(sample, start=before):
+            return after.get(sample, 0) - start.get(sample, 0)
+
+        self.assertEqual(delta('booking_holds_total'), 1)
+        self.assertEqual(delta('booking_seats_held_total'), 2)
+        self.assertEqual(delta('booking_confirmations_total{payment_method="esewa"}'), 1)
+        self.assertEqual(delta('booking_payment_duration_seconds_count{payment_method="esewa"}'), 1)
+        self.assertEqual(held['booking_held_seats'], 2)
+        self.assertEqual(after['booking_held_seats'], 0)
+        self.assertEqual(after['booking_sold_seats'], 2)
+
+    def test_snapshots_of_other_processes_are_summed(self):
+        before = self.scrape().get('booking_holds_total', 0)
+        (self.directory / '99999999-1.json').write_text(json.dumps({'booking_holds_total': [[[], 5]]}))
+        self.assertEqual(self.scrape()['booking_holds_total'], before + 5)
+        # The snapshot of the exited process was folded into the cumulative file
+        self.assertFalse((self.directory / '99999999-1.json').exists())
+        self.assertTrue((self.directory / 'cumulative.json').exists())
+        (self.directory / '99999998-1.json').write_text(json.dumps({'booking_holds_total': [[[], 2]]}))
+        self.assertEqual(self.scrape()['booking_holds_total'], before + 7)
+        self.assertEqual(
+            {path.name for path in self.directory.glob('*.json')},
+            {'cumulative.json', f'{metrics.REGISTRY.process_id}.json'},
+        )
+
+    def test_remote_scrapers_are_refused(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.8').status_code, 404)
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'booking.assets.CompressedManifestStaticFilesStorage'}}
+        settings_override = override_settings(STATIC_ROOT=directory.name, STORAGES=storages, SERVE_STATIC=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_pages_link_hashed_assets(self):
+        content = self.client.get(reverse('login')).content.decode()
+        self.assertNotIn('<style>', content)
+        self.assertRegex(content, r'/static/booking/css/base\.[0-9a-f]{12}\.css')
+        self.assertRegex(content, r'/static/booking/js/login\.[0-9a-f]{12}\.js')
+
+    def test_hashed_asset_is_precompressed_and_immutable(self):
+        url = static('booking/css/base.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn(b'.movie-card', gzip.decompress(b''.join(response.streaming_content)))
+
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=plain['ETag']).status_code, 304)
+
+    def test_unhashed_names_are_cached_briefly(self):
+        response = self.client.get('/static/booking/css/base.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+
+class SyntheticDatasetTests(TestCase):
+    def generate(self, **options):
+        # Yesterday is over, today's showtimes are still ahead
+        options.setdefault('start', timezone.localdate() - timedelta(days=1))
+        spec = DatasetSpec(cinemas=2, screens_per_cinema=2, movies=5, days=2, past_days=1, users=20,
+                           sellout_ratio=0.25, cancellation_rate=0.2, pending_rate=0.2, batch_size=50, **options)
+        return SyntheticDataset(spec).generate()
+
+    def signature(self):
+        return list(Booking.objects.order_by('id').values_list(
+            'booking_reference', 'user__username', 'showtime__start_time', 'booking_date', 'total_amount', 'status',
+        ))
+
+    def test_corpus_is_consistent(self):
+        counts = self.generate()
+        self.assertEqual(counts['Showtime'], 2 * 2 * 2 * 4)
+        self.assertEqual(SeatBooking.objects.count(), Booking.seats.through.objects.count())
+        self.assertFalse(SeatBooking.objects.filter(is_booked=True, booking__status='Cancelled').exists())
+        self.assertEqual(
+            SeatBooking.objects.filter(is_booked=False).count(),
+            Booking.seats.through.objects.filter(booking__status='Cancelled').count(),
+        )
+        self.assertEqual(Payment.objects.count(), Booking.objects.exclude(status='Pending').count())
+        self.assertEqual(
+            CancellationRequest.objects.count(), Booking.objects.filter(status='Cancelled').count(),
+        )
+        self.assertFalse(Booking.objects.filter(booking_date__gt=timezone.now()).exists())
+
+    def test_same_seed_same_corpus(self):
+        with transaction.atomic():
+            self.generate(seed=3)
+            first = self.signature()
+            transaction.set_rollback(True)
+        self.generate(seed=3)
+        self.assertEqual(self.signature(), first)
+
+    def test_corpus_does_not_depend_on_the_clock(self):
+        now = timezone.now()
+        start = timezone.localdate() - timedelta(days=1)
+        with transaction.atomic(), mock.patch('django.utils.timezone.now', return_value=now):
+            self.generate(seed=3, start=start)
+            first = self.signature()
+            transaction.set_rollback(True)
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(days=10)):
+            self.generate(seed=3, start=start)
+        self.assertEqual(self.signature(), first)
+        self.assertTrue(any(status == 'Pending' for *_, status in first))
+
+
+class SeatArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+
+    def book(self, seats, pay=True):
+        self.client.post(reverse('select_seats', args=[self.showtime.id]), {'seats': [seat.id for seat in seats]})
+        booking = Booking.objects.latest('id')
+        if pay:
+            self.client.post(reverse('process_payment', args=[booking.id]), {'payment_method': 'esewa'})
+        return booking
+
+    def end_showtime(self):
+        ended = timezone.now() - timedelta(days=2)
+        Showtime.objects.filter(id=self.showtime.id).update(start_time=ended - timedelta(hours=3), end_time=ended)
+        self.showtime.refresh_from_db()
+
+    def test_bitmap_round_trip(self):
+        seat_ids = {105, 106, 120, 131}
+        self.assertEqual(unpack_bitmap(100, pack_bitmap(100, seat_ids)), seat_ids)
+
+    def test_compaction_is_transparent(self):
+        self.client.force_login(self.user)
+        sold = self.book(self.seats[:3])
+        unpaid = self.book(self.seats[5:7], pay=False)
+        self.end_showtime()
+
+        call_command('compact_seat_bookings', stdout=StringIO())
+        self.assertFalse(SeatBooking.objects.exists())
+        unpaid.refresh_from_db()
+        self.assertEqual(unpaid.status, 'Cancelled')
+        self.assertEqual(
+            list(BookingEvent.objects.filter(booking=unpaid).order_by('id').values_list('kind', flat=True)),
+            ['booking.held', 'booking.expired', 'seats.released'],
+        )
+        archive = SeatArchive.objects.get(showtime=self.showtime)
+        self.assertEqual(archive.sold_seats, 3)
+        self.assertEqual(archive.seat_bookings(), {seat.id: sold.id for seat in self.seats[:3]})
+
+        # The unpaid hold expired; the sold seats still show as taken
+        self.assertEqual(booked_seat_ids(self.showtime), {seat.id for seat in self.seats[:3]})
+        response = self.client.get(reverse('select_seats', args=[self.showtime.id]))
+        self.assertEqual(response.context['booked_seats'], {seat.id for seat in self.seats[:3]})
+        response = self.client.get(reverse('booking_confirmation', args=[sold.id]))
+        self.assertContains(response, sold.booking_reference)
+        self.assertContains(response, str(self.seats[0]))
+
+    def test_recent_showtimes_are_kept(self):
+        self.client.force_login(self.user)
+        self.book(self.seats[:2])
+        call_command('compact_seat_bookings', stdout=StringIO())
+        self.assertEqual(SeatBooking.objects.count(), 2)
+        self.assertFalse(SeatArchive.objects.exists())
+
+    def test_cancelling_archived_booking_releases_seats(self):
+        self.client.force_login(self.user)
+        first = self.book(self.seats[:2])
+        self.book(self.seats[2:4])
+        self.end_showtime()
+        call_command('compact_seat_bookings', stdout=StringIO())
+
+        self.assertEqual(release_booking_seats(first), 2)
+        archive = SeatArchive.objects.get(showtime=self.showtime)
+        self.assertEqual(archive.sold_seats, 2)
+        self.assertEqual(archive.booked_seat_ids(), {seat.id for seat in self.seats[2:4]})
+
+    def test_cleanup_locks_the_showtime(self):
+        self.client.force_login(self.user)
+        booking = self.book(self.seats[:2])
+        # A cancellation recorded without releasing its seats
+        Booking.objects.filter(id=booking.id).update(status='Cancelled')
+        with mock.patch('booking.management.commands.release_cancelled_seats.lock_showtimes') as lock:
+            call_command('release_cancelled_seats', stdout=StringIO())
+        lock.assert_called_once_with([self.showtime.id])
+        self.assertEqual(booked_seat_ids(self.showtime), set())
+
+
+class AvailabilityApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        return self.client.get(reverse('availability'), params)
+
+    def test_seats_left_for_showtime_ids(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('select_seats', args=[self.showtime.id]), {'seats': [s.id for s in self.seats[:3]]})
+        self.client.logout()
+
+        with self.assertNumQueries(2):
+            response = self.get(showtimes=f'{self.showtime.id}')
+        row, = response.json()['showtimes']
+        self.assertEqual((row['id'], row['total_seats'], row['seats_left']), (self.showtime.id, 20, 17))
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_cinema_and_date_filter(self):
+        day = timezone.localtime(self.showtime.start_time).date()
+        data = self.get(cinema=self.showtime.screen.cinema_id, date=f'{day:%Y-%m-%d}').json()
+        self.assertEqual([row['id'] for row in data['showtimes']], [self.showtime.id])
+        self.assertFalse(data['has_next'])
+        self.assertEqual(self.get(date=f'{day + timedelta(days=1):%Y-%m-%d}').json()['showtimes'], [])
+
+    def test_conditional_get(self):
+        response = self.get(showtimes=f'{self.showtime.id}')
+        again = self.client.get(
+            reverse('availability'), {'showtimes': self.showtime.id}, HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(again.status_code, 304)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.get().status_code, 400)
+        self.assertEqual(self.get(showtimes='1,x').status_code, 400)
+        self.assertEqual(self.get(date='tomorrow').status_code, 400)
+        with self.settings(AVAILABILITY_MAX_SHOWTIMES=2):
+            self.assertEqual(self.get(showtimes='1,2,3').status_code, 400)
+
+
+class SeatsTogetherTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+
+    def search(self, **params):
+        response = self.client.get(reverse('seats_together', args=[self.showtime.movie_id]), {
+            'date': f'{timezone.localtime(self.showtime.start_time):%Y-%m-%d}', **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.context['results']
+
+    # Takes 11 seats in one booking
+    @override_settings(HOLD_QUOTAS={})
+    def test_index_follows_reservations(self):
+        self.client.force_login(self.user)
+        # A4 and the whole of row B: the longest free run is A5-A10
+        taken = [self.seats[3], *self.seats[10:]]
+        self.client.post(reverse('select_seats', args=[self.showtime.id]), {'seats': [s.id for s in taken]})
+        inventory = ShowtimeInventory.objects.get(showtime=self.showtime)
+        self.assertEqual((inventory.seats_left, inventory.longest_run, inventory.longest_vip), (9, 6, 0))
+
+        self.assertEqual([s.id for s in self.search(party_size=6)], [self.showtime.id])
+        self.assertEqual(self.search(party_size=7), [])
+        self.assertEqual(self.search(party_size=2, seat_type='VIP'), [])
+
+        release_booking_seats(Booking.objects.get())
+        self.assertEqual(ShowtimeInventory.objects.get(showtime=self.showtime).longest_run, 10)
+
+    def test_unindexed_showtimes_are_indexed_on_search(self):
+        self.assertFalse(ShowtimeInventory.objects.exists())
+        with self.assertNumQueries(10):
+            results = self.search(party_size=4)
+        self.assertEqual([s.id for s in results], [self.showtime.id])
+        self.assertTrue(ShowtimeInventory.objects.filter(showtime=self.showtime, seats_left=20).exists())
+
+    def test_aisles_break_runs(self):
+        layout = parse_layout('rows: A\nseats: 8\naisles: 4\nVIP: A')
+        screen = Screen.objects.create(cinema=self.showtime.screen.cinema, name='Audi 2')
+        apply_layout(screen, layout)
+        summary = summarize(screen_rows([screen])[screen.id], booked=set())
+        self.assertEqual((summary['seats_left'], summary['longest_run'], summary['longest_vip']), (8, 4, 4))
+
+
+class AsyncCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_catalog_pages_through_asgi(self):
+        home = await self.async_client.get(reverse('home'))
+        self.assertEqual([movie.title for movie in home.context['now_showing']], ['Sholay'])
+        self.assertEqual([movie.title for movie in home.context['coming_soon']], ['Upcoming'])
+        self.assertIn('Server-Timing', home)
+
+        day = timezone.localtime(self.showtime.start_time).date()
+        detail = await self.async_client.get(
+            reverse('movie_detail', args=[self.showtime.movie_id]), {'date': f'{day:%Y-%m-%d}'},
+        )
+        self.assertEqual(detail.context['showtimes'], [self.showtime])
+        self.assertEqual(len(detail.context['cinemas']), 1)
+
+        response = await self.async_client.get(reverse('availability'), {'showtimes': self.showtime.id})
+        self.assertEqual(response.json()['showtimes'][0]['seats_left'], 20)
+
+    async def test_missing_movie(self):
+        response = await self.async_client.get(reverse('movie_detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class WarmShowtimesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.screen = Screen.objects.create(cinema=cls.showtime.screen.cinema, name='Audi 2')
+        apply_layout(cls.screen, parse_layout('rows: A-B\nseats: 6'))
+        start = cls.showtime.start_time + timedelta(days=1)
+        cls.later = Showtime.objects.create(
+            movie=cls.showtime.movie, screen=cls.screen, start_time=start, end_time=start + timedelta(hours=3), price=300,
+        )
+
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        image = BytesIO()
+        Image.new('RGB', (1200, 1800), 'navy').save(image, 'JPEG')
+        self.movie = self.showtime.movie
+        self.movie.poster.save('poster.jpg', ContentFile(image.getvalue()))
+
+    def test_warms_every_step(self):
+        out = StringIO()
+        call_command('warm_showtimes', movie=[self.movie.id], workers=2, stdout=out)
+        self.assertIn('Warmed 2 showtimes of 1 movies', out.getvalue())
+
+        self.assertEqual(ShowtimeInventory.objects.filter(showtime__movie=self.movie).count(), 2)
+        self.assertIsNotNone(cache.get(seat_map_key(self.screen)))
+        day = timezone.localtime(self.later.start_time).date()
+        self.assertEqual(cache.get(movie_detail_key(self.movie.id, day))['showtimes'], [self.later])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('movie_detail', args=[self.movie.id]), {'date': f'{day:%Y-%m-%d}'})
+        self.assertContains(response, '-800w.webp')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('availability'), {'movie': self.movie.id, 'date': f'{day:%Y-%m-%d}'})
+
+    def test_poster_falls_back_to_original(self):
+        self.assertEqual(poster_url(self.movie, 'card'), self.movie.poster.url)
+        self.assertEqual(make_variants(self.movie), 2)
+        self.assertTrue(poster_url(self.movie, 'card').endswith('poster-400w.webp'))
+        self.assertEqual(make_variants(self.movie), 0)
+
+
+class GatherQuerysetsTests(TransactionTestCase):
+    def test_querysets_run_concurrently(self):
+        create_catalog()
+        querysets = (Movie.objects.filter(is_now_showing=True), Movie.objects.filter(is_now_showing=False))
+        with SimulatedLatency(0.2):
+            started = time.perf_counter()
+            showing, upcoming = async_to_sync(gather_querysets)(*querysets)
+            elapsed = time.perf_counter() - started
+        self.assertEqual([movie.title for movie in showing], ['Sholay'])
+        self.assertEqual([movie.title for movie in upcoming], ['Upcoming'])
+        self.assertLess(elapsed, 0.35)
+
+
+class ImportFileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+
+    def run_import(self, importer, text, fmt='csv'):
+        rejects = StringIO()
+        stats = importer(batch_size=2).run(read_rows(StringIO(text), fmt), RejectWriter(rejects, fmt))
+        return stats, rejects.getvalue()
+
+    def test_schedules(self):
+        day = timezone.localdate() + timedelta(days=3)
+        text = '\n'.join([
+            'movie,cinema,screen,start_time,price',
+            f'Sholay,ASA,Audi 1,{day} 10:00,350',
+            f'{self.showtime.movie_id},ASA,Audi 1,{day} 12:00,350',
+            f'Sholay,ASA,Audi 1,{day} 20:00,350',
+            f'Nope,ASA,Audi 1,{day} 23:00,350',
+            f'Sholay,ASA,Audi 9,{day} 23:00,350',
+        ])
+        stats, rejects = self.run_import(ScheduleImporter, text)
+        self.assertEqual((stats.read, stats.imported, stats.rejected), (5, 2, 3))
+        self.assertEqual(Showtime.objects.filter(start_time__date=day).count(), 2)
+        errors = [row['error'] for row in csv.DictReader(StringIO(rejects))]
+        self.assertIn('Overlaps', errors[0])
+        self.assertEqual(errors[1:], ["Unknown movie 'Nope'.", "Unknown screen 'Audi 9' in cinema 'ASA'."])
+
+    def test_bookings(self):
+        text = '\n'.join(json.dumps(row) for row in [
+            {'reference': 'P1', 'showtime': self.showtime.id, 'seats': 'A1 A2', 'email': 'sita@example.com'},
+            {'reference': 'P2', 'showtime': self.showtime.id, 'seats': ['A2'], 'email': 'new@partner.test'},
+            {'reference': 'P3', 'showtime': self.showtime.id, 'seats': 'Z9', 'email': 'new@partner.test'},
+            {'reference': 'P4', 'showtime': self.showtime.id, 'seats': 'B1', 'email': 'new@partner.test',
+             'status': 'Pending'},
+        ]) + '\nnot json\n'
+        stats, rejects = self.run_import(BookingImporter, text, 'jsonl')
+        self.assertEqual((stats.imported, stats.rejected), (2, 3))
+        self.assertEqual(
+            [json.loads(line)['error'] for line in rejects.splitlines()][:2],
+            ['Already booked: A2.', 'No such seat on this screen: Z9.'],
+        )
+        first = Booking.objects.get(booking_reference='P1')
+        self.assertEqual((first.user, first.total_amount, first.payment.status), (self.user, 600, 'completed'))
+        self.assertEqual(booked_seat_ids(self.showtime), {self.seats[0].id, self.seats[1].id, self.seats[10].id})
+        self.assertFalse(User.objects.get(email='new@partner.test').has_usable_password())
+        self.assertEqual(ShowtimeInventory.objects.get(showtime=self.showtime).seats_left, 17)
+
+    def test_constraint_errors_only_reject_their_row(self):
+        User.objects.create_user('taken@partner.test', 'someone-else@example.com', 'x')
+        text = '\n'.join([
+            'reference,showtime,seats,email',
+            f'P1,{self.showtime.id},A1,taken@partner.test',
+            f'P2,{self.showtime.id},A2,sita@example.com',
+        ])
+        stats, rejects = self.run_import(BookingImporter, text)
+        self.assertEqual((stats.imported, stats.rejected), (1, 1))
+        self.assertIn('Database error', rejects)
+        self.assertTrue(Booking.objects.filter(booking_reference='P2').exists())
+
+    def test_bookings_match_customers_regardless_of_case(self):
+        alice = User.objects.create_user('alice', 'Alice@Example.com', 'secret-pass-123')
+        text = '\n'.join([
+            'reference,showtime,seats,email',
+            f'P1,{self.showtime.id},A1,alice@example.com',
+            f'P2,{self.showtime.id},A2,ALICE@example.COM',
+        ])
+        stats, rejects = self.run_import(BookingImporter, text)
+        self.assertEqual((stats.imported, stats.rejected), (2, 0), rejects)
+        self.assertEqual(set(Booking.objects.values_list('user', flat=True)), {alice.id})
+        self.assertEqual(User.objects.count(), 2)
+
+
+class TicketTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+        cls.booking = Booking.objects.create(
+            user=cls.user, showtime=cls.showtime, total_amount=600, status='Confirmed', booking_reference='TICKET1',
+        )
+        cls.booking.seats.set(cls.seats[:2])
+
+    def setUp(self):
+        ticket_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(ticket_dir.cleanup)
+        self.enterContext(override_settings(TICKET_DIR=ticket_dir.name))
+        self.client.force_login(self.user)
+
+    def test_signed_payload(self):
+        token = tickets.make_token(self.booking)
+        self.assertEqual(token, tickets.make_token(self.booking))
+        self.assertEqual(
+            tickets.read_token(token), {'ref': 'TICKET1', 'showtime': self.showtime.id, 'seats': ['A1', 'A2']},
+        )
+        with self.assertRaises(signing.BadSignature):
+            tickets.read_token(token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+
+    def test_pdf_is_rendered_once_per_content(self):
+        url = reverse('ticket_file', args=[self.booking.id, 'pdf'])
+        with mock.patch('booking.tickets.render_pdf', wraps=tickets.render_pdf) as render:
+            first = self.client.get(url)
+            self.assertEqual(first['Content-Type'], 'application/pdf')
+            self.assertTrue(b''.join(first.streaming_content).startswith(b'%PDF'))
+            self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            self.assertEqual(render.call_count, 1)
+
+            self.booking.seats.add(self.seats[2])
+            second = self.client.get(url)
+            self.assertNotEqual(second['ETag'], first['ETag'])
+            self.assertEqual(render.call_count, 2)
+
+    def test_only_confirmed_bookings_of_the_user(self):
+        self.booking.status = 'Pending'
+        self.booking.save()
+        self.assertEqual(self.client.get(reverse('ticket_file', args=[self.booking.id, 'pdf'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('ticket_file', args=[self.booking.id, 'gif'])).status_code, 404)
+
+    @skipUnless(tickets.qrcode, 'qrcode is not installed')
+    def test_qr_code(self):
+        response = self.client.get(reverse('ticket_file', args=[self.booking.id, 'png']))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertContains(self.client.get(reverse('booking_confirmation', args=[self.booking.id])), 'ticket.png')
+
+
+class CheckinTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.showtime, cls.seats = create_catalog()
+        cls.user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+        cls.usher = User.objects.create_user('usher', 'usher@example.com', 'secret-pass-123', is_staff=True)
+        cls.bookings = {}
+        for index, (reference, status) in enumerate([('DOOR2', 'Confirmed'), ('DOOR1', 'Confirmed'), ('DOOR3', 'Cancelled')]):
+            booking = Booking.objects.create(
+                user=cls.user, showtime=cls.showtime, total_amount=300, status=status, booking_reference=reference,
+            )
+            booking.seats.set([cls.seats[index]])
+            cls.bookings[reference] = booking
+
+    def test_api_admits_once(self):
+        url = reverse('checkin')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(url, {'reference': 'DOOR1'}).status_code, 403)
+
+        self.client.force_login(self.usher)
+        code = tickets.make_token(self.bookings['DOOR1'])
+        first = self.client.post(url, {'code': code, 'showtime': self.showtime.id, 'gate': 'North'})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['seats'], ['A2'])
+        again = self.client.post(url, {'reference': 'door1'})
+        self.assertEqual(again.status_code, 409)
+        self.assertEqual((again.json()['status'], again.json()['gate']), ('already_admitted', 'North'))
+        self.assertEqual(Admission.objects.get().booking, self.bookings['DOOR1'])
+
+        self.assertEqual(self.client.post(url, {'reference': 'DOOR3'}).json()['status'], 'not_confirmed')
+        self.assertEqual(self.client.post(url, {'reference': 'DOOR2', 'showtime': 999}).json()['status'], 'wrong_showtime')
+        self.assertEqual(self.client.post(url, {'reference': 'NOPE'}).status_code, 404)
+        self.assertEqual(self.client.post(url, {'code': code[:-2]}).status_code, 400)
+
+    def test_offline_snapshot_and_reconciliation(self):
+        checkin.admit('DOOR1', gate='North')
+        with tempfile.TemporaryDirectory() as output:
+            call_command('export_checkin_snapshot', showtime=[self.showtime.id], output=output, stdout=StringIO())
+            path = Path(output) / f'showtime-{self.showtime.id}.snapshot'
+            snapshot = checkin.Snapshot.load(path)
+            data = path.read_text()
+            with self.assertRaises(signing.BadSignature):
+                checkin.Snapshot.loads(data[:10] + ('x' if data[10] != 'x' else 'y') + data[11:])
+
+        self.assertEqual(snapshot.refs, ['DOOR1', 'DOOR2'])
+        self.assertEqual(snapshot.admit('DOOR3').status, checkin.UNKNOWN)
+        self.assertEqual(snapshot.admit('DOOR1').status, checkin.ALREADY_ADMITTED)
+        self.assertEqual(snapshot.admit('DOOR2', gate='South').seats, ['A1'])
+        self.assertEqual(snapshot.admit('DOOR2').status, checkin.ALREADY_ADMITTED)
+
+        scans = StringIO()
+        snapshot.write_scans(scans)
+        # Another scanner let the same tickets in while offline too
+        other = checkin.Snapshot.loads(checkin.dump_snapshot(self.showtime))
+        other.admit('DOOR1')
+        other.admit('DOOR2')
+        other.write_scans(scans)
+
+        rejects = StringIO()
+        stats = AdmissionImporter().run(read_rows(StringIO(scans.getvalue()), 'jsonl'), RejectWriter(rejects, 'jsonl'))
+        self.assertEqual((stats.read, stats.imported, stats.rejected), (2, 1, 1))
+        admission = Admission.objects.get(booking=self.bookings['DOOR2'])
+        self.assertEqual((admission.source, admission.gate), ('offline', 'South'))
+        self.assertIn('Already admitted', json.loads(rejects.getvalue())['error'])
+
+
+class StressBookingTests(TestCase):
+    def test_hold_claims_free_seats_only(self):
+        showtime, seats = create_catalog()
+        user = User.objects.create_user('sita', 'sita@example.com', 'secret-pass-123')
+        first = hold_seats(user, showtime, [seats[0].id, seats[1].id])
+        with self.assertRaises(SeatsUnavailable):
+            hold_seats(user, showtime, [seats[1].id, seats[2].id])
+        # The failed hold left nothing behind
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertFalse(SeatBooking.objects.filter(seat=seats[2], is_booked=True).exists())
+        self.assertEqual(check_invariants(), [])
+
+        SeatBooking.objects.filter(booking=first).update(booking=None)
+        self.assertEqual(len(check_invariants()), 2)
+
+    def test_concurrent_workers_keep_invariants(self):
+        # The test database lives in memory, where SQLite cannot make concurrent
+        # writers wait; the command runs against a file database of its own.
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'stress.json'
+            command = [
+                sys.executable, 'manage.py', 'stress_booking', '--processes',
+                '--workers', '4', '--operations', '12', '--hot-seats', '6', '--seed', '3', '--output', str(output),
+            ]
+            finished = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=300)
+            self.assertEqual(finished.returncode, 0, finished.stdout + finished.stderr)
+            results = json.loads(output.read_text())
+        self.assertEqual(results['violations'], [])
+        self.assertEqual(results['errors'], 0, results['outcomes'])
+        self.assertEqual(results['operations'], 48)
+        self.assertGreater(results['outcomes']['book'].get('seats_taken', 0), 0)
+
+
+class LoadTestTests(TestCase):
+    def test_harness_completes_every_flow(self):
+        # Like stress_booking, the harness serves a file database of its own
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'loadtest.json'
+            command = [
+                sys.executable, 'manage.py', 'loadtest',
+                '--users', '3', '--iterations', '2', '--cinemas', '1', '--output', str(output),
+            ]
+            finished = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=300)
+            self.assertEqual(finished.returncode, 0, finished.stdout + finished.stderr)
+            results = json.loads(output.read_text())
+        self.assertEqual(results['crashed_users'], 0, results['crashes'])
+        self.assertEqual(sum(results['flows'].values()), 6)
+        self.assertEqual(results['double_booked_seats'], 0)
+        self.assertGreater(results['endpoints']['process_payment']['requests'], 0)
+
+
+class BookingEventTests(TestCase):
+    def setUp(self):
+        self.showtime, self.seats = create_catalog()
+        self.user = User.objects.create_user('hari', 'hari@example.com', 'secret-pass-123')
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123')
+
+    def test_changes_are_logged_in_their_transaction(self):
+        booking = hold_seats(self.user, self.showtime, [self.seats[0].id, self.seats[1].id])
+        confirm_booking(booking, 'esewa')
+        self.assertIsNone(confirm_booking(booking, 'esewa'))
+        with self.assertRaises(SeatsUnavailable):
+            hold_seats(self.user, self.showtime, [self.seats[1].id])
+        self.client.force_login(self.user)
+        self.client.post(reverse('cancel_booking', args=[booking.id]), {'reason': 'Change of plans'})
+        approve_cancellation(CancellationRequest.objects.get(booking=booking), self.admin)
+
+        logged = list(BookingEvent.objects.order_by('id'))
+        self.assertEqual([event.kind for event in logged], [
+            'booking.held', 'booking.confirmed', 'payment.completed', 'cancellation.requested',
+            'cancellation.approved', 'booking.cancelled', 'seats.released', 'payment.refunded',
+        ])
+        self.assertTrue(all(event.booking_id == booking.id for event in logged))
+        self.assertEqual(logged[0].data['seat_ids'], sorted([self.seats[0].id, self.seats[1].id]))
+        self.assertEqual(logged[6].data, {'count': 2, 'reason': 'cancellation'})
+
+    def test_consumers_resume_from_their_cursor(self):
+        hold_seats(self.user, self.showtime, [self.seats[0].id])
+        hold_seats(self.user, self.showtime, [self.seats[1].id])
+        seen = []
+        self.assertEqual(events.consume('analytics', seen.extend, limit=1), 1)
+        self.assertEqual(events.consume('analytics', seen.extend), 1)
+        self.assertEqual(events.consume('analytics', seen.extend), 0)
+        self.assertEqual([event.id for event in seen], list(BookingEvent.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(EventCursor.objects.get(name='analytics').position, seen[-1].id)
+
+        # A handler that fails leaves the cursor where it was
+        hold_seats(self.user, self.showtime, [self.seats[2].id])
+        with self.assertRaises(ZeroDivisionError):
+            events.consume('analytics', lambda batch: 1 / 0)
+        self.assertEqual(events.position('analytics'), seen[-1].id)
+
+        out = StringIO()
+        call_command('tail_events', consumer='analytics', json=True, stdout=out)
+        self.assertEqual([json.loads(line)['kind'] for line in out.getvalue().splitlines()], ['booking.held'])
+        out = StringIO()
+        call_command('tail_events', kind=['booking.held'], stdout=out)
+        self.assertEqual(out.getvalue().count('booking.held'), 3)
+        self.assertIn('Read 3 events', out.getvalue())
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.showtime, self.seats = create_catalog()
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'secret-pass-123')
+        self.users = [User.objects.create_user(f'fan{i}', f'fan{i}@example.com', 'secret-pass-123') for i in range(6)]
+        # Sold out: two seats to one customer, the rest to another
+        self.pair = hold_seats(self.users[0], self.showtime, [self.seats[0].id, self.seats[1].id])
+        confirm_booking(self.pair, 'esewa')
+        confirm_booking(hold_seats(self.users[1], self.showtime, [seat.id for seat in self.seats[2:]]), 'esewa')
+
+    def test_released_seats_go_to_the_first_party_that_fits(self):
+        too_big = waitlist.join(self.users[2], self.showtime, 3)
+        vip = waitlist.join(self.users[3], self.showtime, 1, 'VIP')
+        single = waitlist.join(self.users[4], self.showtime, 1)
+        second = waitlist.join(self.users[5], self.showtime, 2)
+        self.assertEqual(WaitlistEntry.objects.filter(status='Waiting').count(), 4)
+
+        CancellationRequest.objects.create(booking=self.pair, reason='Cannot make it')
+        approve_cancellation(CancellationRequest.objects.get(booking=self.pair), self.admin)
+        single.refresh_from_db()
+        self.assertEqual(single.status, 'Offered')
+        self.assertEqual(list(single.booking.seats.values_list('id', flat=True)), [self.seats[0].id])
+        self.assertEqual(
+            list(WaitlistEntry.objects.filter(status='Waiting').order_by('id')), [too_big, vip, second],
+        )
+        offer = BookingEvent.objects.get(kind='waitlist.offered')
+        self.assertEqual((offer.booking_id, offer.data['seats']), (single.booking_id, 1))
+
+        # The offer is not paid in time: its seat and the one left go to the next party
+        Booking.objects.filter(id=single.booking_id).update(booking_date=timezone.now() - timedelta(minutes=20))
+        out = StringIO()
+        call_command('expire_holds', stdout=out)
+        self.assertIn('Expired 1 holds, released 1 seats', out.getvalue())
+        single.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((single.status, single.booking.status), ('Expired', 'Cancelled'))
+        self.assertEqual(second.status, 'Offered')
+        self.assertEqual(sorted(second.booking.seats.values_list('id', flat=True)), [self.seats[0].id, self.seats[1].id])
+        self.assertEqual(check_invariants(), [])
+
+    def test_join_from_the_seat_page(self):
+        self.client.force_login(self.users[2])
+        url = reverse('join_waitlist', args=[self.showtime.id])
+        response = self.client.post(url, {'seats': 3, 'seat_type': ''})
+        self.assertRedirects(response, reverse('select_seats', args=[self.showtime.id]))
+        self.client.post(url, {'seats': 3, 'seat_type': ''})
+        self.assertEqual(WaitlistEntry.objects.filter(user=self.users[2]).count(), 1)
+        self.assertEqual(self.client.post(url, {'seats': 0}).status_code, 302)
+        self.assertEqual(WaitlistEntry.objects.count(), 1)
+
+        # Seats free when joining are held straight away, past parties too big for them
+        Booking.objects.filter(id=self.pair.id).update(status='Cancelled')
+        release_booking_seats(self.pair)
+        self.client.force_login(self.users[3])
+        response = self.client.post(url, {'seats': 2})
+        entry = WaitlistEntry.objects.get(user=self.users[3])
+        self.assertEqual(entry.status, 'Offered')
+        self.assertRedirects(response, reverse('payment_page', args=[entry.booking_id]))
+
+
+    @override_settings(HOLD_QUOTAS={'seats_per_booking': 10, 'pending_per_user': 4, 'pending_per_showtime': 1})
+    def test_offers_and_joins_respect_hold_quotas(self):
+        early = waitlist.join(self.users[2], self.showtime, 1)
+        late = waitlist.join(self.users[3], self.showtime, 1)
+        Booking.objects.filter(id=self.pair.id).update(status='Cancelled')
+        release_booking_seats(self.pair)
+        # The first party's customer grabs a seat meanwhile and is at quota
+        hold_seats(self.users[2], self.showtime, [self.seats[0].id])
+        self.assertEqual(waitlist.offer_released_seats(self.showtime), [late])
+        early.refresh_from_db()
+        self.assertEqual(early.status, 'Waiting')
+
+        # An unpaid offer can't be stacked with another one
+        with self.assertRaisesMessage(waitlist.WaitlistError, 'already held for you'):
+            waitlist.join(self.users[3], self.showtime, 1)
+        with self.assertRaisesMessage(waitlist.WaitlistError, 'at most 10 seats'):
+            waitlist.join(self.users[4], self.showtime, 11)
+        self.assertEqual(WaitlistEntry.objects.count(), 2)
+        self.assertEqual(Booking.objects.filter(user=self.users[3], status='Pending').count(), 1)
+
+
+@override_settings(
+    HOLD_QUOTAS={'seats_per_booking': 3, 'pending_per_user': 1, 'pending_per_showtime': 1},
+    HOLD_THROTTLE_RATES={'user': (5, 60), 'ip': (50, 60)},
+)
+class HoldQuotaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # The windows filled here would throttle the users of later tests
+        self.addCleanup(cache.clear)
+        self.showtime, self.seats = create_catalog()
+        self.later = Showtime.objects.create(
+            movie=self.showtime.movie, screen=self.showtime.screen, price=300,
+            start_time=self.showtime.end_time + timedelta(hours=1), end_time=self.showtime.end_time + timedelta(hours=4),
+        )
+        self.user = User.objects.create_user('hari', 'hari@example.com', 'secret-pass-123')
+        self.client.force_login(self.user)
+
+    def select(self, showtime, seats):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('select_seats', args=[showtime.id]), {'seats': [seat.id for seat in seats]}, follow=True,
+            )
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        return response, writes
+
+    def test_quotas_refuse_before_writing(self):
+        response, writes = self.select(self.showtime, self.seats[:4])
+        self.assertContains(response, 'at most 3 seats')
+        self.assertEqual(writes, [])
+        self.select(self.showtime, self.seats[:2])
+        self.assertEqual(Booking.objects.count(), 1)
+
+        response, writes = self.select(self.showtime, self.seats[5:6])
+        self.assertContains(response, 'already have seats on hold for this showtime')
+        self.assertEqual(writes, [])
+        response, _ = self.select(self.later, self.seats[:1])
+        self.assertContains(response, 'awaiting payment')
+        self.assertEqual(Booking.objects.count(), 1)
+
+        # A hold past SEAT_HOLD_MINUTES still has its seats until expire_holds runs
+        Booking.objects.update(booking_date=timezone.now() - timedelta(minutes=settings.SEAT_HOLD_MINUTES + 1))
+        response, writes = self.select(self.later, self.seats[:1])
+        self.assertContains(response, 'awaiting payment')
+        self.assertEqual(writes, [])
+        call_command('expire_holds', stdout=StringIO())
+        # Past the seat selection throttle, which this test has used up
+        cache.clear()
+        self.select(self.later, self.seats[:1])
+        self.assertEqual(Booking.objects.filter(status='Pending').count(), 1)
+
+    def test_seat_selection_is_rate_limited(self):
+        for _ in range(5):
+            self.select(self.showtime, [Seat(id=0)])
+        response, writes = self.select(self.showtime, self.seats[:1])
+        self.assertContains(response, 'Too many seat selections')
+        self.assertEqual(writes, [])
+        self.assertFalse(Booking.objects.exists())
+
+    def test_sliding_window(self):
+        window = SlidingWindow('test', 3, 60)
+        with mock.patch('booking.throttle.time.time', return_value=6001):
+            self.assertEqual([window.hit('hari') for _ in range(4)], [True, True, True, False])
+        # Half of the previous window, refused hit included, still counts
+        with mock.patch('booking.throttle.time.time', return_value=6090):
+            self.assertEqual([window.hit('hari'), window.hit('hari')], [True, False])
+            self.assertTrue(window.hit('sita'))
+        with mock.patch('booking.throttle.time.time', return_value=6200):
+            self.assertTrue(window.hit('hari'))
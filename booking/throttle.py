@@ -0,0 +1,122 @@
+"""Rate limiting kept in the Django cache: token buckets and sliding windows.
+
+With the default local-memory cache each worker process has its own
+buckets; point the cache at a shared backend to throttle across workers.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class TokenBucket:
+    """Allow bursts of ``capacity`` requests, refilled evenly over ``period`` seconds"""
+
+    def __init__(self, name, capacity, period, cache_alias='default'):
+        self.name = name
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.period = period
+        self.cache_alias = cache_alias
+
+    def _key(self, key):
+        return f"throttle:{self.name}:{key}"
+
+    def consume(self, key, tokens=1):
+        """Take tokens from the bucket; False if there are not enough left"""
+        cache = caches[self.cache_alias]
+        now = time.time()
+        cache_key = self._key(key)
+        level, updated = cache.get(cache_key, (self.capacity, now))
+        level = min(self.capacity, level + (now - updated) * self.rate)
+        allowed = level >= tokens
+        if allowed:
+            level -= tokens
+        cache.set(cache_key, (level, now), timeout=int(self.period) + 1)
+        return allowed
+
+    def reset(self, key):
+        caches[self.cache_alias].delete(self._key(key))
+
+
+class SlidingWindow:
+    """Allow ``limit`` requests in any ``period`` seconds.
+
+    The count is estimated from the current fixed window plus the previous
+    one weighted by how much of it still overlaps the sliding window: two
+    cache keys per client, updated with an atomic incr. Refused requests are
+    counted too, so a client hammering the limit stays blocked until it
+    slows down.
+    """
+
+    def __init__(self, name, limit, period, cache_alias='default'):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.cache_alias = cache_alias
+
+    def _key(self, key, window):
+        return f"throttle:{self.name}:{key}:{window}"
+
+    def hit(self, key):
+        """Count a request; False if it goes over the limit"""
+        cache = caches[self.cache_alias]
+        window, elapsed = divmod(time.time(), self.period)
+        window = int(window)
+        current_key = self._key(key, window)
+        # Kept for the next window, where it is the previous one
+        if cache.add(current_key, 1, timeout=int(self.period * 2) + 1):
+            current = 1
+        else:
+            try:
+                current = cache.incr(current_key)
+            except ValueError:
+                # Evicted between add and incr
+                cache.set(current_key, 1, timeout=int(self.period * 2) + 1)
+                current = 1
+        previous = cache.get(self._key(key, window - 1), 0)
+        return previous * (1 - elapsed / self.period) + current <= self.limit
+
+    def reset(self, key):
+        window = int(time.time() // self.period)
+        caches[self.cache_alias].delete_many([self._key(key, window), self._key(key, window - 1)])
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LoginThrottle:
+    """Per-IP and per-account buckets checked before any password hashing"""
+
+    def __init__(self):
+        rates = settings.LOGIN_THROTTLE_RATES
+        cache_alias = getattr(settings, 'THROTTLE_CACHE', 'default')
+        self.per_ip = TokenBucket('login-ip', *rates['ip'], cache_alias=cache_alias)
+        self.per_account = TokenBucket('login-account', *rates['account'], cache_alias=cache_alias)
+
+    def allow(self, request, email):
+        # Consume from both so a blocked IP can't keep probing one account
+        ip_ok = self.per_ip.consume(client_ip(request))
+        account_ok = self.per_account.consume(email)
+        return ip_ok and account_ok
+
+    def succeeded(self, email):
+        self.per_account.reset(email)
+
+
+class HoldThrottle:
+    """Sliding windows on seat holds per customer and per IP, checked before anything is written"""
+
+    def __init__(self):
+        cache_alias = getattr(settings, 'THROTTLE_CACHE', 'default')
+        self.windows = {
+            scope: SlidingWindow(f'hold-{scope}', *rate, cache_alias=cache_alias)
+            for scope, rate in settings.HOLD_THROTTLE_RATES.items()
+        }
+
+    def allow(self, request):
+        keys = {'user': request.user.pk, 'ip': client_ip(request)}
+        # Count in every window so a blocked IP can't carry on with fresh accounts
+        allowed = [window.hit(keys[scope]) for scope, window in self.windows.items()]
+        return all(allowed)
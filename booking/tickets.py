@@ -0,0 +1,141 @@
+"""Scannable tickets for confirmed bookings.
+
+Every confirmed booking gets a QR code encoding a signed payload of its
+reference, showtime and seats (see make_token), and a printable PDF with
+the same code and the booking details. Check-in reads the payload back
+with read_token; a forged or edited code fails the signature.
+
+Rendered files are cached on disk under TICKET_DIR, named after a hash of
+everything drawn into them. Confirmation page views and resends reuse the
+file; a booking whose showtime or seats change hashes differently and is
+drawn again. Files of changed bookings are left behind and can be deleted
+at any time, since any missing file is simply rendered again.
+
+QR codes need the optional ``qrcode`` package. Without it the PNG is not
+available and the PDF carries the ticket code as text instead.
+"""
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+TOKEN_SALT = 'booking.tickets'
+# Bump when the drawing changes so every cached ticket is rendered again
+RENDER_VERSION = 1
+# A6 at 150 dpi
+PAGE_SIZE = (620, 874)
+QR_SIZE = 440
+CONTENT_TYPES = {'png': 'image/png', 'pdf': 'application/pdf'}
+
+
+class TicketUnavailable(Exception):
+    """The requested ticket format cannot be rendered here"""
+
+
+def ticket_payload(booking):
+    return {
+        'ref': booking.booking_reference,
+        'showtime': booking.showtime_id,
+        'seats': [f'{row}{number}' for row, number in booking.seats.order_by('row', 'number').values_list('row', 'number')],
+    }
+
+
+def make_token(booking):
+    """Signed, compact ticket code; the same booking always gives the same code"""
+    return signing.Signer(salt=TOKEN_SALT).sign_object(ticket_payload(booking), compress=True)
+
+
+def read_token(token):
+    """The payload of a ticket code; raises signing.BadSignature if it was not issued here"""
+    return signing.Signer(salt=TOKEN_SALT).unsign_object(token)
+
+
+def ticket_lines(booking):
+    showtime = booking.showtime
+    start = timezone.localtime(showtime.start_time)
+    return [
+        showtime.movie.title,
+        f'{showtime.screen.cinema.name} - {showtime.screen.name}',
+        f'{start:%a %d %b %Y, %I:%M %p}',
+        'Seats: ' + ', '.join(ticket_payload(booking)['seats']),
+        f'Booking {booking.booking_reference}',
+    ]
+
+
+class Ticket:
+    """One rendered format of one booking's ticket"""
+
+    def __init__(self, booking, kind):
+        if kind not in CONTENT_TYPES:
+            raise ValueError(kind)
+        if kind == 'png' and qrcode is None:
+            raise TicketUnavailable('QR codes need the qrcode package')
+        self.booking = booking
+        self.kind = kind
+        self.token = make_token(booking)
+        self.lines = ticket_lines(booking) if kind == 'pdf' else []
+        content = '\n'.join([str(RENDER_VERSION), kind, str(qrcode is not None), self.token, *self.lines])
+        self.key = hashlib.sha256(content.encode()).hexdigest()
+        self.path = Path(settings.TICKET_DIR) / self.key[:2] / f'{self.key}.{kind}'
+        self.content_type = CONTENT_TYPES[kind]
+
+    def file(self):
+        """Path of the rendered file, rendering it on the first request only"""
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            data = render_qr(self.token) if self.kind == 'png' else render_pdf(self.token, self.lines)
+            # Concurrent requests may render the same ticket; whole files only
+            handle, temp = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as out:
+                out.write(data)
+            os.replace(temp, self.path)
+        return self.path
+
+
+def qr_image(token):
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=4)
+    code.add_data(token)
+    code.make(fit=True)
+    return code.make_image(fill_color='black', back_color='white').convert('RGB')
+
+
+def render_qr(token):
+    buffer = BytesIO()
+    qr_image(token).save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_pdf(token, lines):
+    page = Image.new('RGB', PAGE_SIZE, 'white')
+    draw = ImageDraw.Draw(page)
+    title = ImageFont.load_default(size=30)
+    body = ImageFont.load_default(size=20)
+    y = 40
+    for index, line in enumerate(lines):
+        font = title if index == 0 else body
+        draw.text((40, y), line, fill='black', font=font)
+        y += 46 if index == 0 else 32
+    y += 20
+    if qrcode is not None:
+        code = qr_image(token).resize((QR_SIZE, QR_SIZE), Image.NEAREST)
+        page.paste(code, ((PAGE_SIZE[0] - QR_SIZE) // 2, y))
+    else:
+        # Printed code for manual entry at the door
+        small = ImageFont.load_default(size=12)
+        for offset in range(0, len(token), 60):
+            draw.text((40, y), token[offset:offset + 60], fill='black', font=small)
+            y += 18
+    buffer = BytesIO()
+    page.save(buffer, 'PDF', resolution=150)
+    return buffer.getvalue()
@@ -13,15 +13,25 @@ urlpatterns = [
     # Movies
     path('movies/', views.movies_list, name='movies'),
     path('movie/<int:movie_id>/', views.movie_detail, name='movie_detail'),
+    path('movie/<int:movie_id>/seats-together/', views.seats_together, name='seats_together'),
     
     # Booking
     path('select-seats/<int:showtime_id>/', views.select_seats, name='select_seats'),
+    path('waitlist/<int:showtime_id>/', views.join_waitlist, name='join_waitlist'),
     path('payment/<int:booking_id>/', views.payment_page, name='payment_page'),
     path('process-payment/<int:booking_id>/', views.process_payment, name='process_payment'),
     path('booking-confirmation/<int:booking_id>/', views.booking_confirmation, name='booking_confirmation'),
     path('my-bookings/', views.my_bookings, name='my_bookings'),
+    path('booking/<int:booking_id>/ticket.<str:kind>', views.ticket_file, name='ticket_file'),
     
     # Cancellation - NEW ROUTES
     path('request-cancellation/<int:booking_id>/', views.request_cancellation, name='request_cancellation'),
     path('cancel-booking/<int:booking_id>/', views.cancel_booking, name='cancel_booking'),
+    
+    # Public API
+    path('api/availability/', views.availability_api, name='availability'),
+    path('api/check-in/', views.checkin_api, name='checkin'),
+    
+    # Monitoring
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
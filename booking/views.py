@@ -1,33 +1,50 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
-from datetime import datetime, timedelta
-import random
-import string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_POST, require_safe
+from datetime import datetime, time, timedelta
+import hashlib
+import os
+from time import perf_counter
 
 # UPDATED IMPORT - Add CancellationRequest
-from .models import Movie, Cinema, Screen, Showtime, Seat, Booking, SeatBooking, Payment, CancellationRequest
-from .forms import SignUpForm, LoginForm
+from .models import Movie, Cinema, Showtime, Booking, Payment, CancellationRequest
+from . import checkin, events, metrics, tickets, waitlist
+from .archive import booked_seat_ids
+from .availability import aavailability, cache_key as availability_cache_key, page_body, showtime_ids
+from .catalog import movie_detail_key, movie_detail_payload, movie_detail_querysets
+from .inventory import find_seats_together
+from .layouts import cached_seat_map
+from .forms import SignUpForm, LoginForm, SeatsTogetherForm, WaitlistForm
+from .profiling import PROFILE_SUFFIX, list_profiles, make_token, profile_dir
+from .queries import gather_querysets
+from .reservations import HoldQuotaExceeded, SeatsUnavailable, check_hold_quota, confirm_booking, hold_seats
+from .throttle import HoldThrottle
 
-def generate_booking_reference():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-
-def generate_transaction_id():
-    return 'TXN' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=12))
-
-def home(request):
-    now_showing = Movie.objects.filter(is_now_showing=True)[:6]
-    coming_soon = Movie.objects.filter(is_now_showing=False, release_date__gt=timezone.now())[:6]
+async def home(request):
+    now_showing, coming_soon = await gather_querysets(
+        Movie.objects.filter(is_now_showing=True)[:6],
+        Movie.objects.filter(is_now_showing=False, release_date__gt=timezone.now())[:6],
+    )
     
     context = {
         'now_showing': now_showing,
         'coming_soon': coming_soon,
     }
-    return render(request, 'booking/home.html', context)
+    # Rendered on the request thread: the template may still load the session and user
+    return await sync_to_async(render)(request, 'booking/home.html', context)
 
 def signup_view(request):
     if request.user.is_authenticated:
@@ -55,19 +72,17 @@ def login_view(request):
             email = form.cleaned_data['email']
             password = form.cleaned_data['password']
             
-            try:
-                user_obj = User.objects.get(email=email)
-                user = authenticate(request, username=user_obj.username, password=password)
-                
-                if user is not None:
-                    login(request, user)
-                    messages.success(request, 'Logged in successfully!')
-                    next_url = request.GET.get('next', 'home')
-                    return redirect(next_url)
-                else:
-                    messages.error(request, 'Invalid password!')
-            except User.DoesNotExist:
-                messages.error(request, 'Email not found!')
+            user = authenticate(request, email=email, password=password)
+            
+            if user is not None:
+                login(request, user)
+                messages.success(request, 'Logged in successfully!')
+                next_url = request.GET.get('next', 'home')
+                return redirect(next_url)
+            elif getattr(request, 'login_throttled', False):
+                messages.error(request, 'Too many login attempts. Please wait a minute and try again.')
+            else:
+                messages.error(request, 'Invalid email or password!')
     else:
         form = LoginForm()
     
@@ -78,7 +93,7 @@ def logout_view(request):
     messages.success(request, 'Logged out successfully!')
     return redirect('home')
 
-def movies_list(request):
+async def movies_list(request):
     movies = Movie.objects.filter(is_now_showing=True)
     
     # Filter by genre
@@ -96,16 +111,19 @@ def movies_list(request):
     if search:
         movies = movies.filter(Q(title__icontains=search) | Q(description__icontains=search))
     
+    movies, genres, languages = await gather_querysets(
+        movies,
+        Movie.objects.values_list('genre', flat=True).distinct(),
+        Movie.objects.values_list('language', flat=True).distinct(),
+    )
     context = {
         'movies': movies,
-        'genres': Movie.objects.values_list('genre', flat=True).distinct(),
-        'languages': Movie.objects.values_list('language', flat=True).distinct(),
+        'genres': genres,
+        'languages': languages,
     }
-    return render(request, 'booking/movies.html', context)
+    return await sync_to_async(render)(request, 'booking/movies.html', context)
 
-def movie_detail(request, movie_id):
-    movie = get_object_or_404(Movie, id=movie_id)
-    
+async def movie_detail(request, movie_id):
     # Get available showtimes
     selected_date = request.GET.get('date', timezone.now().date())
     if isinstance(selected_date, str):
@@ -113,43 +131,62 @@ def movie_detail(request, movie_id):
     
     selected_cinema = request.GET.get('cinema')
     
-    showtimes = Showtime.objects.filter(
-        movie=movie,
-        start_time__date=selected_date
-    ).select_related('screen__cinema')
-    
-    if selected_cinema:
-        showtimes = showtimes.filter(screen__cinema_id=selected_cinema)
-    
-    # Get all cinemas showing this movie
-    cinemas = Cinema.objects.filter(
-        screens__showtimes__movie=movie
-    ).distinct()
+    cache_key = movie_detail_key(movie_id, selected_date, selected_cinema)
+    payload = await cache.aget(cache_key)
+    if payload is None:
+        # The movie, its showtimes and its cinemas only depend on movie_id
+        payload = movie_detail_payload(
+            *await gather_querysets(*movie_detail_querysets(movie_id, selected_date, selected_cinema))
+        )
+        if payload is None:
+            raise Http404('No Movie matches the given query.')
+        await cache.aset(cache_key, payload, settings.MOVIE_DETAIL_CACHE_SECONDS)
     
     # Generate next 7 days for date selection
     dates = [(timezone.now().date() + timedelta(days=i)) for i in range(7)]
     
     context = {
-        'movie': movie,
-        'showtimes': showtimes,
-        'cinemas': cinemas,
+        **payload,
         'dates': dates,
         'selected_date': selected_date,
         'selected_cinema': selected_cinema,
     }
-    return render(request, 'booking/movie_detail.html', context)
+    return await sync_to_async(render)(request, 'booking/movie_detail.html', context)
+
+def seats_together(request, movie_id):
+    """Showtimes of a movie on one day with enough adjacent free seats for a group"""
+    movie = get_object_or_404(Movie, id=movie_id)
+    form = SeatsTogetherForm(
+        request.GET if 'party_size' in request.GET else None,
+        initial={'party_size': 2, 'date': request.GET.get('date') or timezone.localdate()},
+    )
+    results = None
+    if form.is_valid():
+        data = form.cleaned_data
+        day = data['date'] or timezone.localdate()
+        day_start = timezone.make_aware(datetime.combine(day, time.min))
+        showtimes = Showtime.objects.filter(
+            movie=movie,
+            start_time__gte=max(day_start, timezone.now()),
+            start_time__lt=day_start + timedelta(days=1),
+        )
+        if data['area']:
+            showtimes = showtimes.filter(screen__cinema__location__iexact=data['area'])
+        results = find_seats_together(showtimes, data['party_size'], data['seat_type'] or None)
+    
+    context = {
+        'movie': movie,
+        'form': form,
+        'results': results,
+        'areas': Cinema.objects.order_by('location').values_list('location', flat=True).distinct(),
+        'dates': [(timezone.localdate() + timedelta(days=i)) for i in range(7)],
+    }
+    return render(request, 'booking/seats_together.html', context)
 
 @login_required
 def select_seats(request, showtime_id):
-    showtime = get_object_or_404(Showtime, id=showtime_id)
+    showtime = get_object_or_404(Showtime.objects.select_related('movie', 'screen__cinema'), id=showtime_id)
     screen = showtime.screen
-    seats = screen.seats.all()
-    
-    # Get already booked seats for this showtime
-    booked_seats = SeatBooking.objects.filter(
-        showtime=showtime,
-        is_booked=True
-    ).values_list('seat_id', flat=True)
     
     if request.method == 'POST':
         selected_seat_ids = request.POST.getlist('seats')
@@ -158,39 +195,81 @@ def select_seats(request, showtime_id):
             messages.error(request, 'Please select at least one seat!')
             return redirect('select_seats', showtime_id=showtime_id)
         
-        # Create booking with Pending status
-        total_amount = len(selected_seat_ids) * float(showtime.price)
-        booking = Booking.objects.create(
-            user=request.user,
-            showtime=showtime,
-            total_amount=total_amount,
-            status='Pending',  # Changed to Pending
-            booking_reference=generate_booking_reference()
-        )
+        # Bots are turned away before anything is written: the rate from the
+        # cache, then the customer's holds from one indexed read
+        if not HoldThrottle().allow(request):
+            metrics.HOLDS_REFUSED.labels(reason='rate').inc()
+            messages.error(request, 'Too many seat selections. Please wait a minute and try again.')
+            return redirect('select_seats', showtime_id=showtime_id)
         
-        # Add seats to booking
-        selected_seats = Seat.objects.filter(id__in=selected_seat_ids)
-        booking.seats.set(selected_seats)
+        try:
+            seat_ids = [int(seat_id) for seat_id in selected_seat_ids]
+            check_hold_quota(request.user, showtime, len(set(seat_ids)))
+            # Pending booking; the seats are claimed only if all of them are still free
+            booking = hold_seats(request.user, showtime, seat_ids, quota=True)
+        except ValueError:
+            messages.error(request, 'Invalid seat selection!')
+            return redirect('select_seats', showtime_id=showtime_id)
+        except HoldQuotaExceeded as exc:
+            metrics.HOLDS_REFUSED.labels(reason='quota').inc()
+            messages.error(request, str(exc))
+            return redirect('select_seats', showtime_id=showtime_id)
+        except SeatsUnavailable as exc:
+            messages.error(request, str(exc))
+            return redirect('select_seats', showtime_id=showtime_id)
         
-        # Temporarily reserve seats
-        for seat_id in selected_seat_ids:
-            SeatBooking.objects.update_or_create(
-                showtime=showtime,
-                seat_id=seat_id,
-                defaults={'is_booked': True, 'booking': booking}
-            )
+        metrics.SEAT_HOLDS.inc()
+        metrics.SEATS_HELD.inc(len(seat_ids))
         
         # Redirect to payment page
         return redirect('payment_page', booking_id=booking.id)
     
+    # Screens generated from a layout carry their seat map; older screens
+    # are grouped into rows from their Seat rows.
+    seat_rows = cached_seat_map(screen)
+    if seat_rows is None:
+        seat_rows = {}
+        for seat in screen.seats.all():
+            seat_rows.setdefault(seat.row, []).append(
+                {'kind': 'seat', 'id': seat.id, 'number': seat.number, 'seat_type': seat.seat_type}
+            )
+        seat_rows = list(seat_rows.items())
+    
     context = {
         'showtime': showtime,
-        'seats': seats,
-        'booked_seats': list(booked_seats),
+        'seat_rows': seat_rows,
+        'booked_seats': booked_seat_ids(showtime),
         'screen': screen,
+        'waitlist_form': WaitlistForm(),
     }
     return render(request, 'booking/select_seats.html', context)
 
+@login_required
+@require_POST
+def join_waitlist(request, showtime_id):
+    """Queue for released seats of a showtime; they are held for the party when they come free"""
+    showtime = get_object_or_404(Showtime, id=showtime_id)
+    if not HoldThrottle().allow(request):
+        metrics.HOLDS_REFUSED.labels(reason='rate').inc()
+        messages.error(request, 'Too many seat selections. Please wait a minute and try again.')
+        return redirect('select_seats', showtime_id=showtime_id)
+    form = WaitlistForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Please choose between 1 and 10 seats.')
+        return redirect('select_seats', showtime_id=showtime_id)
+    
+    try:
+        entry = waitlist.join(request.user, showtime, form.cleaned_data['seats'], form.cleaned_data['seat_type'])
+    except waitlist.WaitlistError as exc:
+        messages.error(request, str(exc))
+        return redirect('select_seats', showtime_id=showtime_id)
+    
+    if entry.status == 'Offered':
+        messages.success(request, 'Seats were available and are now held for you.')
+        return redirect('payment_page', booking_id=entry.booking_id)
+    messages.success(request, "You're on the waitlist. Seats will be held for you as soon as they are released.")
+    return redirect('select_seats', showtime_id=showtime_id)
+
 @login_required
 def payment_page(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
@@ -209,6 +288,7 @@ def process_payment(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
     
     if request.method == 'POST':
+        started = perf_counter()
         payment_method = request.POST.get('payment_method')
         
         # Validate payment method
@@ -228,29 +308,22 @@ def process_payment(request, booking_id):
                 messages.error(request, 'Please fill in all card details!')
                 return redirect('payment_page', booking_id=booking.id)
             
-            # Create payment record
-            payment = Payment.objects.create(
-                booking=booking,
-                payment_method=payment_method,
-                amount=booking.total_amount,
-                transaction_id=generate_transaction_id(),
-                status='completed',
-                card_number=card_number[-4:],
-                cardholder_name=cardholder_name
-            )
+            payment_fields = {'card_number': card_number[-4:], 'cardholder_name': cardholder_name}
         else:
             # For digital wallets
-            payment = Payment.objects.create(
-                booking=booking,
-                payment_method=payment_method,
-                amount=booking.total_amount,
-                transaction_id=generate_transaction_id(),
-                status='completed'
-            )
+            payment_fields = {}
+        
+        # Confirm the booking and record the payment together, once
+        payment = confirm_booking(booking, payment_method, **payment_fields)
+        if payment is None:
+            booking.refresh_from_db(fields=['status'])
+            if booking.status == 'Confirmed':
+                return redirect('booking_confirmation', booking_id=booking.id)
+            messages.error(request, 'This booking is no longer awaiting payment.')
+            return redirect('my_bookings')
         
-        # Update booking status to Confirmed
-        booking.status = 'Confirmed'
-        booking.save()
+        metrics.CONFIRMATIONS.labels(payment_method=payment_method).inc()
+        metrics.PAYMENT_DURATION.labels(payment_method=payment_method).observe(perf_counter() - started)
         
         messages.success(request, 'Payment successful! Your booking is confirmed.')
         return redirect('booking_confirmation', booking_id=booking.id)
@@ -271,6 +344,7 @@ def booking_confirmation(request, booking_id):
     context = {
         'booking': booking,
         'payment': payment,
+        'ticket_qr': booking.status == 'Confirmed' and tickets.qrcode is not None,
     }
     return render(request, 'booking/booking_confirmation.html', context)
 
@@ -283,6 +357,60 @@ def my_bookings(request):
     }
     return render(request, 'booking/my_bookings.html', context)
 
+# ============================================
+# TICKETS
+# ============================================
+
+@login_required
+def ticket_file(request, booking_id, kind):
+    """QR code (png) or printable ticket (pdf) of a confirmed booking, rendered once and cached on disk"""
+    booking = get_object_or_404(
+        Booking.objects.select_related('showtime__movie', 'showtime__screen__cinema'),
+        id=booking_id, user=request.user, status='Confirmed',
+    )
+    try:
+        ticket = tickets.Ticket(booking, kind)
+    except tickets.TicketUnavailable:
+        raise Http404('Ticket format not available')
+
+    etag = f'"{ticket.key}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        filename = f'ticket-{booking.booking_reference}.{kind}'
+        response = FileResponse(open(ticket.file(), 'rb'), content_type=ticket.content_type, filename=filename)
+    response['ETag'] = etag
+    # Changes to the booking change the ETag; browsers revalidate after an hour
+    patch_cache_control(response, private=True, max_age=3600)
+    return response
+
+# Door scanners read a refusal from the status code as well as the body
+CHECKIN_STATUS_CODES = {
+    checkin.ADMITTED: 200,
+    checkin.ALREADY_ADMITTED: 409,
+    checkin.NOT_CONFIRMED: 409,
+    checkin.WRONG_SHOWTIME: 409,
+    checkin.UNKNOWN: 404,
+}
+
+@require_POST
+def checkin_api(request):
+    """Admit a ticket at the door, by scanned code or typed-in booking reference (staff only)"""
+    if not (request.user.is_active and request.user.is_staff):
+        return JsonResponse({'error': 'Staff login required.'}, status=403)
+    code = request.POST.get('code', '').strip()
+    reference = request.POST.get('reference', '').strip().upper()
+    showtime = request.POST.get('showtime', '').strip()
+    if code:
+        try:
+            reference = checkin.reference_from_code(code)
+        except signing.BadSignature:
+            return JsonResponse({'status': 'invalid', 'error': 'Not a ticket issued here.'}, status=400)
+    if not reference or (showtime and not showtime.isdigit()):
+        return JsonResponse({'error': 'Pass code=<ticket code> or reference=<booking reference>, and optionally showtime=<id>.'}, status=400)
+
+    result = checkin.admit(reference, int(showtime) if showtime else None, request.POST.get('gate', '')[:50])
+    return JsonResponse(result.as_dict(), status=CHECKIN_STATUS_CODES[result.status])
+
 # ============================================
 # NEW CANCELLATION VIEWS
 # ============================================
@@ -324,12 +452,95 @@ def cancel_booking(request, booking_id):
             return redirect('my_bookings')
         
         # Create cancellation request
-        CancellationRequest.objects.create(
-            booking=booking,
-            reason=reason
-        )
+        with transaction.atomic():
+            CancellationRequest.objects.create(
+                booking=booking,
+                reason=reason
+            )
+            events.record('cancellation.requested', booking, reason=reason)
         
         messages.success(request, 'Cancellation request submitted successfully! Our admin will review it shortly.')
         return redirect('my_bookings')
     
     return redirect('request_cancellation', booking_id=booking.id)
+
+# ============================================
+# PROFILING (staff only)
+# ============================================
+
+@staff_member_required
+def profile_list(request):
+    """List captured request profiles and hand out a profiling token"""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': list_profiles(),
+        'token': make_token(request.user),
+        'token_max_age': settings.PROFILER_TOKEN_MAX_AGE,
+        'sample_rate': settings.PROFILER_SAMPLE_RATE,
+    }
+    return render(request, 'admin/booking/profiles.html', context)
+
+@staff_member_required
+def profile_download(request, name):
+    path = profile_dir() / os.path.basename(name)
+    if not name.endswith(PROFILE_SUFFIX) or not path.is_file():
+        raise Http404('Profile not found')
+    return FileResponse(open(path, 'rb'), content_type='text/plain', as_attachment=True, filename=path.name)
+
+# ============================================
+# METRICS
+# ============================================
+
+def metrics_view(request):
+    """Prometheus text exposition, for scrapers on the allowed addresses only"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(metrics.REGISTRY.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# ============================================
+# AVAILABILITY API
+# ============================================
+
+@require_safe
+async def availability_api(request):
+    """Seats left for a list of showtimes, or for a cinema and/or date, as JSON"""
+    limit = settings.AVAILABILITY_MAX_SHOWTIMES
+    showtimes = Showtime.objects.all()
+    try:
+        if request.GET.get('showtimes'):
+            ids = showtime_ids(request.GET['showtimes'])
+            if len(ids) > limit:
+                return JsonResponse({'error': f'At most {limit} showtimes per request.'}, status=400)
+            showtimes = showtimes.filter(id__in=ids)
+        elif request.GET.get('cinema') or request.GET.get('date'):
+            if request.GET.get('date'):
+                day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+                day_start = timezone.make_aware(datetime.combine(day, time.min))
+                showtimes = showtimes.filter(start_time__gte=day_start, start_time__lt=day_start + timedelta(days=1))
+            else:
+                showtimes = showtimes.filter(start_time__gte=timezone.now())
+            if request.GET.get('cinema'):
+                showtimes = showtimes.filter(screen__cinema_id=int(request.GET['cinema']))
+            if request.GET.get('movie'):
+                showtimes = showtimes.filter(movie_id=int(request.GET['movie']))
+        else:
+            return JsonResponse({'error': 'Pass showtimes=<ids>, or cinema and/or date=YYYY-MM-DD.'}, status=400)
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError(page)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid showtimes, cinema, movie, date or page parameter.'}, status=400)
+
+    # Identical queries within the cache window share one database read
+    cache_key = availability_cache_key(request.GET)
+    body = await cache.aget(cache_key)
+    if body is None:
+        rows = await aavailability(showtimes, (page - 1) * limit, page * limit + 1)
+        body = page_body(rows, page)
+        await cache.aset(cache_key, body, settings.AVAILABILITY_CACHE_SECONDS)
+
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = '"%s"' % hashlib.md5(body).hexdigest()
+    patch_cache_control(response, public=True, max_age=settings.AVAILABILITY_CACHE_SECONDS)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
@@ -0,0 +1,139 @@
+"""Waitlists of sold-out showtimes, matched as seats are released.
+
+A customer who cannot find seats joins the waitlist of a showtime with a
+party size and optionally a seat type. Whenever seats of a showtime are
+released (an approved cancellation, an expired hold, a cleanup), the
+releasing transaction calls offer_released_seats while it still holds the
+showtime lock. The matcher only looks at that showtime's queue: it reads
+the free seats once, then repeatedly asks the partial index for the oldest
+waiting party that fits the free seats left of its type, holds seats for it with
+reservations.hold_seats and records a ``waitlist.offered`` event, which is
+the notification queue (see booking/events.py). Parties too large for what
+was released keep their place; smaller ones behind them are served, and
+so are the parties behind one whose customer is over HOLD_QUOTAS.
+
+An offer is an ordinary pending booking: the customer pays for it from My
+Bookings, and expire_holds releases it SEAT_HOLD_MINUTES after the offer,
+handing the seats to the next party in the queue.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import events, reservations
+from .archive import booked_seat_ids
+from .inventory import lock_showtimes, screen_rows
+from .models import Screen, WaitlistEntry
+
+
+class WaitlistError(Exception):
+    """The party cannot join the waitlist; the message is shown to the customer"""
+
+
+def free_seats(showtime, booked=None):
+    """Rows of the free seats of a showtime: lists of (seat id, seat type), None where adjacency breaks"""
+    booked = booked_seat_ids(showtime) if booked is None else booked
+    return [
+        [cell if cell is None or cell[0] not in booked else None for cell in row]
+        for row in screen_rows(Screen.objects.filter(id=showtime.screen_id))[showtime.screen_id]
+    ]
+
+
+def pick_seats(rows, party, seat_type=''):
+    """Seat IDs for a party: adjacent ones if there are enough, otherwise the first free ones"""
+    matching = [
+        [cell[0] if cell is not None and (not seat_type or cell[1] == seat_type) else None for cell in row]
+        for row in rows
+    ]
+    for row in matching:
+        run = []
+        for seat_id in row:
+            run = run + [seat_id] if seat_id is not None else []
+            if len(run) == party:
+                return run
+    scattered = [seat_id for row in matching for seat_id in row if seat_id is not None]
+    return scattered[:party] if len(scattered) >= party else None
+
+
+def _fits(counts):
+    """Filter for waiting parties that fit into {seat type: free seats}"""
+    fits = Q(seat_type='', seats__lte=sum(counts.values()))
+    for seat_type, count in counts.items():
+        fits |= Q(seat_type=seat_type, seats__lte=count)
+    return fits
+
+
+@transaction.atomic
+def offer_released_seats(showtime):
+    """Hold the free seats of a showtime for its waitlist, oldest party first; returns the offered entries"""
+    waiting = WaitlistEntry.objects.filter(showtime=showtime, status='Waiting')
+    if showtime.end_time <= timezone.now() or not waiting.exists():
+        return []
+    lock_showtimes([showtime.id])
+    rows = free_seats(showtime)
+    offered = []
+    # Parties held back because their customer is over quota; they keep their place
+    skipped = set()
+    while True:
+        counts = {}
+        for row in rows:
+            for cell in row:
+                if cell is not None:
+                    counts[cell[1]] = counts.get(cell[1], 0) + 1
+        if not counts:
+            break
+        entry = (
+            waiting.select_related('user')
+            .filter(_fits(counts))
+            .exclude(id__in=skipped)
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if entry is None:
+            break
+        seat_ids = pick_seats(rows, entry.seats, entry.seat_type)
+        try:
+            booking = reservations.hold_seats(entry.user, showtime, seat_ids, quota=True)
+        except reservations.HoldQuotaExceeded:
+            skipped.add(entry.id)
+            continue
+        entry.status = 'Offered'
+        entry.booking = booking
+        entry.offered_at = timezone.now()
+        entry.save(update_fields=['status', 'booking', 'offered_at'])
+        events.record(
+            'waitlist.offered', booking,
+            entry=entry.id, user=entry.user_id, seats=len(seat_ids),
+            expires_at=entry.offered_at + timedelta(minutes=settings.SEAT_HOLD_MINUTES),
+        )
+        taken = set(seat_ids)
+        rows = [[None if cell is not None and cell[0] in taken else cell for cell in row] for row in rows]
+        offered.append(entry)
+    return offered
+
+
+@transaction.atomic
+def join(user, showtime, seats, seat_type=''):
+    """Put a party on the waitlist of a showtime; returns the entry, already Offered if seats were free"""
+    if showtime.end_time <= timezone.now():
+        raise WaitlistError('This showtime is over.')
+    lock_showtimes([showtime.id])
+    if WaitlistEntry.objects.filter(user=user, showtime=showtime, status='Waiting').exists():
+        raise WaitlistError('You are already on the waitlist for this showtime.')
+    if WaitlistEntry.objects.filter(user=user, showtime=showtime, status='Offered', booking__status='Pending').exists():
+        raise WaitlistError('Seats from the waitlist are already held for you. Pay for them from My Bookings first.')
+    try:
+        # Joining can turn straight into a hold when seats are free
+        reservations.check_hold_quota(user, showtime, seats)
+    except reservations.HoldQuotaExceeded as exc:
+        raise WaitlistError(str(exc))
+    entry = WaitlistEntry.objects.create(user=user, showtime=showtime, seats=seats, seat_type=seat_type)
+    events.record('waitlist.joined', showtime_id=showtime.id, entry=entry.id, user=user.id, seats=seats, seat_type=seat_type)
+    # Seats released before the party joined would otherwise wait for the next release
+    offer_released_seats(showtime)
+    entry.refresh_from_db()
+    return entry
+
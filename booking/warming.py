@@ -0,0 +1,157 @@
+"""Cache warming for movies about to go on sale.
+
+When a big release opens, its first visitors would all miss every cache at
+once. warm_movies fills them beforehand for every upcoming showtime of the
+given movies:
+
+- movie_detail: the movie page payload of each day with showtimes
+- seat_layouts: the seat map of every screen they play on
+- availability: the ShowtimeInventory rows, and the availability API
+  answer for each movie and day (kept AVAILABILITY_CACHE_SECONDS, so
+  warming pays off when it runs right at the on-sale time)
+- posters: the resized poster variants
+
+The work is split into small tasks run on a thread pool, each with its own
+database connection, and the time spent is totalled per step.
+
+warm_release is the hook for schedulers: cron (through the warm_showtimes
+command), Celery beat or anything else that can call a function on the
+morning of a release.
+"""
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from cinema_booking.routers import pin_to_primary
+
+from . import posters
+from .availability import availability, cache_key, page_body
+from .catalog import day_bounds, movie_detail_key, movie_detail_payload, movie_detail_querysets
+from .inventory import refresh_inventory
+from .layouts import SEAT_MAP_CACHE_SECONDS, seat_map_key
+from .models import Movie, Screen, Showtime
+from .queries import in_transaction
+
+STEPS = ('movie_detail', 'seat_layouts', 'availability', 'posters')
+# Showtimes whose inventory one task refreshes
+AVAILABILITY_CHUNK = 50
+
+
+@dataclass
+class WarmReport:
+    movies: list = field(default_factory=list)
+    showtimes: int = 0
+    workers: int = 0
+    wall: float = 0.0
+    # step -> {'tasks', 'items', 'seconds'}; seconds are summed over workers
+    steps: dict = field(default_factory=lambda: defaultdict(lambda: {'tasks': 0, 'items': 0, 'seconds': 0.0}))
+
+    def add(self, step, items, seconds):
+        self.steps[step]['tasks'] += 1
+        self.steps[step]['items'] += items
+        self.steps[step]['seconds'] += seconds
+
+
+def warm_movie_detail(movie_id, day):
+    payload = movie_detail_payload(*[list(queryset) for queryset in movie_detail_querysets(movie_id, day)])
+    cache.set(movie_detail_key(movie_id, day), payload, settings.MOVIE_DETAIL_CACHE_SECONDS)
+    return 1
+
+
+def warm_seat_layout(screen_id):
+    screen = Screen.objects.get(id=screen_id)
+    if not screen.layout:
+        # Seat maps of screens without a layout are built from Seat rows per request
+        return 0
+    cache.set(seat_map_key(screen), screen.get_layout().seat_map(), SEAT_MAP_CACHE_SECONDS)
+    return 1
+
+
+def warm_inventory(showtime_ids):
+    refresh_inventory(showtime_ids)
+    return len(showtime_ids)
+
+
+def warm_availability_api(movie_id, day):
+    """Store the API answer for ?date=<day>&movie=<id>, as the view would"""
+    day_start, day_end = day_bounds(day)
+    showtimes = Showtime.objects.filter(movie_id=movie_id, start_time__gte=day_start, start_time__lt=day_end)
+    rows = availability(showtimes, 0, settings.AVAILABILITY_MAX_SHOWTIMES + 1)
+    params = {'date': f'{day:%Y-%m-%d}', 'movie': str(movie_id)}
+    cache.set(cache_key(params), page_body(rows, 1), settings.AVAILABILITY_CACHE_SECONDS)
+    return 1
+
+
+def warm_posters(movie_id):
+    return posters.make_variants(Movie.objects.get(id=movie_id))
+
+
+def _run(step, task, args):
+    started = time.perf_counter()
+    # Catalog reads would otherwise go to a replica that may lag behind
+    with pin_to_primary():
+        items = task(*args)
+    return step, items, time.perf_counter() - started
+
+
+def _run_in_worker(step, task, args):
+    try:
+        return _run(step, task, args)
+    finally:
+        # Pool threads are discarded after the run; don't leave connections behind
+        connections.close_all()
+
+
+def plan_tasks(movie_ids):
+    """(step, function, args) for every upcoming showtime of these movies"""
+    showtimes = list(
+        Showtime.objects.filter(movie_id__in=movie_ids, start_time__gte=timezone.now())
+        .order_by('start_time', 'id')
+        .values_list('id', 'movie_id', 'screen_id', 'start_time')
+    )
+    days = sorted({(movie_id, timezone.localtime(start).date()) for _, movie_id, _, start in showtimes})
+    screens = sorted({screen_id for _, _, screen_id, _ in showtimes})
+    ids = [showtime_id for showtime_id, *_ in showtimes]
+
+    tasks = [('movie_detail', warm_movie_detail, day) for day in days]
+    tasks += [('seat_layouts', warm_seat_layout, (screen_id,)) for screen_id in screens]
+    tasks += [
+        ('availability', warm_inventory, (ids[offset:offset + AVAILABILITY_CHUNK],))
+        for offset in range(0, len(ids), AVAILABILITY_CHUNK)
+    ]
+    tasks += [('availability', warm_availability_api, day) for day in days]
+    tasks += [('posters', warm_posters, (movie_id,)) for movie_id in movie_ids]
+    return tasks, len(ids)
+
+
+def warm_movies(movie_ids, workers=4):
+    """Warm every cache behind the upcoming showtimes of these movies; returns a WarmReport"""
+    movie_ids = list(movie_ids)
+    started = time.perf_counter()
+    tasks, showtimes = plan_tasks(movie_ids)
+    report = WarmReport(movies=movie_ids, showtimes=showtimes, workers=workers)
+    if in_transaction():
+        # Other connections can't see the caller's uncommitted rows
+        report.workers = 1
+        for step, task, args in tasks:
+            report.add(*_run(step, task, args))
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warm') as pool:
+            futures = [pool.submit(_run_in_worker, step, task, args) for step, task, args in tasks]
+            for future in as_completed(futures):
+                report.add(*future.result())
+    report.wall = time.perf_counter() - started
+    return report
+
+
+def warm_release(day=None, workers=4):
+    """Warm the movies released on ``day`` (default today)"""
+    day = day or timezone.localdate()
+    movie_ids = list(Movie.objects.filter(release_date=day).order_by('id').values_list('id', flat=True))
+    return warm_movies(movie_ids, workers)
@@ -0,0 +1,101 @@
+"""
+Database configuration for cinema_booking, driven by environment variables.
+
+SQLite (the default) is tuned for concurrent bookings: WAL journaling so
+readers never block the writer, ``synchronous=NORMAL`` (durable under WAL
+except on power loss), a busy timeout instead of failing immediately with
+"database is locked", and IMMEDIATE transactions so a transaction takes the
+write lock up front rather than deadlocking when it upgrades from a read.
+
+Set DB_ENGINE=postgresql to switch to PostgreSQL (requires psycopg).
+
+Environment:
+    DB_ENGINE           sqlite (default) or postgresql
+    DB_NAME             SQLite file path, or PostgreSQL database name
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+                        PostgreSQL connection settings
+    DB_CONN_MAX_AGE     seconds to keep connections open (default 60)
+    DB_POOL_SIZE        PostgreSQL only: use a psycopg connection pool of
+                        this size instead of persistent connections
+    DB_BUSY_TIMEOUT     SQLite only: seconds to wait for the write lock (default 20)
+    DB_REPLICAS         comma separated read replicas: SQLite file paths, or
+                        PostgreSQL hosts (host or host:port) sharing the
+                        primary's credentials
+"""
+
+import os
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA cache_size=-20000;"
+)
+
+
+def _env_int(env, name, default):
+    value = env.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def sqlite_config(base_dir, env=os.environ):
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": env.get("DB_NAME") or base_dir / "db.sqlite3",
+        "CONN_MAX_AGE": _env_int(env, "DB_CONN_MAX_AGE", 60),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": SQLITE_PRAGMAS,
+            "transaction_mode": "IMMEDIATE",
+            "timeout": _env_int(env, "DB_BUSY_TIMEOUT", 20),
+        },
+    }
+
+
+def postgresql_config(env=os.environ):
+    config = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": env.get("DB_NAME", "cinema_booking"),
+        "USER": env.get("DB_USER", ""),
+        "PASSWORD": env.get("DB_PASSWORD", ""),
+        "HOST": env.get("DB_HOST", ""),
+        "PORT": env.get("DB_PORT", ""),
+        "CONN_MAX_AGE": _env_int(env, "DB_CONN_MAX_AGE", 60),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    pool_size = _env_int(env, "DB_POOL_SIZE", 0)
+    if pool_size:
+        # Pooled connections are returned to the pool at the end of each
+        # request, so they can't also be persistent.
+        config["CONN_MAX_AGE"] = 0
+        config["OPTIONS"]["pool"] = {"min_size": 1, "max_size": pool_size}
+    return config
+
+
+def database_config(base_dir, env=os.environ):
+    """Return the settings dict for the default database"""
+    engine = env.get("DB_ENGINE", "sqlite").lower()
+    if engine in ("sqlite", "sqlite3"):
+        return sqlite_config(base_dir, env)
+    if engine in ("postgres", "postgresql"):
+        return postgresql_config(env)
+    raise ValueError(f"Unsupported DB_ENGINE {engine!r}; use sqlite or postgresql")
+
+
+def replica_configs(primary, env=os.environ):
+    """Return {alias: settings} for each DB_REPLICAS entry, modelled on the primary"""
+    replicas = {}
+    entries = [entry.strip() for entry in env.get("DB_REPLICAS", "").split(",") if entry.strip()]
+    for i, entry in enumerate(entries, start=1):
+        config = {**primary, "OPTIONS": dict(primary["OPTIONS"])}
+        if primary["ENGINE"] == "django.db.backends.sqlite3":
+            config["NAME"] = entry
+        else:
+            host, _, port = entry.partition(":")
+            config["HOST"] = host
+            config["PORT"] = port or primary["PORT"]
+        # Tests read replicas through the primary's test database
+        config["TEST"] = {"MIRROR": "default"}
+        replicas[f"replica{i}"] = config
+    return replicas
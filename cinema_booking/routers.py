@@ -0,0 +1,107 @@
+"""
+Read-replica routing for catalog traffic.
+
+Reads of catalog models (cinemas, movies, screens, showtimes, seats) go to
+one of settings.DATABASE_REPLICAS; everything else, and every write, uses
+the primary. Booking, SeatBooking and Payment are never read from a
+replica because availability must not lag.
+
+After a user writes, PrimaryPinningMiddleware sets a short-lived cookie so
+that user's next requests also read the catalog from the primary
+(read-your-writes) until the replicas have had time to catch up.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+CATALOG_MODELS = {
+    "booking.cinema",
+    "booking.movie",
+    "booking.screen",
+    "booking.showtime",
+    "booking.seat",
+}
+
+PIN_COOKIE = "db_primary_pin"
+
+_pinned = ContextVar("db_primary_pinned", default=False)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def pin_to_primary():
+    """Route every read inside the block to the primary"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and model._meta.label_lower in CATALOG_MODELS and not is_pinned():
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db == "default"
+
+
+class PrimaryPinningMiddleware:
+    """Pin a user's reads to the primary for a short window after they write"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def should_pin(self, request):
+        writes = request.method not in ("GET", "HEAD", "OPTIONS", "TRACE")
+        return writes, settings.DATABASE_REPLICAS and (writes or PIN_COOKIE in request.COOKIES)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes, pin = self.should_pin(request)
+        if not pin:
+            return self.get_response(request)
+
+        with pin_to_primary():
+            response = self.get_response(request)
+        return self.set_pin(response, writes)
+
+    async def __acall__(self, request):
+        writes, pin = self.should_pin(request)
+        if not pin:
+            return await self.get_response(request)
+
+        with pin_to_primary():
+            response = await self.get_response(request)
+        return self.set_pin(response, writes)
+
+    def set_pin(self, response, writes):
+        if writes:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite="Lax",
+            )
+        return response
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_config, replica_configs
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,8 +44,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "booking.instrumentation.RequestTimingMiddleware",
+    "booking.profiling.SamplingProfilerMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "booking.assets.StaticAssetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "cinema_booking.routers.PrimaryPinningMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -52,12 +59,21 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "cinema_booking.urls"
 
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that also times rendering for RequestTimingMiddleware
+        "BACKEND": "booking.instrumentation.InstrumentedDjangoTemplates",
         "DIRS": [],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Compiled templates are kept in memory outside development
+            "loaders": (
+                TEMPLATE_LOADERS if DEBUG else [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)]
+            ),
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -72,12 +88,89 @@ WSGI_APPLICATION = "cinema_booking.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite by default; see cinema_booking/database.py for the DB_* variables.
 
 DATABASES = {
+    "default": database_config(BASE_DIR),
+}
+DATABASES.update(replica_configs(DATABASES["default"]))
+
+# Catalog reads go to replicas; see cinema_booking/routers.py
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["cinema_booking.routers.ReplicaRouter"]
+# Seconds a user's catalog reads stay on the primary after they write
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per worker process. For multiple workers set CACHE_BACKEND
+# (e.g. django.core.cache.backends.redis.RedisCache) and CACHE_LOCATION so
+# sessions and throttles are shared.
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache")
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION", "")
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": CACHE_LOCATION or "cinema-booking",
+    },
+    # Kept separate so catalog caching can't evict logged-in users
+    "sessions": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": CACHE_LOCATION or "cinema-booking-sessions",
+        "KEY_PREFIX": "sessions",
+        "OPTIONS": {"MAX_ENTRIES": 50000} if "locmem" in CACHE_BACKEND else {},
+    },
+}
+
+
+# Sessions
+# With a shared cache (Redis or Memcached in CACHE_BACKEND) sessions are read
+# from the cache, so authenticated page views don't query django_session.
+# With write-through (the default) every session write also reaches the
+# database, so sessions survive cache restarts and evictions; set
+# SESSION_WRITE_THROUGH=0 to keep them in the cache only. The local-memory
+# cache is per worker, where a logout or a rotated session key would only be
+# seen by the worker that handled it, so without a shared cache sessions
+# stay in the database.
+
+SHARED_CACHE = any(name in CACHE_BACKEND.lower() for name in ("redis", "memcached"))
+
+if not SHARED_CACHE:
+    SESSION_ENGINE = "django.contrib.sessions.backends.db"
+elif os.environ.get("SESSION_WRITE_THROUGH", "1") == "1":
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+else:
+    SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+SESSION_CACHE_ALIAS = "sessions"
+
+
+AUTHENTICATION_BACKENDS = [
+    "booking.backends.EmailBackend",
+    # Username login for the admin site
+    "django.contrib.auth.backends.ModelBackend",
+]
+
+# Login attempts allowed as (burst, seconds to refill the burst)
+LOGIN_THROTTLE_RATES = {
+    "ip": (20, 60),
+    "account": (10, 300),
+}
+
+# Seat holds (select_seats, join_waitlist) allowed as (requests, sliding window
+# in seconds); leave a scope out to lift its limit
+HOLD_THROTTLE_RATES = {
+    "user": (10, 60),
+    "ip": (60, 60),
+}
+# Limits on what one customer can hold at a time (booking.reservations.check_hold_quota);
+# a hold counts until expire_holds releases its seats
+HOLD_QUOTAS = {
+    "seats_per_booking": 10,
+    "pending_per_user": 4,
+    "pending_per_showtime": 2,
 }
 
 
@@ -116,6 +209,25 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = "static/"
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Outside DEBUG, collectstatic writes content-hashed, precompressed files
+# (booking/assets.py) and templates link to the hashed names.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG
+            else "booking.assets.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+# Serve STATIC_ROOT from the app with far-future caching headers; turn off
+# when a web server or CDN serves /static/ instead.
+SERVE_STATIC = os.environ.get("SERVE_STATIC", "0" if DEBUG else "1") == "1"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -124,5 +236,61 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered ticket QR codes and PDFs (booking/tickets.py); private, not under MEDIA_ROOT
+TICKET_DIR = BASE_DIR / 'tickets'
+# Signs offline check-in snapshots (booking/checkin.py); door scanners hold
+# this key to verify them, so it must not be SECRET_KEY.
+CHECKIN_SNAPSHOT_KEY = os.environ.get("CHECKIN_SNAPSHOT_KEY", "django-insecure-checkin-snapshots")
+
+# Booking event log (booking/events.py): how long a consumer waits on a gap in
+# event IDs before treating it as a rolled back transaction
+OUTBOX_SETTLE_SECONDS = 5
+
+# How long a pending booking (including a waitlist offer) holds its seats
+# before expire_holds releases them
+SEAT_HOLD_MINUTES = 15
+
 LOGIN_URL = 'login'
-LOGIN_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGIN_REDIRECT_URL = 'home'
+
+
+# Availability API (/api/availability/)
+AVAILABILITY_MAX_SHOWTIMES = 500
+# How long clients and the server-side cache may reuse an answer
+AVAILABILITY_CACHE_SECONDS = 5
+
+# Movie page showtimes (booking/catalog.py); filled ahead of releases by warm_showtimes
+MOVIE_DETAIL_CACHE_SECONDS = 300
+
+
+# Request instrumentation (booking/instrumentation.py)
+# Requests slower than this are logged to booking.performance
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", 500))
+# A statement repeated this often within one request is logged as a likely N+1
+N_PLUS_ONE_THRESHOLD = 10
+
+# Sampling profiler (booking/profiling.py); profiles are listed at /admin/profiles/
+PROFILER_DIR = BASE_DIR / "profiles"
+# Profile one in N requests at random; 0 profiles only requests with a token
+PROFILER_SAMPLE_RATE = int(os.environ.get("PROFILER_SAMPLE_RATE", 0))
+PROFILER_INTERVAL = 0.005
+PROFILER_TOKEN_MAX_AGE = 60 * 60
+PROFILER_MAX_FILES = 200
+
+# Metrics (booking/metrics.py), scraped from /metrics
+METRICS_DIR = os.environ.get("METRICS_DIR", BASE_DIR / "metrics")
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+# Points METRICS_DIR at a temporary directory while tests run
+TEST_RUNNER = "cinema_booking.test_runner.TestRunner"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "booking.performance": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
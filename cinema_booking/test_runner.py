@@ -0,0 +1,20 @@
+"""Test runner that keeps test runs out of the real METRICS_DIR."""
+import atexit
+import os
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        directory = tempfile.mkdtemp(prefix='test-metrics-')
+        # Left enabled: the metrics flusher writes a last snapshot at exit
+        override_settings(METRICS_DIR=directory).enable()
+        # Commands run in subprocesses (stress_booking) read it from the environment
+        os.environ['METRICS_DIR'] = directory
+        # Registered before the flusher's atexit hook, so it runs after it
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
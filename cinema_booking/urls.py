@@ -2,8 +2,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from booking import views as booking_views
 
 urlpatterns = [
+    # Staff tools, ahead of the admin's catch-all
+    path('admin/profiles/', booking_views.profile_list, name='profile_list'),
+    path('admin/profiles/<str:name>', booking_views.profile_download, name='profile_download'),
     path('admin/', admin.site.urls),
     path('', include('booking.urls')),
 ]